@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Agent
+from .models import Agent, ChatMessage, Tool
 
 # Register your models here.
 admin.site.register(Agent)
+admin.site.register(Tool)
+admin.site.register(ChatMessage)
@@ -0,0 +1,119 @@
+import functools
+import hashlib
+import inspect
+import json
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.caching import VersionStamp
+
+
+class ToolResultCache:
+    """
+    Per-user cache of agent tool results.
+
+    Results are keyed by tool name, user and arguments, plus the user's
+    generation counter. Bumping the generation on writes makes every cached
+    result for that user unreachable at once; a cache-wide epoch does the
+    same for all users. Storage goes through a Django cache alias: local
+    memory by default, Redis when REDIS_URL is set.
+    """
+
+    def __init__(self, alias: str = 'tools'):
+        self.alias = alias
+        self._hits: Counter = Counter()
+        self._misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def generation(self, user_id: int) -> VersionStamp:
+        return VersionStamp(f'generation:{user_id}', alias=self.alias)
+
+    @property
+    def epoch(self) -> VersionStamp:
+        return VersionStamp('epoch', alias=self.alias)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every cached tool result for a user"""
+        self.generation(user_id).bump()
+
+    def cached(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Decorate a tool function taking user_id so its results are cached"""
+        signature = inspect.signature(func)
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            user_id = arguments.arguments['user_id']
+            digest = hashlib.sha1(
+                json.dumps(arguments.arguments, sort_keys=True, default=str).encode()
+            ).hexdigest()
+            generation = f'{self.epoch.current()}.{self.generation(user_id).current()}'
+            key = f'result:{user_id}:{generation}:{name}:{digest}'
+
+            result = self.cache.get(key)
+            if result is not None:
+                self._record(self._hits, name)
+                return result
+
+            self._record(self._misses, name)
+            result = func(*args, **kwargs)
+            if not _is_error(result):
+                self.cache.set(key, result, timeout=settings.TOOL_CACHE_TIMEOUT)
+            return result
+
+        wrapper.uncached = func
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counts for this process, overall and per tool"""
+        with self._lock:
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+            tools = sorted(set(self._hits) | set(self._misses))
+            return {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'tools': {
+                    tool: {'hits': self._hits[tool], 'misses': self._misses[tool]}
+                    for tool in tools
+                },
+            }
+
+    def clear(self) -> None:
+        """
+        Drop every cached result and reset the counters.
+
+        Results are made unreachable by bumping the epoch and expire on
+        their own; the cache is not flushed, since in Redis the alias shares
+        its database with the default cache and its version stamps.
+        """
+        self.epoch.bump()
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+    def _record(self, counter: Counter, name: str) -> None:
+        with self._lock:
+            counter[name] += 1
+
+
+def _is_error(result: Any) -> bool:
+    if isinstance(result, dict):
+        return 'error' in result
+    if isinstance(result, list):
+        return any(isinstance(item, dict) and 'error' in item for item in result)
+    return False
+
+
+tool_cache = ToolResultCache()
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from typing import Any, Dict, Hashable
+
+from django.conf import settings
+
+from apps.caching import LRUCache
+
+
+class GraphCache:
+    """
+    Process-wide cache of compiled LangGraph agents.
+
+    Graphs are keyed by (agent.pk, agent.updated_at), so any saved change to an
+    Agent produces a new key and the stale graph is dropped on next use. Only
+    one thread builds a given graph at a time; compiled graphs hold no
+    per-conversation state and can be shared between worker threads and the
+    bot event loop.
+    """
+
+    def __init__(self, maxsize: int):
+        self._graphs = LRUCache(maxsize)
+        self._build_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(agent) -> Hashable:
+        return (agent.pk, agent.updated_at)
+
+    def get(self, agent) -> Any:
+        """Return the compiled graph for agent, building it on first use"""
+        if agent.pk is None:
+            return agent.build_graph()
+
+        key = self.key_for(agent)
+        graph = self._graphs.get(key)
+        if graph is not None:
+            return graph
+
+        with self._build_lock(key):
+            graph = self._graphs.get(key)
+            if graph is None:
+                graph = agent.build_graph()
+                self._evict_stale_versions(key)
+                self._graphs.set(key, graph)
+
+        with self._lock:
+            self._build_locks.pop(key, None)
+        return graph
+
+    async def aget(self, agent) -> Any:
+        """Async variant of get() that builds graphs off the event loop"""
+        if agent.pk is not None:
+            graph = self._graphs.get(self.key_for(agent))
+            if graph is not None:
+                return graph
+        return await asyncio.to_thread(self.get, agent)
+
+    def invalidate(self, agent_id: int) -> None:
+        """Drop every cached version of an agent"""
+        for key in self._graphs.keys():
+            if key[0] == agent_id:
+                self._graphs.pop(key)
+
+    def clear(self) -> None:
+        self._graphs.clear()
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def _build_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            return self._build_locks.setdefault(key, threading.Lock())
+
+    def _evict_stale_versions(self, key: Hashable) -> None:
+        for cached_key in self._graphs.keys():
+            if cached_key[0] == key[0] and cached_key != key:
+                self._graphs.pop(cached_key)
+
+
+agent_graphs = GraphCache(maxsize=getattr(settings, 'AGENT_GRAPH_CACHE_SIZE', 32))
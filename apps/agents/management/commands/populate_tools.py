@@ -56,6 +56,14 @@ class Command(BaseCommand):
                         'user_id': {
                             'type': 'integer',
                             'description': 'The ID of the user'
+                        },
+                        'measurements_limit': {
+                            'type': 'integer',
+                            'description': 'Optional cap on the most recent measurements attached to each goal'
+                        },
+                        'days': {
+                            'type': 'integer',
+                            'description': 'Optional window, in days, of measurements attached to each goal'
                         }
                     },
                     'required': ['user_id']
@@ -100,6 +108,73 @@ class Command(BaseCommand):
                     },
                     'required': ['user_id']
                 }
+            },
+            {
+                'name': 'get_measurement_series',
+                'display_name': 'Get Measurement Series',
+                'description': 'Get a metric aggregated into day, week or month buckets with min, max, mean, last and count',
+                'function_name': 'get_measurement_series',
+                'parameters_schema': {
+                    'type': 'object',
+                    'properties': {
+                        'user_id': {
+                            'type': 'integer',
+                            'description': 'The ID of the user'
+                        },
+                        'metric': {
+                            'type': 'string',
+                            'description': 'Metric to aggregate (e.g., \'weight_kg\', \'waist_cm\')'
+                        },
+                        'bucket': {
+                            'type': 'string',
+                            'enum': ['day', 'week', 'month'],
+                            'description': 'Bucket size'
+                        },
+                        'start': {
+                            'type': 'string',
+                            'description': 'Optional ISO start date or datetime'
+                        },
+                        'end': {
+                            'type': 'string',
+                            'description': 'Optional ISO end date or datetime'
+                        },
+                        'points': {
+                            'type': 'integer',
+                            'description': 'Optional maximum number of buckets, downsampled with LTTB'
+                        },
+                        'time_zone': {
+                            'type': 'string',
+                            'description': 'Optional IANA time zone for bucket boundaries (e.g., \'Europe/Kyiv\')'
+                        }
+                    },
+                    'required': ['user_id', 'metric']
+                }
+            },
+            {
+                'name': 'search_ingredients',
+                'display_name': 'Search Ingredients',
+                'description': 'Find ingredients by name, tolerating typos and unfinished words, with nutrients per 100 g',
+                'function_name': 'search_ingredients',
+                'parameters_schema': {
+                    'type': 'object',
+                    'properties': {
+                        'query': {
+                            'type': 'string',
+                            'description': 'Ingredient name or the start of it (e.g., \'chick\', \'brocoli\')'
+                        },
+                        'category_id': {
+                            'type': 'integer',
+                            'description': 'Optional category to search in, subcategories included'
+                        },
+                        'limit': {
+                            'type': 'integer',
+                            'minimum': 1,
+                            'maximum': 50,
+                            'description': 'Maximum number of results'
+                        }
+                    },
+                    'required': ['query']
+                }
             }
         ]
         
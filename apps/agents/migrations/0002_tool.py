@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('display_name', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('function_name', models.CharField(max_length=255)),
+                ('parameters_schema', models.JSONField(blank=True, default=dict)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='config',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
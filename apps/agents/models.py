@@ -1,6 +1,9 @@
-from django.db import models
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models, transaction
 from langgraph.prebuilt import create_react_agent
-from functools import cached_property
+
+from .graphs import agent_graphs
 
 class Agent(models.Model):
     name = models.CharField(max_length=255)
@@ -18,18 +21,17 @@ class Agent(models.Model):
     def __str__(self):
         return self.name
     
-    @cached_property
+    @property
     def graph(self):
-        """Create and cache the LangGraph agent instance"""
-        tools = self.get_tools()
-        return create_react_agent(
-            str(self.model),
-            tools=tools,
-            prompt=str(self.prompt),
-        )
+        """Return the shared compiled LangGraph agent for this version of the agent"""
+        return agent_graphs.get(self)
     
     def create_graph(self):
-        """Create and return a LangGraph agent instance"""
+        """Return the shared compiled LangGraph agent, building it if needed"""
+        return agent_graphs.get(self)
+    
+    def build_graph(self):
+        """Compile a new LangGraph agent instance"""
         tools = self.get_tools()
         return create_react_agent(
             str(self.model),
@@ -89,6 +91,14 @@ class Agent(models.Model):
                             "user_id": {
                                 "type": "integer",
                                 "description": "The ID of the user"
+                            },
+                            "measurements_limit": {
+                                "type": "integer",
+                                "description": "Optional cap on the most recent measurements attached to each goal"
+                            },
+                            "days": {
+                                "type": "integer",
+                                "description": "Optional window, in days, of measurements attached to each goal"
                             }
                         },
                         "required": ["user_id"]
@@ -136,9 +146,248 @@ class Agent(models.Model):
                         "required": ["user_id"]
                     }
                 }
+            },
+            {
+                "type": "function",
+                "function": {
+                    "name": "get_measurement_series",
+                    "description": "Get a metric aggregated into day, week or month buckets with min, max, mean, last and count",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "user_id": {
+                                "type": "integer",
+                                "description": "The ID of the user"
+                            },
+                            "metric": {
+                                "type": "string",
+                                "description": "Metric to aggregate (e.g., 'weight_kg', 'waist_cm')"
+                            },
+                            "bucket": {
+                                "type": "string",
+                                "enum": ["day", "week", "month"],
+                                "description": "Bucket size"
+                            },
+                            "start": {
+                                "type": "string",
+                                "description": "Optional ISO start date or datetime"
+                            },
+                            "end": {
+                                "type": "string",
+                                "description": "Optional ISO end date or datetime"
+                            },
+                            "points": {
+                                "type": "integer",
+                                "description": "Optional maximum number of buckets, downsampled with LTTB"
+                            },
+                            "time_zone": {
+                                "type": "string",
+                                "description": "Optional IANA time zone for bucket boundaries (e.g., 'Europe/Kyiv')"
+                            }
+                        },
+                        "required": ["user_id", "metric"]
+                    }
+                }
+            },
+            {
+                "type": "function",
+                "function": {
+                    "name": "search_ingredients",
+                    "description": "Find ingredients by name, tolerating typos and unfinished words, with nutrients per 100 g",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "Ingredient name or the start of it (e.g., 'chick', 'brocoli')"
+                            },
+                            "category_id": {
+                                "type": "integer",
+                                "description": "Optional category to search in, subcategories included"
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "maximum": 50,
+                                "description": "Maximum number of results"
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                }
             }
         ]
     
     def run(self, input_data):
         """Run the agent with input data"""
         return self.graph.invoke(input_data)
+
+
+class ToolQuerySet(models.QuerySet):
+    """
+    QuerySet that reloads the tool registry after bulk writes.
+
+    bulk_create() and update() bypass post_save, so they bump the registry's
+    version stamp themselves once the write is committed.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .registry import tool_registry
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        transaction.on_commit(tool_registry.invalidate)
+        return objs
+
+    def update(self, **kwargs):
+        from .registry import tool_registry
+
+        updated = super().update(**kwargs)
+        transaction.on_commit(tool_registry.invalidate)
+        return updated
+
+
+class Tool(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    display_name = models.CharField(max_length=255)
+    description = models.TextField()
+    function_name = models.CharField(max_length=255)
+    parameters_schema = models.JSONField(default=dict, blank=True)
+    is_active = models.BooleanField(default=True)  # type: ignore
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ToolQuerySet.as_manager()
+
+    def __str__(self):
+        return self.display_name
+
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token) used for prompt budgeting"""
+    return max(1, len(text) // 4)
+
+
+class ChatMessageQuerySet(models.QuerySet):
+
+    def conversation(self, user_id: int, channel: str) -> models.QuerySet:
+        return self.filter(user_id=user_id, channel=channel)
+
+    def page(self, user_id: int, channel: str, before: int = None, limit: int = 50):
+        """
+        Return one page of a conversation using keyset pagination.
+        
+        Args:
+            user_id: The ID of the user
+            channel: Conversation channel
+            before: Cursor from a previous page; only older messages are returned
+            limit: Maximum number of messages in the page
+            
+        Returns:
+            Tuple of (messages oldest first, cursor for the next older page or None)
+        """
+        messages = self.conversation(user_id, channel)
+        if before is not None:
+            messages = messages.filter(id__lt=before)
+        
+        page = list(messages.order_by('-id')[:limit + 1])
+        next_cursor = page[limit - 1].id if len(page) > limit else None
+        return page[:limit][::-1], next_cursor
+
+    def prompt_window(self, user_id: int, channel: str, max_messages: int = None, max_tokens: int = None):
+        """
+        Return the most recent messages that fit a prompt budget, oldest first.
+        
+        Args:
+            user_id: The ID of the user
+            channel: Conversation channel
+            max_messages: Maximum number of messages
+            max_tokens: Maximum estimated tokens across the returned messages
+            
+        Returns:
+            List of {'role', 'content'} dictionaries ready to send to an agent
+        """
+        max_messages = max_messages or settings.CHAT_PROMPT_MAX_MESSAGES
+        max_tokens = max_tokens or settings.CHAT_PROMPT_MAX_TOKENS
+        
+        recent = (
+            self.conversation(user_id, channel)
+            .order_by('-id')
+            .values_list('role', 'content', 'token_count')[:max_messages]
+        )
+        
+        window = []
+        used = 0
+        for role, content, token_count in recent:
+            used += token_count
+            if used > max_tokens:
+                break
+            window.append({'role': role, 'content': content})
+        return window[::-1]
+
+    def append(self, user_id: int, channel: str, *messages) -> list:
+        """Append (role, content) pairs to a conversation"""
+        return self.bulk_create(self._build(user_id, channel, messages))
+
+    async def aappend(self, user_id: int, channel: str, *messages) -> list:
+        """Async variant of append()"""
+        return await self.abulk_create(self._build(user_id, channel, messages))
+
+    def _build(self, user_id, channel, messages):
+        return [
+            self.model(
+                user_id=user_id,
+                channel=channel,
+                role=role,
+                content=content,
+                token_count=estimate_tokens(content),
+            )
+            for role, content in messages
+        ]
+
+
+class ChatMessage(models.Model):
+    """Append-only chat message, one conversation per user and channel"""
+    CHANNELS = [
+        ('app', 'App'),
+        ('telegram', 'Telegram'),
+    ]
+    ROLES = [
+        ('user', 'User'),
+        ('assistant', 'Assistant'),
+        ('tool', 'Tool'),
+        ('system', 'System'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    channel = models.CharField(max_length=20, choices=CHANNELS)
+    role = models.CharField(max_length=20, choices=ROLES)
+    content = models.TextField()
+    token_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ChatMessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'channel', '-id'], name='agents_chat_conversation_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.token_count:
+            self.token_count = estimate_tokens(self.content)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user_id} [{self.channel}] {self.role}: {self.content[:50]}"  # type: ignore
+
+    def to_dict(self) -> dict:
+        """Convert chat message to dictionary for API responses"""
+        return {
+            'id': self.id,  # type: ignore
+            'channel': self.channel,
+            'role': self.role,
+            'content': self.content,
+            'created_at': self.created_at.isoformat()  # type: ignore
+        }
\ No newline at end of file
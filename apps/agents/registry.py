@@ -0,0 +1,194 @@
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from apps.caching import VersionStamp
+
+from .tools import (
+    get_user_goals,
+    get_user_body_measurements,
+    get_user_progress_summary,
+    search_goals_by_type,
+    get_latest_measurements,
+    get_measurement_series,
+    search_ingredients
+)
+
+# Functions a Tool row may point at through its function_name
+TOOL_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    'get_user_goals': get_user_goals,
+    'get_user_body_measurements': get_user_body_measurements,
+    'get_user_progress_summary': get_user_progress_summary,
+    'search_goals_by_type': search_goals_by_type,
+    'get_latest_measurements': get_latest_measurements,
+    'get_measurement_series': get_measurement_series,
+    'search_ingredients': search_ingredients,
+}
+
+Validator = Callable[[Any, str], List[str]]
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'string': lambda value: isinstance(value, str),
+    'boolean': lambda value: isinstance(value, bool),
+    'array': lambda value: isinstance(value, list),
+    'object': lambda value: isinstance(value, dict),
+    'null': lambda value: value is None,
+}
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """
+    Compile a JSON schema into a validator function.
+
+    Supports the subset used by tool parameter schemas: type, properties,
+    required, additionalProperties, items, enum, minimum and maximum. Unlike
+    plain JSON Schema, objects reject unknown properties unless
+    additionalProperties is true, since tools are called with keyword arguments.
+
+    Args:
+        schema: The JSON schema to compile
+
+    Returns:
+        Function taking a value and a path, returning a list of error messages
+    """
+    checks: List[Validator] = []
+
+    types = schema.get('type')
+    if types:
+        names = [types] if isinstance(types, str) else list(types)
+        type_checks = [_TYPE_CHECKS[name] for name in names if name in _TYPE_CHECKS]
+        expected = ' or '.join(names)
+
+        def check_type(value, path):
+            if any(type_check(value) for type_check in type_checks):
+                return []
+            return [f'{path}: expected {expected}, got {type(value).__name__}']
+        checks.append(check_type)
+
+    if 'enum' in schema:
+        allowed = list(schema['enum'])
+
+        def check_enum(value, path):
+            return [] if value in allowed else [f'{path}: must be one of {allowed}']
+        checks.append(check_enum)
+
+    if 'minimum' in schema or 'maximum' in schema:
+        minimum = schema.get('minimum')
+        maximum = schema.get('maximum')
+
+        def check_range(value, path):
+            if not _TYPE_CHECKS['number'](value):
+                return []
+            if minimum is not None and value < minimum:
+                return [f'{path}: must be >= {minimum}']
+            if maximum is not None and value > maximum:
+                return [f'{path}: must be <= {maximum}']
+            return []
+        checks.append(check_range)
+
+    if 'properties' in schema or 'required' in schema:
+        properties = {
+            name: compile_schema(subschema)
+            for name, subschema in schema.get('properties', {}).items()
+        }
+        required = list(schema.get('required', []))
+        allow_additional = schema.get('additionalProperties', False) is not False
+
+        def check_properties(value, path):
+            if not isinstance(value, dict):
+                return []
+            errors = [f'{path}.{name}: is required' for name in required if name not in value]
+            for name, item in value.items():
+                validate = properties.get(name)
+                if validate is not None:
+                    errors.extend(validate(item, f'{path}.{name}'))
+                elif not allow_additional:
+                    errors.append(f'{path}.{name}: unexpected argument')
+            return errors
+        checks.append(check_properties)
+
+    if 'items' in schema:
+        validate_item = compile_schema(schema['items'])
+
+        def check_items(value, path):
+            if not isinstance(value, list):
+                return []
+            errors = []
+            for index, item in enumerate(value):
+                errors.extend(validate_item(item, f'{path}[{index}]'))
+            return errors
+        checks.append(check_items)
+
+    def validate(value, path='$'):
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+        return errors
+
+    return validate
+
+
+class RegisteredTool(NamedTuple):
+    name: str
+    display_name: str
+    function_name: str
+    function: Optional[Callable[..., Any]]
+    validate: Validator
+
+
+class ToolRegistry:
+    """
+    Process-wide, in-memory view of the active Tool rows.
+
+    Rows are loaded once, their parameter schemas compiled and their function
+    names resolved. The registry reloads only when the shared version stamp
+    changes, which happens once a save, delete or bulk write of Tool rows
+    is committed.
+    """
+
+    def __init__(self, functions: Dict[str, Callable[..., Any]]):
+        self.functions = functions
+        self.version_stamp = VersionStamp('agents:tool_registry:version')
+        self._tools: Dict[str, RegisteredTool] = {}
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[RegisteredTool]:
+        """Return the active tool registered under name, if any"""
+        version = self.version_stamp.current()
+        if version != self._version:
+            self._load(version)
+        return self._tools.get(name)
+
+    def all(self) -> List[RegisteredTool]:
+        """Return every active tool"""
+        version = self.version_stamp.current()
+        if version != self._version:
+            self._load(version)
+        return list(self._tools.values())
+
+    def invalidate(self) -> None:
+        """Force every process to reload the registry on next use"""
+        self.version_stamp.bump()
+
+    def _load(self, version: int) -> None:
+        from .models import Tool
+
+        with self._lock:
+            if self._version == version:
+                return
+            self._tools = {
+                tool.name: RegisteredTool(
+                    name=tool.name,
+                    display_name=tool.display_name,
+                    function_name=tool.function_name,
+                    function=self.functions.get(tool.function_name),
+                    validate=compile_schema(tool.parameters_schema or {}),
+                )
+                for tool in Tool.objects.filter(is_active=True)
+            }
+            self._version = version
+
+
+tool_registry = ToolRegistry(TOOL_FUNCTIONS)
@@ -1,13 +1,24 @@
+from operator import itemgetter
 from typing import Dict, Any, List
 
+from django.core.exceptions import ValidationError
+
+from goals.analytics import analyze_rows
+from goals.models import Goal, BodyMeasurement, LatestMeasurement
+from goals.serializers import GOAL_FIELDS, MEASUREMENT_FIELDS, goal_dicts, measurement_dicts
 from .tools import (
     get_user_goals,
     get_user_body_measurements,
     get_user_progress_summary,
     search_goals_by_type,
-    get_latest_measurements
+    get_latest_measurements,
+    get_measurement_series,
+    search_ingredients
 )
-# from .models import Tool
+from .registry import tool_registry
+
+# Columns analyze_rows expects after the key of each row
+ANALYZED_FIELDS = ('metric', 'measurement_type', 'value', 'timestamp')
 
 
 class AgentService:
@@ -25,27 +36,24 @@ class AgentService:
         Returns:
             Dictionary containing the tool execution result
         """
-        # First try to get the tool from database
-        try:
-            tool = Tool.objects.get(name=tool_name, is_active=True)
-            function_name = tool.function_name
-        except Tool.DoesNotExist:
+        tool = tool_registry.get(tool_name)
+        if tool is None:
             return {'error': f'Tool not found in database: {tool_name}'}
         
-        # Map function names to actual functions
-        tool_mapping = {
-            'get_user_goals': get_user_goals,
-            'get_user_body_measurements': get_user_body_measurements,
-            'get_user_progress_summary': get_user_progress_summary,
-            'search_goals_by_type': search_goals_by_type,
-            'get_latest_measurements': get_latest_measurements,
-        }
+        if tool.function is None:
+            return {'error': f'Unknown function: {tool.function_name}'}
         
-        if function_name not in tool_mapping:
-            return {'error': f'Unknown function: {function_name}'}
+        errors = tool.validate(kwargs)
+        if errors:
+            return {
+                'success': False,
+                'error': f'Invalid arguments: {"; ".join(errors)}',
+                'tool': tool_name,
+                'tool_display_name': tool.display_name
+            }
         
         try:
-            result = tool_mapping[function_name](**kwargs)
+            result = tool.function(**kwargs)
             return {
                 'success': True,
                 'data': result,
@@ -66,9 +74,9 @@ class AgentService:
         return get_user_goals(user_id)
     
     @staticmethod
-    def get_user_progress(user_id: int) -> Dict[str, Any]:
+    def get_user_progress(user_id: int, measurements_limit: int = None, days: int = None) -> Dict[str, Any]:
         """Get comprehensive user progress"""
-        return get_user_progress_summary(user_id)
+        return get_user_progress_summary(user_id, measurements_limit, days)
     
     @staticmethod
     def get_user_measurements(user_id: int, goal_id: str = None) -> List[Dict[str, Any]]:
@@ -84,6 +92,16 @@ class AgentService:
     def get_latest_user_measurements(user_id: int, metric: str = None) -> List[Dict[str, Any]]:
         """Get latest user measurements"""
         return get_latest_measurements(user_id, metric)
+    
+    @staticmethod
+    def get_measurement_series(user_id: int, metric: str, bucket: str = 'day', **kwargs) -> Dict[str, Any]:
+        """Get a bucketed series of user measurements"""
+        return get_measurement_series(user_id, metric, bucket, **kwargs)
+    
+    @staticmethod
+    def search_ingredients(query: str, category_id: int = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Autocomplete ingredient names"""
+        return search_ingredients(query, category_id, limit)
 
 
 class GoalAnalysisService:
@@ -101,69 +119,92 @@ class GoalAnalysisService:
         Returns:
             Analysis results
         """
-        # Get goal details
-        goals = get_user_goals(user_id)
-        goal = next((g for g in goals if g['id'] == goal_id), None)
-        
-        if not goal:
+        try:
+            goal = Goal.objects.get(pk=goal_id, user_id=user_id, is_active=True)
+        except (Goal.DoesNotExist, ValidationError):
             return {'error': 'Goal not found'}
         
-        # Get measurements for this goal
-        measurements = get_user_body_measurements(user_id, goal_id)
-        
-        # Analyze progress
-        analysis = {
-            'goal': goal,
+        rows = list(
+            BodyMeasurement.objects.filter(user_id=user_id, goal=goal)
+            .order_by('timestamp')
+            .values_list(*MEASUREMENT_FIELDS)
+        )
+        # The same rows feed measurement_dicts, so the analysis picks its columns by name
+        analyzed = itemgetter(*(MEASUREMENT_FIELDS.index(field) for field in ANALYZED_FIELDS))
+        analyses = analyze_rows((goal.pk, *analyzed(row)) for row in rows)
+        goal_data = goal.to_dict()
+        measurements = measurement_dicts(rows)
+        
+        return {
+            'goal': goal_data,
             'measurements': measurements,
-            'progress_analysis': GoalAnalysisService._analyze_measurements(measurements),
-            'recommendations': GoalAnalysisService._generate_recommendations(goal, measurements)
+            'progress_analysis': GoalAnalysisService._progress_analysis(analyses.get(goal.pk)),
+            'recommendations': GoalAnalysisService._generate_recommendations(goal_data, measurements)
         }
-        
-        return analysis
     
     @staticmethod
-    def _analyze_measurements(measurements: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Analyze measurement data"""
-        if not measurements:
-            return {'status': 'no_data', 'message': 'No measurements available'}
+    def analyze_goals(user_id: int, goal_ids: List[str] = None) -> Dict[str, Any]:
+        """
+        Analyze progress for many goals at once
+        
+        Fetches the goals and all of their measurements in two queries and
+        analyzes every goal's series in one vectorized pass.
         
-        # Group by metric
-        metrics_data = {}
-        for measurement in measurements:
-            metric = measurement['metric']
-            if metric not in metrics_data:
-                metrics_data[metric] = []
-            metrics_data[metric].append(measurement)
-        
-        analysis = {}
-        for metric, data in metrics_data.items():
-            # Sort by timestamp
-            sorted_data = sorted(data, key=lambda x: x['timestamp'])
+        Args:
+            user_id: User ID
+            goal_ids: Optional goal IDs to restrict the analysis to; defaults
+                to all active goals
             
-            if len(sorted_data) >= 2:
-                first = sorted_data[0]
-                latest = sorted_data[-1]
-                
-                change = latest['value'] - first['value']
-                change_percent = (change / first['value']) * 100 if first['value'] != 0 else 0
-                
-                analysis[metric] = {
-                    'baseline': first['value'],
-                    'current': latest['value'],
-                    'change': change,
-                    'change_percent': change_percent,
-                    'trend': 'improving' if change > 0 else 'declining' if change < 0 else 'stable'
-                }
-            else:
-                analysis[metric] = {
-                    'current': data[0]['value'],
-                    'status': 'single_measurement'
-                }
+        Returns:
+            Mapping of goal ID to its goal details, progress analysis and
+            recommendations
+        """
+        goals = Goal.objects.filter(user_id=user_id, is_active=True)
+        if goal_ids is not None:
+            try:
+                goals = goals.filter(pk__in=goal_ids)
+            except ValidationError:
+                return {'error': 'Goal not found'}
+        goal_rows = list(goals.values_list(*GOAL_FIELDS))
+        
+        rows = BodyMeasurement.objects.filter(
+            user_id=user_id, goal_id__in=[row[0] for row in goal_rows]
+        ).values_list('goal_id', *ANALYZED_FIELDS)
+        analyses = analyze_rows(rows)
+        
+        results = {}
+        for goal_row, goal_data in zip(goal_rows, goal_dicts(goal_rows)):
+            results[goal_data['id']] = {
+                'goal': goal_data,
+                'progress_analysis': GoalAnalysisService._progress_analysis(analyses.get(goal_row[0])),
+                'recommendations': GoalAnalysisService._generate_recommendations(goal_data, [])
+            }
+        return results
+    
+    @staticmethod
+    def get_latest_values(user_id: int, metric: str = None) -> Dict[str, float]:
+        """
+        Get the most recent value of each metric for a user
         
+        Args:
+            user_id: User ID
+            metric: Optional metric to restrict the lookup to
+            
+        Returns:
+            Mapping of metric to its latest value
+        """
+        latest = LatestMeasurement.objects.for_user(user_id, metric)
+        return dict(latest.values_list('metric', 'measurement__value'))
+    
+    @staticmethod
+    def _progress_analysis(analysis: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Per-metric analysis, or a no-data marker when there is nothing to analyze"""
+        if not analysis:
+            return {'status': 'no_data', 'message': 'No measurements available'}
         return analysis
     
     @staticmethod
-    def _generate_recommendations(goal: Dict[str, Any], measurements: List[Dict[str, Any]]) -> List[str]:
+    def _generate_recommendations(goal: Dict[str, Any], measurements: List[Any]) -> List[str]:
         """Generate recommendations based on goal and measurements"""
         recommendations = []
         
@@ -0,0 +1,38 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from goals.signals import measurements_changed
+
+from .cache import tool_cache
+from .graphs import agent_graphs
+from .registry import tool_registry
+
+
+@receiver(post_save, sender='agents.Tool')
+@receiver(post_delete, sender='agents.Tool')
+def tool_changed(sender, **kwargs):
+    """Reload the tool registry once an added, edited or removed Tool is committed"""
+    transaction.on_commit(tool_registry.invalidate)
+
+
+@receiver(post_delete, sender='agents.Agent')
+def agent_deleted(sender, instance, **kwargs):
+    """Release the compiled graphs of a deleted agent"""
+    agent_graphs.invalidate(instance.pk)
+
+
+@receiver(post_save, sender='goals.Goal')
+@receiver(post_delete, sender='goals.Goal')
+def goal_changed(sender, instance, **kwargs):
+    """Drop cached tool results of the goal's owner once the write is committed"""
+    transaction.on_commit(partial(tool_cache.invalidate_user, instance.user_id))
+
+
+@receiver(measurements_changed)
+def measurements_written(sender, pairs, **kwargs):
+    """Drop cached tool results of users whose measurements changed, once the write is committed"""
+    for user_id in {user_id for user_id, _ in pairs}:
+        transaction.on_commit(partial(tool_cache.invalidate_user, user_id))
@@ -0,0 +1,100 @@
+import asyncio
+import json
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+SSE_CONTENT_TYPE = 'text/event-stream'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+async def stream_chat_events(
+    graph, messages: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Drive a LangGraph agent and yield chat events as they are produced.
+
+    Events are dictionaries with an ``event`` key:
+    ``token`` for model output text, ``tool_call`` when the model requests a
+    tool, ``tool_result`` when a tool returns, and a final ``done`` carrying the
+    full response text. The underlying graph stream is closed when the consumer
+    stops iterating, e.g. after a client disconnect.
+
+    Args:
+        graph: Compiled LangGraph agent
+        messages: Conversation messages to send to the agent
+        config: Optional run config, e.g. values for the tools in configurable
+
+    Yields:
+        Chat event dictionaries
+    """
+    response = []
+    stream = graph.astream({'messages': messages}, config, stream_mode=['messages', 'updates'])
+    async with aclosing(stream):
+        async for mode, payload in stream:
+            if mode == 'messages':
+                chunk, _ = payload
+                if isinstance(chunk, AIMessageChunk) and isinstance(chunk.content, str) and chunk.content:
+                    response.append(chunk.content)
+                    yield {'event': 'token', 'content': chunk.content}
+                continue
+
+            for update in payload.values():
+                for message in (update or {}).get('messages', []):
+                    if isinstance(message, AIMessage):
+                        for tool_call in message.tool_calls:
+                            yield {
+                                'event': 'tool_call',
+                                'id': tool_call['id'],
+                                'name': tool_call['name'],
+                                'args': tool_call['args'],
+                            }
+                    elif isinstance(message, ToolMessage):
+                        yield {
+                            'event': 'tool_result',
+                            'id': message.tool_call_id,
+                            'name': message.name,
+                            'content': message.content,
+                        }
+
+    yield {'event': 'done', 'response': ''.join(response)}
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Encode an event as a Server-Sent Events frame"""
+    data = json.dumps({key: value for key, value in event.items() if key != 'event'}, cls=DjangoJSONEncoder)
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+
+def format_ndjson(event: Dict[str, Any]) -> str:
+    """Encode an event as a newline-delimited JSON line"""
+    return json.dumps(event, cls=DjangoJSONEncoder) + '\n'
+
+
+class ClosingStream:
+    """
+    Async iterable for StreamingHttpResponse that closes its source on close().
+
+    On client disconnect Django's ASGI handler only closes the response's own
+    wrapper generator and then calls response.close() from a worker thread, so
+    the wrapped generator, and the agent run it drives, would be left suspended.
+    close() schedules aclose() of the source on the loop that iterated it.
+    """
+
+    def __init__(self, source: AsyncIterator[Any]):
+        self.source = source
+        self.loop = None
+
+    def __aiter__(self):
+        self.loop = asyncio.get_running_loop()
+        return self
+
+    async def __anext__(self):
+        return await self.source.__anext__()
+
+    def close(self) -> None:
+        if self.loop is None or self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.source.aclose(), self.loop)
@@ -1,3 +1,677 @@
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.urls import reverse
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from django.core.cache import caches
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from goals.models import Goal, BodyMeasurement, LatestMeasurement
+from meals.models import Ingredient
+from meals.search import ingredient_index
+from .cache import tool_cache
+from .graphs import GraphCache
+from .models import Agent, ChatMessage, Tool
+from .registry import compile_schema, tool_registry
+from .services import AgentService, GoalAnalysisService
+from .tools import (
+    get_latest_measurements,
+    get_measurement_series,
+    get_user_body_measurements,
+    get_user_goals,
+    get_user_progress_summary,
+    search_goals_by_type,
+    search_ingredients,
+)
+
+
+class UserProgressSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='summary-user')
+        cls.now = timezone.now()
+        cls.goals = [
+            Goal.objects.create(user=cls.user, goal_type='weight_loss'),
+            Goal.objects.create(user=cls.user, goal_type='strength'),
+            Goal.objects.create(user=cls.user, goal_type='endurance'),
+        ]
+        Goal.objects.create(user=cls.user, goal_type='flexibility', is_active=False)
+        # A minute apart per goal, as a user has one point per metric and instant
+        for minutes, goal in enumerate(cls.goals):
+            for days_ago in range(5):
+                BodyMeasurement.objects.create(
+                    user=cls.user,
+                    goal=goal,
+                    metric='weight_kg',
+                    measurement_type='log',
+                    value=80 - days_ago,
+                    timestamp=cls.now - timedelta(days=days_ago, minutes=minutes),
+                )
+
+    def setUp(self):
+        tool_cache.clear()
+
+    def test_query_count_does_not_depend_on_goal_count(self):
+        with self.assertNumQueries(3):
+            summary = get_user_progress_summary(self.user.id)
+
+        self.assertEqual(summary['total_active_goals'], 3)
+        for goal_data in summary['goals']:
+            self.assertEqual(len(goal_data['measurements']), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                Goal.objects.create(user=self.user, goal_type='muscle_gain')
+
+        with self.assertNumQueries(3):
+            summary = get_user_progress_summary(self.user.id)
+
+        self.assertEqual(summary['total_active_goals'], 8)
+
+    def test_measurements_are_grouped_by_goal_in_chronological_order(self):
+        summary = get_user_progress_summary(self.user.id)
+
+        for goal_data in summary['goals']:
+            self.assertTrue(all(m['goal_id'] == goal_data['id'] for m in goal_data['measurements']))
+            timestamps = [m['timestamp'] for m in goal_data['measurements']]
+            self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_measurements_limit_keeps_most_recent_per_goal(self):
+        with self.assertNumQueries(3):
+            summary = get_user_progress_summary(self.user.id, measurements_limit=2)
+
+        for minutes, goal in enumerate(self.goals):
+            goal_data = next(goal_data for goal_data in summary['goals'] if goal_data['id'] == str(goal.id))
+            newest = self.now - timedelta(minutes=minutes)
+            latest = [(newest - timedelta(days=1)).isoformat(), newest.isoformat()]
+            self.assertEqual([m['timestamp'] for m in goal_data['measurements']], latest)
+
+    def test_days_window(self):
+        summary = get_user_progress_summary(self.user.id, days=2)
+
+        for goal_data in summary['goals']:
+            self.assertEqual(len(goal_data['measurements']), 2)
+
+    def test_unknown_user(self):
+        self.assertIn('error', get_user_progress_summary(999999))
+
+
+class ToolRegistryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='registry-user')
+        Goal.objects.create(user=cls.user, goal_type='strength')
+        cls.tool = Tool.objects.create(
+            name='goals',
+            display_name='Goals',
+            description='Get all active goals for a specific user',
+            function_name='get_user_goals',
+            parameters_schema={
+                'type': 'object',
+                'properties': {'user_id': {'type': 'integer'}},
+                'required': ['user_id'],
+            },
+        )
+
+    def setUp(self):
+        tool_registry.invalidate()
+        tool_cache.clear()
+
+    def test_dispatch_needs_no_queries_once_loaded(self):
+        AgentService.execute_tool('goals', user_id=self.user.id)
+
+        # The registry is loaded and the result is served from the tool cache.
+        with self.assertNumQueries(0):
+            result = AgentService.execute_tool('goals', user_id=self.user.id)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['tool_display_name'], 'Goals')
+        self.assertEqual(len(result['data']), 1)
+
+    def test_saving_a_tool_invalidates_the_registry(self):
+        self.assertEqual(tool_registry.get('goals').display_name, 'Goals')
+
+        self.tool.display_name = 'User Goals'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tool.save()
+            # Other processes keep the committed registry until the commit.
+            self.assertEqual(tool_registry.get('goals').display_name, 'Goals')
+        self.assertEqual(tool_registry.get('goals').display_name, 'User Goals')
+
+        self.tool.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tool.save()
+        self.assertIsNone(tool_registry.get('goals'))
+        self.assertIn('error', AgentService.execute_tool('goals', user_id=self.user.id))
+
+    def test_bulk_writes_invalidate_the_registry(self):
+        self.assertIsNotNone(tool_registry.get('goals'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tool.objects.filter(name='goals').update(is_active=False)
+        self.assertIsNone(tool_registry.get('goals'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tool.objects.bulk_create([Tool(
+                name='latest',
+                display_name='Latest',
+                description='Latest measurements',
+                function_name='get_latest_measurements',
+            )])
+        self.assertEqual(tool_registry.get('latest').display_name, 'Latest')
+
+    def test_arguments_are_validated_before_dispatch(self):
+        tool_registry.get('goals')
+        with self.assertNumQueries(0):
+            result = AgentService.execute_tool('goals', user_id='1', extra=True)
+
+        self.assertFalse(result['success'])
+        self.assertIn('$.user_id: expected integer', result['error'])
+        self.assertIn('$.extra: unexpected argument', result['error'])
+
+    def test_compile_schema(self):
+        validate = compile_schema({
+            'type': 'object',
+            'properties': {
+                'metric': {'type': 'string', 'enum': ['weight_kg', 'waist_cm']},
+                'limit': {'type': 'integer', 'minimum': 1},
+                'tags': {'type': 'array', 'items': {'type': 'string'}},
+            },
+            'required': ['metric'],
+        })
+
+        self.assertEqual(validate({'metric': 'weight_kg', 'limit': 5, 'tags': ['a']}), [])
+        self.assertEqual(validate({}), ['$.metric: is required'])
+        self.assertEqual(
+            validate({'metric': 'hip_cm', 'limit': 0, 'tags': [1]}),
+            [
+                "$.metric: must be one of ['weight_kg', 'waist_cm']",
+                '$.limit: must be >= 1',
+                '$.tags[0]: expected string, got int',
+            ],
+        )
+        self.assertEqual(validate({'metric': 'weight_kg', 'limit': True}), ['$.limit: expected integer, got bool'])
+
+
+class IngredientSearchToolTests(TestCase):
+    def setUp(self):
+        ingredient_index.clear()
+        Ingredient.objects.create(name='Oat flakes', proteins=13, fats=7, carbs=68, calories=380, fibers=10, sugars=1)
+
+    def test_results_carry_nutrients(self):
+        results = search_ingredients('oat flaks')
+
+        self.assertEqual(results[0]['name'], 'Oat flakes')
+        self.assertEqual(results[0]['match'], 'fuzzy')
+        self.assertEqual(results[0]['per_100g']['calories'], 380)
+        self.assertEqual(search_ingredients('zzz'), [])
+
+
+class ToolResultCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cache-user')
+        cls.other = User.objects.create_user(username='cache-other')
+        cls.goal = Goal.objects.create(user=cls.user, goal_type='weight_loss')
+        Goal.objects.create(user=cls.other, goal_type='strength')
+
+    def setUp(self):
+        tool_cache.clear()
+
+    def test_results_are_cached_per_user_and_arguments(self):
+        get_user_goals(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(get_user_goals(user_id=self.user.id)), 1)
+        with self.assertNumQueries(2):
+            get_user_goals(self.other.id)
+
+        stats = tool_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertEqual(stats['tools']['get_user_goals'], {'hits': 1, 'misses': 2})
+
+    def test_goal_writes_invalidate_only_the_owner(self):
+        get_user_goals(self.user.id)
+        get_user_goals(self.other.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Goal.objects.create(user=self.user, goal_type='strength')
+            # Until the write commits, other readers keep the cached result
+            self.assertEqual(len(get_user_goals(self.user.id)), 1)
+        self.assertEqual(len(get_user_goals(self.user.id)), 2)
+        with self.assertNumQueries(0):
+            get_user_goals(self.other.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.goal.delete()
+        self.assertEqual(len(get_user_goals(self.user.id)), 1)
+
+    def test_measurement_writes_invalidate(self):
+        self.assertEqual(get_latest_measurements(self.user.id), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BodyMeasurement.objects.bulk_create([
+                BodyMeasurement(user=self.user, goal=self.goal, metric='weight_kg',
+                                measurement_type='log', value=80, timestamp=timezone.now()),
+            ])
+        self.assertEqual(len(get_latest_measurements(self.user.id)), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BodyMeasurement.objects.filter(user=self.user).delete()
+        self.assertEqual(get_latest_measurements(self.user.id), [])
+
+    def test_clear_keeps_other_cache_entries(self):
+        get_user_goals(self.user.id)
+        caches['tools'].set('unrelated', 1)
+
+        tool_cache.clear()
+
+        self.assertEqual(caches['tools'].get('unrelated'), 1)
+        with self.assertNumQueries(2):
+            get_user_goals(self.user.id)
+
+    def test_errors_are_not_cached(self):
+        self.assertIn('error', get_user_progress_summary(999999))
+        self.assertEqual(tool_cache.stats()['misses'], 1)
+        get_user_progress_summary(999999)
+        self.assertEqual(tool_cache.stats()['misses'], 2)
+
+
+class GraphCacheTests(TestCase):
+    def setUp(self):
+        self.agent = Agent.objects.create(
+            name='coach', description='Coach', prompt='You are a coach', model='openai:gpt-4o-mini'
+        )
+        self.graphs = GraphCache(maxsize=2)
+        patcher = mock.patch.object(Agent, 'build_graph', autospec=True, side_effect=lambda agent: object())
+        self.build_graph = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_graph_is_shared_between_loaded_instances(self):
+        first = self.graphs.get(Agent.objects.get(pk=self.agent.pk))
+        second = self.graphs.get(Agent.objects.get(pk=self.agent.pk))
+
+        self.assertIs(first, second)
+        self.assertEqual(self.build_graph.call_count, 1)
+
+    def test_updated_agent_gets_a_new_graph(self):
+        before = self.graphs.get(self.agent)
+
+        self.agent.prompt = 'You are a nutritionist'
+        self.agent.save()
+        after = self.graphs.get(Agent.objects.get(pk=self.agent.pk))
+
+        self.assertIsNot(before, after)
+        self.assertEqual(len(self.graphs), 1)
+
+    def test_least_recently_used_graph_is_evicted(self):
+        others = [
+            Agent.objects.create(name=name, description=name, prompt=name, model='openai:gpt-4o-mini')
+            for name in ('a', 'b')
+        ]
+        self.graphs.get(self.agent)
+        self.graphs.get(others[0])
+        self.graphs.get(self.agent)
+        self.graphs.get(others[1])
+
+        self.assertEqual(len(self.graphs), 2)
+        self.graphs.get(self.agent)
+        self.assertEqual(self.build_graph.call_count, 3)
+
+
+class FakeStreamingGraph:
+    """Stands in for a compiled graph, replaying a fixed astream() output"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.closed = False
+
+    async def astream(self, inputs, config=None, stream_mode=None):
+        try:
+            for output in self.outputs:
+                yield output
+        finally:
+            self.closed = True
+
+
+class ChatStreamEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stream-user')
+        Agent.objects.create(name='coach', description='Coach', prompt='You are a coach', model='openai:gpt-4o-mini')
+        tool_call = {'id': 'call-1', 'name': 'get_user_goals', 'args': {'user_id': 1}}
+        self.graph = FakeStreamingGraph([
+            ('updates', {'agent': {'messages': [AIMessage(content='', tool_calls=[tool_call])]}}),
+            ('updates', {'tools': {'messages': [ToolMessage(content='[]', tool_call_id='call-1', name='get_user_goals')]}}),
+            ('messages', (AIMessageChunk(content='You have '), {})),
+            ('messages', (AIMessageChunk(content='no goals.'), {})),
+        ])
+        patcher = mock.patch('agents.views.agent_graphs.aget', new=mock.AsyncMock(return_value=self.graph))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_streams_server_sent_events(self):
+        response = await self.async_client.post(
+            reverse('chat_stream_endpoint'), {'message': 'goals?', 'user_id': self.user.id}, content_type='application/json'
+        )
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = [frame.split('\n')[0] for frame in body.strip().split('\n\n')]
+        self.assertEqual(
+            events,
+            ['event: tool_call', 'event: tool_result', 'event: token', 'event: token', 'event: done'],
+        )
+        self.assertIn('data: {"response": "You have no goals."}', body)
+        history = await sync_to_async(ChatMessage.objects.prompt_window)(self.user.id, 'app')
+        self.assertEqual(
+            history,
+            [{'role': 'user', 'content': 'goals?'}, {'role': 'assistant', 'content': 'You have no goals.'}],
+        )
+
+    async def test_streams_ndjson(self):
+        response = await self.async_client.post(
+            reverse('chat_stream_endpoint'),
+            {'message': 'goals?', 'user_id': self.user.id},
+            content_type='application/json',
+            headers={'Accept': 'application/x-ndjson'},
+        )
+
+        lines = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual(lines[0]['name'], 'get_user_goals')
+        self.assertEqual(lines[-1], {'event': 'done', 'response': 'You have no goals.'})
+
+    async def test_disconnect_closes_the_agent_stream(self):
+        response = await self.async_client.post(
+            reverse('chat_stream_endpoint'), {'message': 'goals?', 'user_id': self.user.id}, content_type='application/json'
+        )
+
+        # Mirror Django's ASGI handler: close the wrapper, then the response.
+        content = aiter(response.streaming_content)
+        await anext(content)
+        await content.aclose()
+        self.assertFalse(self.graph.closed)
+
+        await sync_to_async(response.close)()
+        await asyncio.sleep(0)
+
+        self.assertTrue(self.graph.closed)
+
+    async def test_unknown_agent(self):
+        response = await self.async_client.post(
+            reverse('chat_stream_endpoint'), {'message': 'hi', 'agent_id': 999}, content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ChatHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='history-user')
+        for index in range(7):
+            ChatMessage.objects.append(
+                cls.user.id, 'app', ('user', f'question {index}'), ('assistant', f'answer {index}')
+            )
+        ChatMessage.objects.append(cls.user.id, 'telegram', ('user', 'from telegram'))
+
+    def test_keyset_pagination_walks_back_through_history(self):
+        url = reverse('chat_history', args=[self.user.id])
+
+        pages = []
+        cursor = None
+        while True:
+            params = {'limit': 5}
+            if cursor:
+                params['before'] = cursor
+            data = self.client.get(url, params).json()
+            pages.append([message['content'] for message in data['messages']])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual([len(page) for page in pages], [5, 5, 4])
+        self.assertEqual(pages[0][-1], 'answer 6')
+        self.assertEqual(pages[-1][0], 'question 0')
+        flattened = [content for page in reversed(pages) for content in page]
+        self.assertEqual(len(set(flattened)), 14)
+
+    def test_page_query_does_not_use_offset(self):
+        with CaptureQueriesContext(connection) as queries:
+            ChatMessage.objects.page(self.user.id, 'app', before=10, limit=5)
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_prompt_window_respects_message_and_token_budgets(self):
+        window = ChatMessage.objects.prompt_window(self.user.id, 'app', max_messages=4, max_tokens=1000)
+        self.assertEqual(
+            [message['content'] for message in window],
+            ['question 5', 'answer 5', 'question 6', 'answer 6'],
+        )
+        self.assertEqual(window[0], {'role': 'user', 'content': 'question 5'})
+
+        window = ChatMessage.objects.prompt_window(self.user.id, 'app', max_messages=10, max_tokens=4)
+        self.assertEqual([message['content'] for message in window], ['question 6', 'answer 6'])
+
+    def test_chat_endpoint_appends_to_history(self):
+        self.client.post(
+            reverse('chat_endpoint'), {'message': 'hello', 'user_id': self.user.id}, content_type='application/json'
+        )
+
+        window = ChatMessage.objects.prompt_window(self.user.id, 'app', max_messages=2)
+        self.assertEqual([message['role'] for message in window], ['user', 'assistant'])
+        self.assertEqual(window[0]['content'], 'hello')
+
+
+class GoalAnalysisServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analysis-user')
+        now = timezone.now()
+        cls.goals = [
+            Goal.objects.create(user=cls.user, goal_type=goal_type)
+            for goal_type in ('weight_loss', 'muscle_gain', 'endurance')
+        ]
+        for minutes, goal in enumerate(cls.goals):
+            for days_ago in range(3):
+                BodyMeasurement.objects.create(
+                    user=cls.user,
+                    goal=goal,
+                    metric='weight_kg',
+                    measurement_type='log',
+                    value=80 + days_ago,
+                    timestamp=now - timedelta(days=days_ago, minutes=minutes),
+                )
+
+    def test_analyze_goal_progress_fetches_goal_by_key(self):
+        goal = self.goals[0]
+
+        with self.assertNumQueries(2):
+            analysis = GoalAnalysisService.analyze_goal_progress(self.user.id, str(goal.id))
+
+        self.assertEqual(analysis['goal']['id'], str(goal.id))
+        self.assertEqual(len(analysis['measurements']), 3)
+        self.assertEqual(analysis['progress_analysis']['weight_kg']['trend'], 'declining')
+
+    def test_analyze_goal_progress_unknown_goal(self):
+        self.assertEqual(GoalAnalysisService.analyze_goal_progress(self.user.id, 'nope'), {'error': 'Goal not found'})
+        other = User.objects.create_user(username='someone-else')
+        self.assertIn('error', GoalAnalysisService.analyze_goal_progress(other.id, str(self.goals[0].id)))
+
+    def test_analyze_goals_in_batch(self):
+        with self.assertNumQueries(2):
+            results = GoalAnalysisService.analyze_goals(self.user.id)
+
+        self.assertEqual(set(results), {str(goal.id) for goal in self.goals})
+        for result in results.values():
+            self.assertAlmostEqual(result['progress_analysis']['weight_kg']['slope_per_day'], -1)
+
+
+def explain(sql):
+    """
+    Plan of a captured query as (operation, table, index) steps.
+
+    Operations are 'scan', 'search' and 'sort'; table and index are None
+    where they do not apply.
+    """
+    steps = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            nodes = [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                nodes.extend(node.get('Plans', []))
+                if node['Node Type'] == 'Seq Scan':
+                    steps.append(('scan', node['Relation Name'], None))
+                elif 'Index Name' in node:
+                    steps.append(('search', node.get('Relation Name'), node['Index Name']))
+                elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+                    steps.append(('sort', None, None))
+            return steps
+
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        for row in cursor.fetchall():
+            # SQLite before 3.36 writes 'SCAN TABLE <table>' and 'SEARCH TABLE <table>'
+            words = [word for word in row[-1].split() if word != 'TABLE']
+            if words[0] in ('SCAN', 'SEARCH') and len(words) > 1:
+                index = words[words.index('INDEX') + 1] if 'INDEX' in words else None
+                steps.append((words[0].lower(), words[1], index))
+            elif row[-1].startswith('USE TEMP B-TREE'):
+                steps.append(('sort', None, None))
+    return steps
+
+
+def explain_problems(sql, tables):
+    """Full scans of the given tables and sorts in the plan of a captured query"""
+    return [
+        f'{operation} {table or ""}'.strip()
+        for operation, table, _ in explain(sql)
+        if operation == 'sort' or (operation == 'scan' and table in tables)
+    ]
+
+
+class QueryPlanTests(TestCase):
+    """
+    Regression suite for the query plans of the agent tools and services.
+
+    Every query issued by a call is captured and EXPLAINed against a large
+    synthetic dataset; a full table scan or an explicit sort fails the test.
+    Runs against whichever database backend the tests use.
+    """
+    USERS = 40
+    GOALS_PER_USER = 30
+    MEASUREMENTS_PER_GOAL = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'plan-user-{n}') for n in range(cls.USERS)])
+        goal_types = [goal_type for goal_type, _ in Goal.GOAL_TYPES]
+        goals = Goal.objects.bulk_create([
+            Goal(user=user, goal_type=goal_types[n % len(goal_types)], is_active=n > 0)
+            for user in users
+            for n in range(cls.GOALS_PER_USER)
+        ])
+        metrics = ['weight_kg', 'waist_cm', 'body_fat_percentage']
+        start = timezone.now() - timedelta(days=cls.MEASUREMENTS_PER_GOAL)
+        BodyMeasurement.objects.bulk_create(
+            [
+                BodyMeasurement(
+                    user_id=goal.user_id,
+                    goal=goal,
+                    metric=metrics[n % len(metrics)],
+                    measurement_type='log',
+                    value=80 - n / 10,
+                    timestamp=start + timedelta(days=n, minutes=index),
+                )
+                for index, goal in enumerate(goals)
+                for n in range(cls.MEASUREMENTS_PER_GOAL)
+            ],
+            batch_size=1000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = users[cls.USERS // 2]
+        cls.goal = Goal.objects.filter(user=cls.user, is_active=True).first()
+        cls.tables = {model._meta.db_table for model in (User, Goal, BodyMeasurement, LatestMeasurement)}
+
+    def assertEfficientPlans(self, call):
+        with CaptureQueriesContext(connection) as context:
+            call()
+        self.assertTrue(context.captured_queries)
+        for query in context.captured_queries:
+            with self.subTest(sql=query['sql']):
+                self.assertEqual(explain_problems(query['sql'], self.tables), [])
+
+    def test_tool_queries(self):
+        # get_measurement_series is left out: grouping by a computed bucket
+        # always sorts, over the rows of a single (user, metric) range.
+        user_id = self.user.id
+        calls = {
+            'get_user_goals': lambda: get_user_goals.uncached(user_id),
+            'get_user_body_measurements': lambda: get_user_body_measurements.uncached(user_id),
+            'get_user_body_measurements(goal)': lambda: get_user_body_measurements.uncached(user_id, str(self.goal.id)),
+            'get_user_progress_summary': lambda: get_user_progress_summary.uncached(user_id),
+            'get_user_progress_summary(limit)': lambda: get_user_progress_summary.uncached(user_id, measurements_limit=5),
+            'get_user_progress_summary(days)': lambda: get_user_progress_summary.uncached(user_id, days=30),
+            'search_goals_by_type': lambda: search_goals_by_type.uncached(user_id, 'strength'),
+            'get_latest_measurements': lambda: get_latest_measurements.uncached(user_id),
+            'get_latest_measurements(metric)': lambda: get_latest_measurements.uncached(user_id, 'weight_kg'),
+        }
+        for name, call in calls.items():
+            with self.subTest(tool=name):
+                self.assertEfficientPlans(call)
+
+    def test_measurement_indexes_are_used(self):
+        # Each BodyMeasurement index must serve one of these; the user foreign
+        # key has no index of its own, as every composite index starts with it.
+        user_id = self.user.id
+        calls = {
+            'goals_meas_user_metric_ts': lambda: get_measurement_series.uncached(user_id, 'weight_kg'),
+            'goals_meas_user_goal_ts': lambda: get_user_body_measurements.uncached(user_id, str(self.goal.id)),
+            'goals_meas_user_ts': lambda: get_user_progress_summary.uncached(user_id, days=30),
+            'goals_bodymeasurement_goal_id': lambda: self.goal.delete(),
+        }
+        table = BodyMeasurement._meta.db_table
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        # Foreign key indexes are named <table>_<column>_<hash>
+        indexes = {
+            f'{table}_goal_id' if name.startswith(f'{table}_goal_id') else name
+            for name, details in constraints.items()
+            if (details['index'] or details['unique']) and not details['primary_key']
+        }
+        self.assertEqual(indexes, set(calls))
+
+        for index, call in calls.items():
+            with self.subTest(index=index), CaptureQueriesContext(connection) as context:
+                call()
+                used = {
+                    used_index for query in context.captured_queries
+                    for operation, used_table, used_index in explain(query['sql'])
+                    if used_table == table and used_index
+                }
+                names = (index,)
+                if constraints.get(index, {}).get('unique'):
+                    # SQLite names the index of an inline UNIQUE constraint sqlite_autoindex_<table>_<n>
+                    names += (f'sqlite_autoindex_{table}_',)
+                self.assertTrue(any(name.startswith(names) for name in used), used)
 
-# Create your tests here.
+    def test_goal_analysis_service_queries(self):
+        user_id = self.user.id
+        calls = {
+            'analyze_goal_progress': lambda: GoalAnalysisService.analyze_goal_progress(user_id, str(self.goal.id)),
+            'analyze_goals': lambda: GoalAnalysisService.analyze_goals(user_id),
+            'get_latest_values': lambda: GoalAnalysisService.get_latest_values(user_id),
+        }
+        for name, call in calls.items():
+            with self.subTest(call=name):
+                self.assertEfficientPlans(call)
@@ -1,9 +1,28 @@
+from collections import defaultdict
 from typing import List, Dict, Any, Optional
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
-from goals.models import Goal, BodyMeasurement
-from datetime import datetime, date
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from goals.models import Goal, BodyMeasurement, LatestMeasurement
+from goals.series import measurement_series
+from meals import search as ingredient_search
+from meals.categories import category_tree
+from meals.models import Ingredient
+from meals.nutrition import NUTRIENT_FIELDS
+from goals.serializers import (
+    GOAL_FIELDS,
+    MEASUREMENT_FIELDS,
+    goal_dicts,
+    measurement_dicts,
+    serialize_goals,
+    serialize_measurements,
+)
+from .cache import tool_cache
+from datetime import datetime, date, timedelta
 
+@tool_cache.cached
 def get_user_goals(user_id: int) -> List[Dict[str, Any]]:
     """
     Get all active goals for a specific user.
@@ -18,13 +37,14 @@ def get_user_goals(user_id: int) -> List[Dict[str, Any]]:
         user = User.objects.get(id=user_id)
         goals = Goal.objects.filter(user=user, is_active=True)
         
-        return [goal.to_dict() for goal in goals]
+        return serialize_goals(goals)
     except ObjectDoesNotExist:
         return []
     except Exception as e:
         return [{'error': f'Failed to fetch goals: {str(e)}'}]
 
 
+@tool_cache.cached
 def get_user_body_measurements(user_id: int, goal_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Get body measurements for a specific user, optionally filtered by goal.
@@ -43,38 +63,75 @@ def get_user_body_measurements(user_id: int, goal_id: Optional[str] = None) -> L
         if goal_id:
             measurements = measurements.filter(goal_id=goal_id)
         
-        return [measurement.to_dict() for measurement in measurements]
+        return serialize_measurements(measurements.order_by('timestamp', 'id'))
     except ObjectDoesNotExist:
         return []
     except Exception as e:
         return [{'error': f'Failed to fetch measurements: {str(e)}'}]
 
 
-def get_user_progress_summary(user_id: int) -> Dict[str, Any]:
+@tool_cache.cached
+def get_user_progress_summary(
+    user_id: int,
+    measurements_limit: Optional[int] = None,
+    days: Optional[int] = None,
+) -> Dict[str, Any]:
     """
     Get a comprehensive summary of user's goals and progress.
     
+    Goals and their measurements are fetched in a fixed number of queries
+    and grouped in memory, regardless of how many goals the user has.
+    
     Args:
         user_id: The ID of the user
+        measurements_limit: Optional cap on the number of most recent
+            measurements attached to each goal
+        days: Optional window, in days, of measurements attached to each goal
         
     Returns:
         Dictionary containing user's goals and progress summary
     """
     try:
-        user = User.objects.get(id=user_id)
-        goals = Goal.objects.filter(user=user, is_active=True)
+        user = User.objects.only('id', 'username').get(id=user_id)
+        goals = goal_dicts(Goal.objects.filter(user=user, is_active=True).values_list(*GOAL_FIELDS))
+        
+        measurements = BodyMeasurement.objects.filter(
+            user=user, goal_id__in=[goal['id'] for goal in goals]
+        )
+        
+        if days is not None:
+            measurements = measurements.filter(timestamp__gte=timezone.now() - timedelta(days=days))
+        
+        if measurements_limit is not None:
+            # Rows kept by the window come back unordered; sorting the few of
+            # them here spares the database a sort over the window result.
+            rows = sorted(
+                measurements.annotate(
+                    goal_row_number=Window(
+                        expression=RowNumber(),
+                        partition_by=[F('goal_id')],
+                        order_by=[F('timestamp').desc(), F('id').desc()],
+                    )
+                ).filter(goal_row_number__lte=measurements_limit).order_by().values_list(*MEASUREMENT_FIELDS),
+                key=lambda row: (row[MEASUREMENT_FIELDS.index('timestamp')], row[0]),
+            )
+        else:
+            rows = measurements.order_by('timestamp', 'id').values_list(*MEASUREMENT_FIELDS)
+        
+        measurements_by_goal = defaultdict(list)
+        for measurement in measurement_dicts(rows):
+            measurements_by_goal[measurement['goal_id']].append(measurement)
         
         summary = {
             'user_id': user_id,
             'username': user.username,
-            'total_active_goals': goals.count(),
+            'total_active_goals': len(goals),
             'goals': [],
             'progress_summary': {}
         }
         
-        for goal in goals:
-            goal_data = goal.to_dict()
-            goal_data['measurements'] = get_user_body_measurements(user_id, str(goal.id))
+        for goal_data in goals:
+            goal_data['measurements'] = measurements_by_goal.get(goal_data['id'], [])
             summary['goals'].append(goal_data)
         
         return summary
@@ -84,6 +141,7 @@ def get_user_progress_summary(user_id: int) -> Dict[str, Any]:
         return {'error': f'Failed to fetch progress summary: {str(e)}'}
 
 
+@tool_cache.cached
 def search_goals_by_type(user_id: int, goal_type: str) -> List[Dict[str, Any]]:
     """
     Search for goals by type for a specific user.
@@ -99,13 +157,14 @@ def search_goals_by_type(user_id: int, goal_type: str) -> List[Dict[str, Any]]:
         user = User.objects.get(id=user_id)
         goals = Goal.objects.filter(user=user, goal_type=goal_type, is_active=True)
         
-        return [goal.to_dict() for goal in goals]
+        return serialize_goals(goals)
     except ObjectDoesNotExist:
         return []
     except Exception as e:
         return [{'error': f'Failed to search goals: {str(e)}'}]
 
 
+@tool_cache.cached
 def get_latest_measurements(user_id: int, metric: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Get the latest measurements for a user, optionally filtered by metric.
@@ -118,24 +177,70 @@ def get_latest_measurements(user_id: int, metric: Optional[str] = None) -> List[
         List of dictionaries containing the latest measurements
     """
     try:
-        user = User.objects.get(id=user_id)
-        measurements = BodyMeasurement.objects.filter(user=user)
-        
-        if metric:
-            measurements = measurements.filter(metric=metric)
+        latest = LatestMeasurement.objects.for_user(user_id, metric)
         
-        # Get the latest measurement for each metric
-        latest_measurements = []
-        seen_metrics = set()
+        return serialize_measurements(latest, prefix='measurement__')
+    except Exception as e:
+        return [{'error': f'Failed to fetch latest measurements: {str(e)}'}]
+
+
+@tool_cache.cached
+def get_measurement_series(
+    user_id: int,
+    metric: str,
+    bucket: str = 'day',
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    points: Optional[int] = None,
+    time_zone: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Get a user's measurements of one metric aggregated into time buckets.
+    
+    Each bucket carries min, max, mean, last value and count, computed by the
+    database, so long histories never travel as raw rows.
+    
+    Args:
+        user_id: The ID of the user
+        metric: Metric to aggregate (e.g., 'weight_kg')
+        bucket: Bucket size, 'day', 'week' or 'month'
+        start: Optional ISO start date or datetime
+        end: Optional ISO end date or datetime
+        points: Optional maximum number of buckets, downsampled with LTTB
+        time_zone: Optional IANA time zone for bucket boundaries
         
-        for measurement in measurements.order_by('-timestamp'):
-            if measurement.metric not in seen_metrics:
-                measurement_data = measurement.to_dict()
-                latest_measurements.append(measurement_data)
-                seen_metrics.add(measurement.metric)
+    Returns:
+        Dictionary containing the bucketed series
+    """
+    try:
+        return measurement_series(user_id, metric, bucket, start, end, points, time_zone)
+    except Exception as e:
+        return {'error': f'Failed to aggregate measurements: {str(e)}'}
+
+
+def search_ingredients(query: str, category_id: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Find ingredients by name, tolerating typos and unfinished words.
+    
+    Args:
+        query: Ingredient name or the start of it (e.g., 'chick', 'brocoli')
+        category_id: Optional category to search in, subcategories included
+        limit: Maximum number of results
         
-        return latest_measurements
-    except ObjectDoesNotExist:
-        return []
+    Returns:
+        List of dictionaries containing matching ingredients, best first, with
+        their nutrients per 100 g
+    """
+    try:
+        category_ids = category_tree.descendant_ids(category_id) if category_id is not None else None
+        matches = ingredient_search.search_ingredients(query, limit, category_ids)
+        nutrients = {
+            pk: dict(zip(NUTRIENT_FIELDS, values))
+            for pk, *values in Ingredient.objects.filter(
+                pk__in=[match['id'] for match in matches]
+            ).values_list('pk', *NUTRIENT_FIELDS)
+        }
+        return [{**match, 'per_100g': nutrients[match['id']]} for match in matches if match['id'] in nutrients]
     except Exception as e:
-        return [{'error': f'Failed to fetch latest measurements: {str(e)}'}] 
\ No newline at end of file
+        return [{'error': f'Failed to search ingredients: {str(e)}'}]
+
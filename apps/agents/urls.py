@@ -3,5 +3,7 @@ from . import views
 
 urlpatterns = [
     path('api/chat/', views.chat_endpoint, name='chat_endpoint'),
+    path('api/chat/stream/', views.chat_stream_endpoint, name='chat_stream_endpoint'),
     path('api/chat/history/<int:user_id>/', views.chat_history, name='chat_history'),
+    path('api/tools/cache-stats/', views.tool_cache_stats, name='tool_cache_stats'),
 ] 
\ No newline at end of file
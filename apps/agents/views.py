@@ -1,10 +1,28 @@
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
+import logging
+from contextlib import aclosing
+from apps.responses import FastJsonResponse
+from .cache import tool_cache
+from .graphs import agent_graphs
+from .models import Agent, ChatMessage
 from .services import AgentService
+from .streaming import (
+    NDJSON_CONTENT_TYPE,
+    SSE_CONTENT_TYPE,
+    ClosingStream,
+    format_ndjson,
+    format_sse,
+    stream_chat_events,
+)
 from .tools import get_user_goals, get_user_progress_summary
 
+logger = logging.getLogger(__name__)
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def chat_endpoint(request):
@@ -27,6 +45,11 @@ def chat_endpoint(request):
         else:
             response = "I'm here to help with your wellness journey! You can ask me about goals, meals, workouts, or anything wellness-related."
         
+        try:
+            ChatMessage.objects.append(user_id, 'app', ('user', message), ('assistant', response))
+        except IntegrityError:
+            logger.warning(f"Not storing chat history for unknown user {user_id}")
+        
         return JsonResponse({
             'response': response,
             'metadata': {
@@ -40,9 +63,89 @@ def chat_endpoint(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+async def chat_stream_endpoint(request):
+    """
+    Stream an agent's answer to a chat message as it is generated
+    
+    Responds with Server-Sent Events, or with newline-delimited JSON when the
+    client sends ``Accept: application/x-ndjson``. Runs natively under ASGI;
+    the agent run is cancelled if the client disconnects.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    
+    message = data.get('message', '')
+    user_id = data.get('user_id', 1)
+    agent_id = data.get('agent_id')
+    
+    agents = Agent.objects.filter(pk=agent_id) if agent_id else Agent.objects.filter(supervisor__isnull=True)
+    agent = await agents.order_by('pk').afirst()
+    if agent is None:
+        return JsonResponse({'error': 'Agent not found'}, status=404)
+    
+    graph = await agent_graphs.aget(agent)
+    
+    if NDJSON_CONTENT_TYPE in request.headers.get('Accept', ''):
+        content_type, encode = NDJSON_CONTENT_TYPE, format_ndjson
+    else:
+        content_type, encode = SSE_CONTENT_TYPE, format_sse
+    
+    history = await sync_to_async(ChatMessage.objects.prompt_window)(user_id, 'app')
+    
+    async def events():
+        try:
+            messages = history + [{'role': 'user', 'content': message}]
+            async with aclosing(stream_chat_events(graph, messages)) as stream:
+                async for event in stream:
+                    if event['event'] == 'done':
+                        try:
+                            await ChatMessage.objects.aappend(
+                                user_id, 'app', ('user', message), ('assistant', event['response'])
+                            )
+                        except IntegrityError:
+                            logger.warning(f"Not storing chat history for unknown user {user_id}")
+                    yield encode(event)
+        except Exception as e:
+            logger.exception(f"Chat stream failed for user {user_id}")
+            yield encode({'event': 'error', 'error': str(e)})
+    
+    response = StreamingHttpResponse(ClosingStream(events()), content_type=content_type)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def chat_history(request, user_id):
-    """Get chat history for a user"""
-    # TODO: Implement chat history storage and retrieval
-    return JsonResponse([])
+    """
+    Get chat history for a user, newest page first
+    
+    Query parameters: ``channel`` (default ``app``), ``limit`` (default 50,
+    at most 200) and ``before``, the ``next_cursor`` of the previous page.
+    """
+    try:
+        channel = request.GET.get('channel', 'app')
+        limit = min(int(request.GET.get('limit', 50)), 200)
+        before = request.GET.get('before')
+        before = int(before) if before else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid pagination parameters'}, status=400)
+    
+    if limit < 1:
+        return JsonResponse({'error': 'Invalid pagination parameters'}, status=400)
+    
+    messages, next_cursor = ChatMessage.objects.page(user_id, channel, before=before, limit=limit)
+    return FastJsonResponse({
+        'messages': [message.to_dict() for message in messages],
+        'next_cursor': next_cursor
+    })
+
+
+@require_http_methods(["GET"])
+def tool_cache_stats(request):
+    """Hit and miss counters of the tool result cache in this process"""
+    return JsonResponse(tool_cache.stats())
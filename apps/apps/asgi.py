@@ -2,6 +2,7 @@
 ASGI config for apps project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The bots are started with the server when BOTS_AUTOSTART is set.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +14,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apps.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from bots.lifespan import BotLifespan  # noqa: E402
+
+application = BotLifespan(django_application)
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List
+
+from django.core.cache import caches
+
+
+class VersionStamp:
+    """
+    Monotonic counter stored in a Django cache.
+
+    In-process caches remember the version they were built from and rebuild
+    once it changes, so a bump in one worker invalidates every worker that
+    shares the cache backend. Missing or evicted stamps restart from the
+    current time in nanoseconds, so they never repeat an earlier version.
+    """
+
+    def __init__(self, key: str, alias: str = 'default'):
+        self.key = key
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def current(self) -> int:
+        """Return the current version, initialising it if missing"""
+        version = self.cache.get(self.key)
+        if version is None:
+            self.cache.add(self.key, time.time_ns(), timeout=None)
+            version = self.cache.get(self.key)
+        return version
+
+    def bump(self) -> int:
+        """Advance the version so in-process copies are rebuilt"""
+        try:
+            return self.cache.incr(self.key)
+        except ValueError:
+            self.cache.add(self.key, time.time_ns(), timeout=None)
+            return self.cache.incr(self.key)
+
+    async def acurrent(self) -> int:
+        """current() through the async cache API, for use in coroutines"""
+        version = await self.cache.aget(self.key)
+        if version is None:
+            await self.cache.aadd(self.key, time.time_ns(), timeout=None)
+            version = await self.cache.aget(self.key)
+        return version
+
+    async def abump(self) -> int:
+        """bump() through the async cache API, for use in coroutines"""
+        try:
+            return await self.cache.aincr(self.key)
+        except ValueError:
+            await self.cache.aadd(self.key, time.time_ns(), timeout=None)
+            return await self.cache.aincr(self.key)
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry beyond maxsize"""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,43 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - declared in pyproject.toml
+    orjson = None
+
+
+class EncodedJSON(json.JSONEncoder):
+    """Encoder that hands back content orjson already encoded"""
+
+    def encode(self, o):
+        return o
+
+
+class FastJsonResponse(JsonResponse):
+    """
+    JsonResponse encoded with orjson when it is installed.
+
+    Output matches JsonResponse: dates, times and any type orjson does not know
+    go through the encoder's default(), so datetimes keep Django's format.
+    Falls back to the standard library when orjson is missing or
+    json_dumps_params are given.
+    """
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if orjson is None or json_dumps_params:
+            super().__init__(data, encoder, safe, json_dumps_params, **kwargs)
+            return
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        content = orjson.dumps(
+            data,
+            default=encoder().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        super().__init__(content, EncodedJSON, safe=False, **kwargs)
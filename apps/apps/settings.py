@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -84,6 +85,37 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set REDIS_URL to share caches and version stamps
+# between worker processes.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'tools': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'tools',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'tools': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tools',
+        },
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -120,7 +152,149 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files
+# https://docs.djangoproject.com/en/5.2/topics/files/
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Agents
+# Maximum number of compiled LangGraph agents kept in memory per process
+
+AGENT_GRAPH_CACHE_SIZE = 32
+
+# Chat history sent to the agent with each new message
+
+CHAT_PROMPT_MAX_MESSAGES = 20
+CHAT_PROMPT_MAX_TOKENS = 2000
+
+# Seconds a per-user tool result stays cached; writes invalidate it sooner
+
+TOOL_CACHE_TIMEOUT = 300
+
+# Goals
+# Rows written per bulk_create batch by the measurement ingestion endpoint
+
+MEASUREMENT_INGEST_BATCH_SIZE = 500
+
+# Per-row errors listed in an ingestion report; the rest are only counted
+
+MEASUREMENT_INGEST_MAX_ERRORS = 100
+
+# Meals
+# Minimum trigram similarity (0-1) for a typo-tolerant ingredient search match
+
+INGREDIENT_SEARCH_THRESHOLD = 0.3
+
+# Largest result page the ingredient search endpoint returns
+
+INGREDIENT_SEARCH_MAX_LIMIT = 50
+
+# Largest ingredient page the category ingredients endpoint returns
+
+CATEGORY_INGREDIENTS_MAX_LIMIT = 500
+
+# Largest meal page the compatible meals endpoint returns
+
+COMPATIBLE_MEALS_MAX_LIMIT = 500
+
+# Barcode lookups kept in each process's LRU, misses included
+
+BARCODE_CACHE_SIZE = 10000
+
+# Rows validated and written per transaction by the import_barcodes command
+
+BARCODE_IMPORT_CHUNK_SIZE = 5000
+
+# Meal photos
+# Processes rendering photo variants; 0 renders in the committing thread
+
+MEAL_PHOTO_WORKERS = int(os.environ.get('MEAL_PHOTO_WORKERS', 2))
+
+# Largest accepted photo upload, in bytes
+
+MEAL_PHOTO_MAX_BYTES = 20 * 1024 * 1024
+
+# Longest side of the JPEG thumbnail and the WebP display variant, in pixels,
+# and the encoder quality of both
+
+MEAL_PHOTO_THUMBNAIL_SIZE = 320
+MEAL_PHOTO_WEBP_SIZE = 1600
+MEAL_PHOTO_QUALITY = 80
+
+# Bots
+# Agent runs executing at once across all chats of the bot event loop
+
+BOT_MAX_CONCURRENT_RUNS = int(os.environ.get('BOT_MAX_CONCURRENT_RUNS', 16))
+
+# Messages a single chat may have waiting for an answer before new ones are refused
+
+BOT_CHAT_MAX_PENDING = 10
+
+# Answer by editing one message as the model writes, instead of one message per reply
+
+BOT_STREAM_REPLIES = True
+
+# Streamed answers are edited at most this often, in seconds, and only once
+# this many new characters arrived
+
+BOT_STREAM_EDIT_INTERVAL = 1.0
+BOT_STREAM_EDIT_MIN_CHARS = 40
+
+# Start the bot supervisor with the ASGI server (on lifespan startup, so
+# only with a single server process); otherwise run `manage.py run_bots`
+
+BOTS_AUTOSTART = os.environ.get('BOTS_AUTOSTART', '') == '1'
+
+# Seconds a getUpdates long poll waits for updates, and seconds without a
+# completed poll after which a running bot is reported unhealthy
+
+BOT_POLLING_TIMEOUT = 30
+BOT_HEALTH_MAX_SILENCE = 90
+
+# Seconds between checks for Bot rows changed by other processes
+
+BOT_RELOAD_INTERVAL = 30
+
+# Seconds between the statuses the bot supervisor publishes to the cache for
+# the health and chat queue endpoints. Other processes only see the status
+# and Bot changes through a shared cache, so set REDIS_URL when run_bots and
+# the web server are separate processes
+
+BOT_STATUS_INTERVAL = 5
+
+# Seconds a stopping bot waits for the replies it is writing before
+# cancelling them and closing its connections
+
+BOT_SHUTDOWN_TIMEOUT = 10
+
+# How Telegram bots receive updates: 'polling' (getUpdates, fine for local
+# development) or 'webhook' (Telegram POSTs updates to
+# <BOT_WEBHOOK_BASE_URL>/bots/telegram/<bot id>/webhook/ on the ASGI app;
+# run_bots then only registers the webhooks and watches their state)
+
+BOT_DELIVERY = os.environ.get('BOT_DELIVERY', 'polling')
+BOT_WEBHOOK_BASE_URL = os.environ.get('BOT_WEBHOOK_BASE_URL', '')
+
+# Memory of bot chats, in estimated tokens per prompt: pinned facts and the
+# rolling summary of older turns get fixed shares, the latest turns the rest
+
+BOT_MEMORY_MAX_TOKENS = 2000
+BOT_MEMORY_FACTS_TOKENS = 300
+BOT_MEMORY_SUMMARY_TOKENS = 500
+BOT_MEMORY_SUMMARY_MODEL = 'openai:gpt-4o-mini'
+
+# Chats whose memory is kept in memory per process
+
+BOT_MEMORY_CACHE_SIZE = 1024
+
+# Messenger users whose Django user is kept in memory per process, and
+# seconds an id without a user is remembered as unknown
+
+BOT_IDENTITY_CACHE_SIZE = 10000
+BOT_IDENTITY_NEGATIVE_TTL = 60
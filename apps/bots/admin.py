@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Bot, UserContext
+from .models import Bot, Identity, UserContext
 
 # Register your models here.
 admin.site.register(Bot)
 admin.site.register(UserContext)
+admin.site.register(Identity)
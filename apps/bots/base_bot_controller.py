@@ -1,27 +1,106 @@
+import asyncio
+import logging
+import time
 from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
 
 # Base class for all bot controllers
 class BaseBotController(ABC):
-    @abstractmethod
-    def start(self):
-        pass
+    """
+    Runs one Bot row as a task on the bot supervisor's event loop.
 
-    @abstractmethod
-    def stop(self):
-        pass
+    Subclasses implement run(), which receives updates until cancelled, and
+    call record_poll() and record_update() so health() can report whether
+    the bot is still receiving updates and how far behind it is.
+    """
 
-    @abstractmethod
-    def run(self):
-        pass
+    def __init__(self, bot_model):
+        self.bot_model = bot_model
+        self.task: Optional[asyncio.Task] = None
+        self.status = 'stopped'
+        self.error = ''
+        self.started_at: Optional[float] = None
+        self.last_poll_at: Optional[float] = None
+        self.last_update_at: Optional[float] = None
+        self.update_count = 0
+        self.update_lag: Optional[float] = None
 
-    @abstractmethod
-    def run(self):
-        pass
+    @property
+    def is_running(self) -> bool:
+        return self.task is not None and not self.task.done()
 
-    @abstractmethod
-    def __str__(self):
-        pass
+    def start(self) -> None:
+        """Start receiving updates in a task on the running event loop"""
+        if self.is_running:
+            logger.warning(f"{self} is already running")
+            return
+        self.status, self.error, self.started_at = 'running', '', time.time()
+        self.task = asyncio.get_running_loop().create_task(self._run(), name=str(self))
+
+    async def stop(self) -> None:
+        """Stop receiving updates and release the bot's connections"""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        try:
+            await self.close()
+        finally:
+            if self.status != 'failed':
+                self.status = 'stopped'
 
     @abstractmethod
-    def run(self):
-        pass
+    async def run(self) -> None:
+        """Receive and dispatch updates until cancelled"""
+
+    async def close(self) -> None:
+        """Release connections opened by run()"""
+
+    def record_poll(self) -> None:
+        self.last_poll_at = time.time()
+
+    def record_update(self, sent_at: Optional[float] = None) -> None:
+        """Count a received update; sent_at is when the user sent it, as a UNIX timestamp"""
+        self.last_update_at = time.time()
+        self.update_count += 1
+        if sent_at is not None:
+            self.update_lag = max(0.0, self.last_update_at - sent_at)
+
+    def health(self) -> Dict[str, Any]:
+        """Status, counters and lag of this bot"""
+        last_seen = self.last_poll_at or self.started_at or 0
+        return {
+            'id': self.bot_model.pk,
+            'name': self.bot_model.name,
+            'provider': self.bot_model.provider,
+            'status': self.status,
+            'healthy': self.is_running and time.time() - last_seen <= settings.BOT_HEALTH_MAX_SILENCE,
+            'error': self.error or None,
+            'started_at': self.started_at,
+            'last_poll_at': self.last_poll_at,
+            'last_update_at': self.last_update_at,
+            'updates': self.update_count,
+            'update_lag_seconds': self.update_lag,
+        }
+
+    async def _run(self) -> None:
+        try:
+            await self.run()
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            raise
+        except BaseException as e:
+            # telegrinder raises BaseException subclasses and calls sys.exit()
+            # for an invalid token; neither may stop the loop other bots share.
+            logger.exception(f"{self} stopped")
+            self.status = 'failed'
+            self.error = f"Exited with code {e.code}" if isinstance(e, SystemExit) else str(e) or type(e).__name__
+        else:
+            self.status = 'stopped'
+
+    def __str__(self):
+        return f"BotController for {self.bot_model.name}"
@@ -1,14 +1,100 @@
+import inspect
+from contextlib import aclosing
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_core.tools.base import create_schema_from_function
 from langgraph.prebuilt import create_react_agent
 from typing import List, Callable
 
 from collections import defaultdict
-from typing import Any, Dict, Optional, Generator
+from typing import Any, AsyncIterator, Dict, Optional, Generator
+
+from agents.streaming import stream_chat_events
+
+
+def user_scoped_tool(function: Callable[..., Any]) -> BaseTool:
+    """
+    Tool calling function for the Django user the bot is talking to.
+
+    The model never sees or chooses the user_id argument: it is taken from
+    the run's config, where BotAgent puts the user of the chat, so a chat
+    can only read its own user's data.
+    """
+    name = function.__name__
+    description = '\n'.join(
+        line for line in inspect.cleandoc(function.__doc__ or name).splitlines() if 'user_id' not in line
+    )
+
+    def run(config: RunnableConfig, **kwargs):
+        user_id = (config or {}).get('configurable', {}).get('user_id')
+        if user_id is None:
+            return {'error': 'This chat is not linked to a user'}
+        return function(user_id, **kwargs)
+
+    return StructuredTool.from_function(
+        func=run,
+        name=name,
+        description=description,
+        args_schema=create_schema_from_function(name, function, filter_args=['user_id']),
+    )
+
+
+def user_tools() -> List[BaseTool]:
+    """The agent tools, with the user-scoped ones bound to the chat's user"""
+    from agents.registry import TOOL_FUNCTIONS
+
+    tools = []
+    for function in TOOL_FUNCTIONS.values():
+        if 'user_id' in inspect.signature(function).parameters:
+            tools.append(user_scoped_tool(function))
+        else:
+            tools.append(StructuredTool.from_function(function))
+    return tools
+
 
 class BotAgent:
 
     def __init__(self, name: str, model: str, tools: List[Callable], prompt: str):
         self.graph = create_react_agent(name=name, model=model, tools=tools, prompt=prompt)
 
+    def config(self, user_id: Optional[int]) -> Dict[str, Any]:
+        """Run config handing the chat's Django user to the user-scoped tools"""
+        return {'configurable': {'user_id': user_id}}
+
     def get_chat_response(self, user_id: int, message: str, stream: bool) -> Generator[str, None, None]:
         """Get the chat response for the specified user and message."""
         return self.graph.stream(inputs={"messages": [{"role": "user", "content": message}]}, stream_mode="updates")
+
+    async def astream_response(
+        self, user_id: int, message: str, history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run the agent on the event loop without blocking it and yield the text
+        of every message the model writes.
+
+        The model call is awaited and tools run in the graph's worker threads,
+        so other chats keep being served meanwhile. history holds the earlier
+        messages of the conversation, as {'role', 'content'} dictionaries.
+        user_id is the chat's Django user, whose data the tools read.
+        """
+        messages = [*(history or []), {"role": "user", "content": message}]
+        stream = self.graph.astream({"messages": messages}, self.config(user_id), stream_mode="updates")
+        async with aclosing(stream):
+            async for update in stream:
+                for node in update.values():
+                    for reply in (node or {}).get("messages", []):
+                        if isinstance(reply, AIMessage) and isinstance(reply.content, str) and reply.content:
+                            yield reply.content
+
+    async def astream_tokens(
+        self, user_id: int, message: str, history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        """Like astream_response(), but yield the model output token by token as it is generated."""
+        stream = stream_chat_events(
+            self.graph, [*(history or []), {"role": "user", "content": message}], self.config(user_id)
+        )
+        async with aclosing(stream):
+            async for event in stream:
+                if event["event"] == "token":
+                    yield event["content"]
@@ -0,0 +1,139 @@
+import time
+import uuid
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from apps.caching import LRUCache, VersionStamp
+
+from .models import Identity
+
+
+class IdentityResolver:
+    """
+    Maps the user ids of a bot's messenger to Django users.
+
+    Resolved ids are kept in a bounded LRU cache and ids without a user are
+    remembered for BOT_IDENTITY_NEGATIVE_TTL seconds, so a busy chat costs
+    no query per message. Newcomers get a user on their first message, or
+    the user they already have with another bot of the same messenger.
+    First messages racing in one process or several end up with the same
+    user: the identity row is unique, and the loser reads the winner's.
+    Changing or deleting an identity, or deleting its user, bumps a shared
+    version stamp that empties the cache of every process.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self.version_stamp = VersionStamp('bots:identities')
+        self._version: Optional[int] = None
+        self._users = LRUCache(maxsize or settings.BOT_IDENTITY_CACHE_SIZE)
+
+    def clear(self) -> None:
+        """Drop the identities cached by this process"""
+        self._users.clear()
+
+    def invalidate(self) -> None:
+        """Make every process forget its cached identities"""
+        self.version_stamp.bump()
+        self.clear()
+
+    async def afind(self, bot_id: int, external_id) -> Optional[int]:
+        """
+        Look up the user of a messenger id without creating one.
+
+        Args:
+            bot_id: Primary key of the Bot
+            external_id: The user's id on the bot's messenger
+
+        Returns:
+            The user's primary key, or None if the id has no user yet
+        """
+        key = (bot_id, str(external_id))
+        found, user_id = await self._cached(key)
+        if found:
+            return user_id
+
+        user_id = await Identity.objects.filter(bot_id=bot_id, external_id=key[1]).values_list(
+            'user_id', flat=True
+        ).afirst()
+        self._remember(key, user_id)
+        return user_id
+
+    async def aresolve(
+        self, bot_id: int, external_id, *, provider: str, first_name: str = '', last_name: str = ''
+    ) -> int:
+        """
+        User of a messenger id, created on first contact.
+
+        Args:
+            bot_id: Primary key of the Bot
+            external_id: The user's id on the bot's messenger
+            provider: The bot's messenger, used in the username of new users
+            first_name: Name given to a new user
+            last_name: Name given to a new user
+
+        Returns:
+            The user's primary key
+        """
+        key = (bot_id, str(external_id))
+        _, user_id = await self._cached(key)
+        if user_id is not None:
+            return user_id
+
+        user_id = await sync_to_async(self._get_or_create)(bot_id, key[1], provider, first_name, last_name)
+        self._remember(key, user_id)
+        return user_id
+
+    def _get_or_create(self, bot_id: int, external_id: str, provider: str, first_name: str, last_name: str) -> int:
+        identities = Identity.objects.filter(bot_id=bot_id, external_id=external_id)
+        user_id = identities.values_list('user_id', flat=True).first()
+        if user_id is not None:
+            return user_id
+
+        try:
+            with transaction.atomic():
+                user_id = Identity.objects.filter(bot__provider=provider, external_id=external_id).values_list(
+                    'user_id', flat=True
+                ).first()
+                if user_id is None:
+                    user_id = self._create_user(provider, external_id, first_name, last_name).pk
+                Identity.objects.create(bot_id=bot_id, external_id=external_id, user_id=user_id)
+        except IntegrityError:
+            # A concurrent first message linked the id first.
+            return identities.values_list('user_id', flat=True).get()
+        return user_id
+
+    def _create_user(self, provider: str, external_id: str, first_name: str, last_name: str) -> User:
+        # An existing account is never taken over by its username.
+        username = f'{provider}-{external_id}'[:140]
+        if User.objects.filter(username=username).exists():
+            username = f'{username}-{uuid.uuid4().hex[:8]}'
+        user = User(username=username, first_name=first_name[:150], last_name=last_name[:150])
+        user.set_unusable_password()
+        user.save()
+        return user
+
+    async def _cached(self, key):
+        version = await self.version_stamp.acurrent()
+        if version != self._version:
+            self._users.clear()
+            self._version = version
+            return False, None
+
+        entry = self._users.get(key)
+        if entry is None:
+            return False, None
+        user_id, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            return False, None
+        return True, user_id
+
+    def _remember(self, key, user_id: Optional[int]) -> None:
+        expires_at = None if user_id is not None else time.monotonic() + settings.BOT_IDENTITY_NEGATIVE_TTL
+        self._users.set(key, (user_id, expires_at))
+
+
+identity_resolver = IdentityResolver()
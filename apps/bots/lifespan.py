@@ -0,0 +1,43 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .supervisor import bot_supervisor
+from .telegram.webhook import webhook_receiver
+
+
+class BotLifespan:
+    """
+    ASGI app that runs the bot supervisor for the lifetime of the server.
+
+    Django's ASGI handler does not speak the lifespan protocol, so this
+    wrapper answers it and passes every other scope on. With BOTS_AUTOSTART
+    the supervisor starts on lifespan startup and stops on shutdown; the
+    server must then run a single process, as every process would poll the
+    same bots. Shutdown also closes the API clients of the webhook receiver.
+    runserver, migrate, shell and the test runner never send a lifespan
+    event, so they never start the bots.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.application(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if settings.BOTS_AUTOSTART:
+                        bot_supervisor.start()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if settings.BOTS_AUTOSTART:
+                    await sync_to_async(bot_supervisor.shutdown, thread_sensitive=False)()
+                await webhook_receiver.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bots.supervisor import bot_supervisor
+
+
+class Command(BaseCommand):
+    help = 'Run every active bot on one event loop in the foreground, reloading them as Bot rows change'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Running bots, press CTRL-C to stop')
+        try:
+            bot_supervisor.run()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            self.stdout.write('Bots stopped')
@@ -0,0 +1,190 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from agents.models import estimate_tokens
+from apps.caching import LRUCache, VersionStamp
+
+from .models import UserContext
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain the memory of a chat between a user and an assistant. "
+    "Rewrite the summary so it also covers the new messages. Keep names, numbers, "
+    "goals, preferences and open questions; drop small talk. "
+    "Answer with the summary only, in at most {words} words."
+)
+
+
+def clip(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cut text to about max_tokens estimated tokens, keeping its start or its end"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return '…' + text[-max_chars + 1:] if keep_end else text[:max_chars - 1] + '…'
+
+
+def count_tokens(turns: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(turn['content']) for turn in turns)
+
+
+class ConversationMemory:
+    """
+    Token-budgeted memory of the chats bots have with their users.
+
+    Every prompt carries the pinned facts, the rolling summary and the
+    latest turns verbatim, within BOT_MEMORY_MAX_TOKENS: facts and summary
+    are capped at BOT_MEMORY_FACTS_TOKENS and BOT_MEMORY_SUMMARY_TOKENS and
+    the turns get the rest. When the turns outgrow their share, the oldest
+    are folded into the summary until half of it is free, so the model is
+    asked to summarize every few turns rather than on every one.
+
+    Contexts of active chats are kept in an LRU cache, each with a version
+    stamp of its own that is bumped on every write, so a chat served by
+    another process is reloaded; reading a context costs one query at most.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self._contexts = LRUCache(maxsize or settings.BOT_MEMORY_CACHE_SIZE)
+        self._model = None
+
+    def version_stamp(self, bot_id: int, external_id: str) -> VersionStamp:
+        return VersionStamp(f'bots:memory:{bot_id}:{external_id}')
+
+    def clear(self) -> None:
+        """Drop the contexts cached by this process"""
+        self._contexts.clear()
+
+    async def aget(self, bot_id: int, external_id: str) -> UserContext:
+        """
+        Memory of a chat, unsaved and empty if the chat is new.
+
+        Args:
+            bot_id: Primary key of the Bot
+            external_id: The chat's id on the messenger
+
+        Returns:
+            The chat's UserContext
+        """
+        key = (bot_id, str(external_id))
+        version = await self.version_stamp(*key).acurrent()
+        cached = self._contexts.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        context = await UserContext.objects.filter(bot_id=bot_id, external_id=key[1]).afirst()
+        if context is None:
+            context = UserContext(bot_id=bot_id, external_id=key[1])
+        self._contexts.set(key, (version, context))
+        return context
+
+    def history(self, context: UserContext) -> List[Dict[str, str]]:
+        """Messages to send to the agent before a new user message: facts and summary, then the recent turns"""
+        sections = []
+        if context.facts:
+            facts = '\n'.join(f"- {fact}" for fact in context.facts)
+            sections.append(f"Facts the user asked you to remember:\n{facts}")
+        if context.summary:
+            sections.append(f"Summary of the earlier conversation:\n{context.summary}")
+
+        messages = [{'role': 'system', 'content': '\n\n'.join(sections)}] if sections else []
+        messages.extend({'role': turn['role'], 'content': turn['content']} for turn in context.turns)
+        return messages
+
+    async def arecord(self, context: UserContext, message: str, answer: str) -> UserContext:
+        """Remember one exchange, folding the oldest turns into the summary when over budget"""
+        # Each turn may take half the budget, so the latest exchange always fits verbatim.
+        budget = self.turns_budget()
+        context.turns = list(context.turns) + [
+            {'role': 'user', 'content': clip(message, budget // 2)},
+            {'role': 'assistant', 'content': clip(answer, budget // 2)},
+        ]
+        if count_tokens(context.turns) > budget:
+            folded = []
+            while len(context.turns) > 2 and count_tokens(context.turns) > budget // 2:
+                # Whole exchanges, so the turns still start with a user message
+                folded.extend(context.turns[:2])
+                del context.turns[:2]
+            context.summary = await self.summarize(context.summary, folded)
+        await self._save(context)
+        return context
+
+    async def apin(self, context: UserContext, fact: str) -> UserContext:
+        """Pin a fact, dropping the oldest facts beyond BOT_MEMORY_FACTS_TOKENS"""
+        fact = clip(' '.join(fact.split()), settings.BOT_MEMORY_FACTS_TOKENS)
+        facts = [pinned for pinned in context.facts if pinned != fact] + [fact]
+        while len(facts) > 1 and sum(estimate_tokens(pinned) for pinned in facts) > settings.BOT_MEMORY_FACTS_TOKENS:
+            facts.pop(0)
+        context.facts = facts
+        await self._save(context)
+        return context
+
+    async def aforget(self, context: UserContext, facts: bool = False) -> UserContext:
+        """Forget the conversation, and the pinned facts if facts is set"""
+        context.turns, context.summary = [], ''
+        if facts:
+            context.facts = []
+        await self._save(context)
+        return context
+
+    def turns_budget(self) -> int:
+        return max(
+            2, settings.BOT_MEMORY_MAX_TOKENS - settings.BOT_MEMORY_FACTS_TOKENS - settings.BOT_MEMORY_SUMMARY_TOKENS
+        )
+
+    async def summarize(self, summary: str, turns: List[Dict[str, Any]]) -> str:
+        """
+        Fold turns into a summary of at most BOT_MEMORY_SUMMARY_TOKENS.
+
+        If the summary model fails, the turns are appended to the summary
+        as they are and its oldest part is cut instead.
+        """
+        transcript = '\n'.join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        max_tokens = settings.BOT_MEMORY_SUMMARY_TOKENS
+        try:
+            reply = await self.model.ainvoke([
+                {'role': 'system', 'content': SUMMARY_PROMPT.format(words=max_tokens * 3 // 4)},
+                {'role': 'user', 'content': f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+            ])
+            return clip(str(reply.content).strip(), max_tokens)
+        except Exception as e:
+            logger.warning(f"Could not summarize the conversation: {e}")
+            return clip('\n'.join(filter(None, [summary, transcript])), max_tokens, keep_end=True)
+
+    @property
+    def model(self):
+        if self._model is None:
+            from langchain.chat_models import init_chat_model
+
+            self._model = init_chat_model(settings.BOT_MEMORY_SUMMARY_MODEL)
+        return self._model
+
+    async def _save(self, context: UserContext) -> None:
+        key = (context.bot_id, context.external_id)
+        try:
+            await self._write(context)
+        except Exception:
+            # The cached copy was already changed; reload it next time.
+            self._contexts.pop(key)
+            raise
+        self._contexts.set(key, (await self.version_stamp(*key).abump(), context))
+
+    async def _write(self, context: UserContext) -> None:
+        if context._state.adding:
+            try:
+                await context.asave()
+            except IntegrityError:
+                # Another process started this chat first; this exchange wins.
+                context.pk = await UserContext.objects.filter(
+                    bot_id=context.bot_id, external_id=context.external_id
+                ).values_list('pk', flat=True).aget()
+                context._state.adding = False
+                await context.asave()
+        else:
+            await context.asave(update_fields=['summary', 'turns', 'facts', 'user', 'updated_at'])
+
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0004_alter_bot_provider'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_duplicate_contexts(apps, schema_editor):
+    """Keep the latest context of every (bot, external_id) before it becomes unique"""
+    UserContext = apps.get_model('bots', 'UserContext')
+
+    duplicates = (
+        UserContext.objects.values('bot_id', 'external_id')
+        .annotate(count=models.Count('id'), keep=models.Max('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        UserContext.objects.filter(bot_id=duplicate['bot_id'], external_id=duplicate['external_id']).exclude(
+            pk=duplicate['keep']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0005_bot_is_active'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_contexts, migrations.RunPython.noop),
+        # Free-form context so far becomes the summary of the earlier conversation
+        migrations.RenameField(
+            model_name='usercontext',
+            old_name='context',
+            new_name='summary',
+        ),
+        migrations.AlterField(
+            model_name='usercontext',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='usercontext',
+            name='facts',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='usercontext',
+            name='turns',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='usercontext',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='usercontext',
+            constraint=models.UniqueConstraint(fields=('bot', 'external_id'), name='bots_usercontext_bot_external_id'),
+        ),
+    ]
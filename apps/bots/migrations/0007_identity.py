@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_known_users(apps, schema_editor):
+    """Chat memories already linked to a user give the first identities"""
+    UserContext = apps.get_model('bots', 'UserContext')
+    Identity = apps.get_model('bots', 'Identity')
+
+    linked = UserContext.objects.filter(user__isnull=False).values_list('bot_id', 'external_id', 'user_id')
+    Identity.objects.bulk_create(
+        [Identity(bot_id=bot_id, external_id=external_id, user_id=user_id) for bot_id, external_id, user_id in linked],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0006_usercontext_memory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Identity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identities', to='bots.bot')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bot_identities', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'identities',
+                'constraints': [models.UniqueConstraint(fields=('bot', 'external_id'), name='bots_identity_bot_external_id')],
+            },
+        ),
+        migrations.RunPython(link_known_users, migrations.RunPython.noop),
+    ]
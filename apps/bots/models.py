@@ -1,14 +1,40 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.functional import cached_property
 from telegrinder import Telegrinder, API, Token
 import threading
 import logging
 
+from .supervisor import bot_supervisor
+
 # Create your models here.
 
 logger = logging.getLogger(__name__)
 
+class BotQuerySet(models.QuerySet):
+    """
+    QuerySet that makes the bot supervisor reload after bulk writes.
+
+    bulk_create() and update(), which bulk_update() goes through, bypass
+    post_save, so they schedule the reload themselves once the write is
+    committed. update() also stamps updated_at, which tells the supervisor
+    which running bots to restart.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        transaction.on_commit(bot_supervisor.invalidate, using=self.db)
+        return objs
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        updated = super().update(**kwargs)
+        if updated:
+            transaction.on_commit(bot_supervisor.invalidate, using=self.db)
+        return updated
+
+
 class Bot(models.Model):
     PROVIDER_CHOICES = [
         ('telegram', 'Telegram'),
@@ -22,19 +48,55 @@ class Bot(models.Model):
     provider = models.CharField(max_length=255, choices=PROVIDER_CHOICES, default='telegram')
     api_key = models.CharField(max_length=255)
     description = models.TextField()
+    # Inactive bots are not run by the bot supervisor
+    is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BotQuerySet.as_manager()
+
     def __str__(self):
         return self.name
     
 class UserContext(models.Model):
+    """
+    Memory of one chat with a bot, kept within a token budget.
+
+    The latest turns are kept verbatim, older ones are folded into a
+    rolling summary, and facts pinned by the user are always remembered;
+    see bots.memory.
+    """
     bot = models.ForeignKey(Bot, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Set once the chat's messenger id is linked to a user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     external_id = models.CharField(max_length=255)
-    context = models.TextField()
+    summary = models.TextField(blank=True)
+    turns = models.JSONField(default=list, blank=True)
+    facts = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bot', 'external_id'], name='bots_usercontext_bot_external_id'),
+        ]
+
+    def __str__(self):
+        return f"{self.bot_id}:{self.external_id}"
+
+
+class Identity(models.Model):
+    """Links the id of a user on a bot's messenger to a Django user; see bots.identity"""
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name='identities')
+    external_id = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bot_identities')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'identities'
+        constraints = [
+            models.UniqueConstraint(fields=['bot', 'external_id'], name='bots_identity_bot_external_id'),
+        ]
+
     def __str__(self):
-        return self.user.username
+        return f"{self.bot_id}:{self.external_id} -> {self.user_id}"
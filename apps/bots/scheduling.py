@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import threading
+import weakref
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class _LoopRuns:
+    """Queues and concurrency limit of the chats served by one event loop"""
+
+    def __init__(self, max_concurrent: int):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.queues: Dict[Hashable, Deque[Job]] = {}
+        self.workers: Dict[Hashable, asyncio.Task] = {}
+        self.running = 0
+
+    def forget(self, key: Hashable, worker: asyncio.Task) -> None:
+        # A finished worker may already have been replaced by a new one.
+        if self.workers.get(key) is worker:
+            del self.workers[key]
+
+
+class ChatScheduler:
+    """
+    Runs bot jobs for many chats at once while keeping each chat in order.
+
+    Telegram updates are dispatched as independent tasks, so two messages
+    from the same chat would otherwise be answered concurrently and out of
+    order. submit() appends a job to its chat's queue and returns at once;
+    a worker task per busy chat runs that chat's jobs one by one and exits
+    when the queue is empty. At most max_concurrent jobs run at a time
+    across all chats of an event loop, and a chat with max_pending jobs
+    queued refuses new ones.
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_pending: Optional[int] = None):
+        self._max_concurrent = max_concurrent
+        self._max_pending = max_pending
+        self._loops: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopRuns]' = weakref.WeakKeyDictionary()
+        # Guards the queues against stats() readers on other threads
+        self._lock = threading.Lock()
+
+    @property
+    def max_concurrent(self) -> int:
+        return self._max_concurrent or settings.BOT_MAX_CONCURRENT_RUNS
+
+    @property
+    def max_pending(self) -> int:
+        return self._max_pending or settings.BOT_CHAT_MAX_PENDING
+
+    def submit(self, key: Hashable, job: Job) -> bool:
+        """
+        Queue a job behind the chat's earlier jobs.
+
+        Must be called from the event loop the job should run on.
+
+        Args:
+            key: Chat the job belongs to, e.g. '<bot id>:<chat id>'
+            job: Coroutine function to run
+
+        Returns:
+            False if the chat already has max_pending jobs and the job was
+            dropped, True otherwise
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            runs = self._loops.get(loop)
+            if runs is None:
+                runs = self._loops[loop] = _LoopRuns(self.max_concurrent)
+
+            queue = runs.queues.get(key)
+            if queue is None:
+                queue = runs.queues[key] = deque()
+                worker = runs.workers[key] = loop.create_task(self._work(runs, key, queue))
+                worker.add_done_callback(lambda task, key=key: runs.forget(key, task))
+            elif len(queue) >= self.max_pending:
+                return False
+            queue.append(job)
+        return True
+
+    def depth(self, key: Hashable) -> int:
+        """Jobs queued or running for one chat"""
+        with self._lock:
+            return sum(len(runs.queues.get(key, ())) for runs in self._loops.values())
+
+    async def adrain(self, prefix: str, timeout: float) -> None:
+        """
+        Wait for the jobs of the chats whose key starts with prefix.
+
+        Must be called from the event loop the jobs run on. Jobs still
+        running or queued after timeout seconds are cancelled.
+
+        Args:
+            prefix: Start of the chat keys, e.g. '<bot id>:'
+            timeout: Seconds to wait before cancelling
+        """
+        runs = self._loops.get(asyncio.get_running_loop())
+        if runs is None:
+            return
+        with self._lock:
+            workers = [worker for key, worker in runs.workers.items() if str(key).startswith(prefix)]
+        if not workers:
+            return
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        for worker in pending:
+            worker.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Running and queued job counts, with the depth of every busy chat"""
+        with self._lock:
+            depths = {key: len(queue) for runs in self._loops.values() for key, queue in runs.queues.items()}
+            running = sum(runs.running for runs in self._loops.values())
+        return {
+            'running': running,
+            'queued': sum(depths.values()) - running,
+            'max_concurrent': self.max_concurrent,
+            'max_pending': self.max_pending,
+            'chats': depths,
+        }
+
+    async def _work(self, runs: _LoopRuns, key: Hashable, queue: Deque[Job]) -> None:
+        while True:
+            with self._lock:
+                if not queue:
+                    del runs.queues[key]
+                    return
+                job = queue[0]
+
+            try:
+                async with runs.semaphore:
+                    runs.running += 1
+                    try:
+                        await job()
+                    finally:
+                        runs.running -= 1
+            except asyncio.CancelledError:
+                with self._lock:
+                    runs.queues.pop(key, None)
+                raise
+            except Exception:
+                logger.exception(f"Bot job for chat {key} failed")
+            finally:
+                with self._lock:
+                    if queue:
+                        queue.popleft()
+
+
+def merge_stats(*stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum the stats() of schedulers in several processes; None entries are skipped"""
+    stats = [entry for entry in stats if entry]
+    merged = {'running': 0, 'queued': 0, 'max_concurrent': None, 'max_pending': None, 'chats': {}}
+    for entry in stats:
+        merged['running'] += entry['running']
+        merged['queued'] += entry['queued']
+        merged['max_concurrent'] = merged['max_concurrent'] or entry['max_concurrent']
+        merged['max_pending'] = merged['max_pending'] or entry['max_pending']
+        for key, depth in entry['chats'].items():
+            merged['chats'][key] = merged['chats'].get(key, 0) + depth
+    return merged
+
+
+chat_scheduler = ChatScheduler()
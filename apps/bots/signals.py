@@ -0,0 +1,26 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .identity import identity_resolver
+from .supervisor import bot_supervisor
+from .telegram.webhook import webhook_receiver
+
+
+@receiver(post_save, sender='bots.Bot')
+@receiver(post_delete, sender='bots.Bot')
+def bot_changed(sender, instance, signal, **kwargs):
+    """Make the bot supervisor reload its bots once the change is committed"""
+    transaction.on_commit(bot_supervisor.invalidate)
+    if signal is post_delete or not instance.is_active:
+        transaction.on_commit(partial(webhook_receiver.discard, instance.pk))
+
+
+@receiver(post_save, sender='bots.Identity')
+@receiver(post_delete, sender='bots.Identity')
+def identity_changed(sender, created=False, **kwargs):
+    """Make every process forget cached identities once a link is changed or removed"""
+    if not created:
+        transaction.on_commit(identity_resolver.invalidate)
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Set
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from apps.caching import VersionStamp
+
+from .base_bot_controller import BaseBotController
+from .scheduling import chat_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Cache key of the status the serving supervisor publishes for other processes
+STATUS_KEY = 'bots:status'
+
+
+def telegram_controller(bot, supervisor: 'BotSupervisor') -> BaseBotController:
+    from .telegram.tg_bot_controller import TgBotController, build_dispatch
+
+    if supervisor.telegram_dispatch is None:
+        supervisor.telegram_dispatch = build_dispatch()
+    return TgBotController(bot, supervisor.telegram_dispatch)
+
+
+# Provider and the factory building a controller for one of its bots
+CONTROLLERS = {
+    'telegram': telegram_controller,
+}
+
+
+class BotSupervisor:
+    """
+    Runs every active Bot of a supported provider on one event loop.
+
+    Each bot is a task on the shared loop, so dozens of bots cost dozens of
+    long-poll requests, not dozens of threads and loops. The set of bots is
+    reloaded when the shared version stamp changes, which happens whenever a
+    Bot row is saved or deleted; new bots are started, removed or
+    deactivated ones stopped, and edited ones restarted, without touching
+    the rest. Bots can also be stopped, started and restarted one at a time,
+    from the loop or from any thread.
+
+    While serving, the supervisor publishes the health of its bots and its
+    chat queues to the shared cache, where the endpoints of other processes
+    read them. Both the version stamp and the status need REDIS_URL to
+    reach other processes; local memory caches are per process.
+    """
+
+    def __init__(self):
+        self.version_stamp = VersionStamp('bots:version')
+        self.controllers: Dict[int, BaseBotController] = {}
+        self.telegram_dispatch = None
+        self._versions: Dict[int, Any] = {}
+        self._paused: Set[int] = set()
+        self._version: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and not self._loop.is_closed()
+
+    def start(self) -> None:
+        """Run the supervisor's event loop in a background thread, unless it is already serving"""
+        with self._lock:
+            if self.running or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self.run, name='bot-supervisor', daemon=True)
+            self._thread.start()
+
+    def run(self) -> None:
+        """
+        Run the supervisor's event loop in this thread until shutdown().
+
+        Raises:
+            RuntimeError: If the supervisor is already serving
+        """
+        asyncio.run(self.serve())
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Stop every bot and the supervisor's loop, waiting for the thread started by start()"""
+        loop, stopping = self._loop, self._stopping
+        if loop is not None and stopping is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(stopping.set)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(settings.BOT_SHUTDOWN_TIMEOUT + 5 if timeout is None else timeout)
+
+    async def serve(self) -> None:
+        """
+        Supervise the bots on the running event loop until shutdown().
+
+        Raises:
+            RuntimeError: If the supervisor is already serving, on this loop
+                or another one, as both would receive the same updates
+        """
+        with self._lock:
+            if self.running:
+                raise RuntimeError('The bot supervisor is already running')
+            self._loop = asyncio.get_running_loop()
+        self._changed, self._stopping = asyncio.Event(), asyncio.Event()
+        publisher = None
+        try:
+            while not self._stopping.is_set():
+                self._changed.clear()
+                version = await self.version_stamp.acurrent()
+                if version != self._version:
+                    await self.reload()
+                    self._version = version
+                if publisher is None:
+                    publisher = asyncio.create_task(self._publish())
+
+                waiters = [asyncio.ensure_future(event.wait()) for event in (self._changed, self._stopping)]
+                await asyncio.wait(waiters, timeout=settings.BOT_RELOAD_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                for waiter in waiters:
+                    waiter.cancel()
+        finally:
+            if publisher is not None:
+                publisher.cancel()
+            await asyncio.gather(*(controller.stop() for controller in self.controllers.values()))
+            try:
+                await self.cache.adelete(STATUS_KEY)
+            except Exception as e:
+                logger.warning(f"Could not remove the bot status: {e}")
+            self.controllers.clear()
+            self._versions.clear()
+            self._version = None
+            self._loop = None
+
+    @property
+    def cache(self):
+        return self.version_stamp.cache
+
+    def invalidate(self) -> None:
+        """Make every supervisor reload its bots, this process's right away"""
+        self.version_stamp.bump()
+        loop, changed = self._loop, self._changed
+        if loop is not None and changed is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(changed.set)
+
+    async def reload(self) -> None:
+        """Start, stop and restart bots to match the active Bot rows"""
+        bots = await sync_to_async(self._active_bots)()
+        for bot_id in list(self.controllers):
+            if bot_id not in bots:
+                self._paused.discard(bot_id)
+                await self._stop(bot_id)
+        for bot_id, bot in bots.items():
+            if bot_id in self._paused:
+                continue
+            if bot_id in self.controllers and self._versions.get(bot_id) != bot.updated_at:
+                await self._stop(bot_id)
+            if bot_id not in self.controllers:
+                self._start(bot)
+
+    async def astart_bot(self, bot_id: int) -> bool:
+        """Start a stopped bot; False if it is not an active bot of a supported provider"""
+        self._paused.discard(bot_id)
+        controller = self.controllers.get(bot_id)
+        if controller is not None and controller.is_running:
+            return True
+        bot = (await sync_to_async(self._active_bots)(bot_id)).get(bot_id)
+        if bot is None:
+            return False
+        # A stopped or failed controller is rebuilt from the current row.
+        await self._stop(bot_id)
+        self._start(bot)
+        return True
+
+    async def astop_bot(self, bot_id: int) -> None:
+        """Stop a bot until astart_bot(); reloads leave it stopped"""
+        self._paused.add(bot_id)
+        await self._stop(bot_id)
+
+    async def arestart_bot(self, bot_id: int) -> bool:
+        """Stop a bot and start it again from its current row"""
+        await self._stop(bot_id)
+        return await self.astart_bot(bot_id)
+
+    def start_bot(self, bot_id: int) -> Future:
+        return self._submit(self.astart_bot(bot_id))
+
+    def stop_bot(self, bot_id: int) -> Future:
+        return self._submit(self.astop_bot(bot_id))
+
+    def restart_bot(self, bot_id: int) -> Future:
+        return self._submit(self.arestart_bot(bot_id))
+
+    def health(self) -> List[Dict[str, Any]]:
+        """Health of every bot the supervisor knows, stopped ones included"""
+        bots = []
+        for controller in list(self.controllers.values()):
+            health = controller.health()
+            health['paused'] = health['id'] in self._paused
+            bots.append(health)
+        return sorted(bots, key=lambda health: health['id'])
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Health of the bots and chat queues of the serving supervisor.
+
+        Read from this process if it serves the bots, otherwise from the
+        status the serving process publishes every BOT_STATUS_INTERVAL
+        seconds; a published status expires BOT_HEALTH_MAX_SILENCE seconds
+        after the process stopped publishing it.
+
+        Returns:
+            Dict with running, published_at, bots and queues, the latter
+            None when no supervisor is serving
+        """
+        if self.running:
+            return self._status()
+        return self.cache.get(STATUS_KEY) or {'running': False, 'published_at': None, 'bots': [], 'queues': None}
+
+    def _status(self) -> Dict[str, Any]:
+        return {'running': True, 'published_at': time.time(), 'bots': self.health(), 'queues': chat_scheduler.stats()}
+
+    async def _publish(self) -> None:
+        while True:
+            try:
+                await self.cache.aset(STATUS_KEY, self._status(), timeout=settings.BOT_HEALTH_MAX_SILENCE)
+            except Exception as e:
+                logger.warning(f"Could not publish the bot status: {e}")
+            await asyncio.sleep(settings.BOT_STATUS_INTERVAL)
+
+    def _active_bots(self, bot_id: Optional[int] = None) -> Dict[int, Any]:
+        from .models import Bot
+
+        bots = Bot.objects.filter(is_active=True, provider__in=CONTROLLERS)
+        if bot_id is not None:
+            bots = bots.filter(pk=bot_id)
+        return {bot.pk: bot for bot in bots}
+
+    def _start(self, bot) -> None:
+        try:
+            controller = CONTROLLERS[bot.provider](bot, self)
+        except Exception:
+            logger.exception(f"Could not set up bot {bot.name}")
+            return
+        self.controllers[bot.pk] = controller
+        self._versions[bot.pk] = bot.updated_at
+        controller.start()
+        logger.info(f"Started bot {bot.name}")
+
+    async def _stop(self, bot_id: int) -> None:
+        controller = self.controllers.pop(bot_id, None)
+        self._versions.pop(bot_id, None)
+        if controller is not None:
+            await controller.stop()
+            logger.info(f"Stopped bot {controller.bot_model.name}")
+            if bot_id in self._paused:
+                # Keep reporting paused bots
+                self.controllers[bot_id] = controller
+
+    def _submit(self, coroutine) -> Future:
+        if not self.running:
+            coroutine.close()
+            raise RuntimeError('The bot supervisor is not running')
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+
+bot_supervisor = BotSupervisor()
@@ -0,0 +1,64 @@
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+
+from apps.caching import VersionStamp
+
+
+class TelegramBot(NamedTuple):
+    pk: int
+    api_key: str
+
+
+class TelegramBotDirectory:
+    """
+    Active Telegram bots by primary key and by token.
+
+    Handlers only see the API a bot was fed with, and webhook requests
+    only carry the bot's primary key; both are resolved from a snapshot
+    that reloads when the shared bots version stamp changes, so a lookup
+    costs no query.
+    """
+
+    def __init__(self):
+        self.version_stamp = VersionStamp('bots:version')
+        self._version: Optional[int] = None
+        self._by_pk: Dict[int, TelegramBot] = {}
+        self._by_token: Dict[str, TelegramBot] = {}
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        """Drop this process's copy of the snapshot"""
+        with self._lock:
+            self._version = None
+
+    async def get(self, pk: int) -> Optional[TelegramBot]:
+        await self._refresh()
+        return self._by_pk.get(pk)
+
+    async def by_token(self, token: str) -> Optional[TelegramBot]:
+        await self._refresh()
+        return self._by_token.get(str(token))
+
+    async def _refresh(self) -> None:
+        version = await self.version_stamp.acurrent()
+        if version != self._version:
+            await sync_to_async(self._load)(version)
+
+    def _load(self, version: int) -> None:
+        from ..models import Bot
+
+        with self._lock:
+            if self._version == version:
+                return
+            bots = [
+                TelegramBot(pk, api_key)
+                for pk, api_key in Bot.objects.filter(provider='telegram', is_active=True).values_list('pk', 'api_key')
+            ]
+            self._by_pk = {bot.pk: bot for bot in bots}
+            self._by_token = {bot.api_key: bot for bot in bots}
+            self._version = version
+
+
+telegram_bots = TelegramBotDirectory()
@@ -7,7 +7,9 @@ import json
 import asyncio
 from typing import Dict, Set
 from telegrinder.rules import (
+    Argument,
     CallbackDataEq,
+    Command,
     FuzzyText,
     HasText,
     IsUpdateType,
@@ -15,12 +17,22 @@ from telegrinder.rules import (
     Text,
 )
 
-from ...bot_agent import BotAgent
+from django.conf import settings
+
+from ...bot_agent import BotAgent, user_tools
+from ...identity import identity_resolver
+from ...memory import conversation_memory
+from ...scheduling import chat_scheduler
+from ..directory import telegram_bots
+from ..streaming import StreamingReply, keep_typing
 bot_agent = BotAgent(
     name="telegram_bot",
     model="openai:gpt-4o-mini",
-    tools=[],
-    prompt="You are a helpful assistant",
+    tools=user_tools(),
+    prompt=(
+        "You are a helpful wellness assistant. Your tools read the goals, measurements "
+        "and progress of the user you are talking to; use them to answer about that user."
+    ),
 )
 
 # Global state for tracking typing tasks
@@ -39,22 +51,95 @@ async def handle_video(video_id: FileId[Video]) -> str:
 @dp.message(FuzzyText("hello"))
 async def hello(message: Message):
     await message.reply("Hi!")
-    
+
+
+async def chat_memory(message: Message):
+    """Memory of the message's chat, or None if the bot is not an active Bot row"""
+    bot = await telegram_bots.by_token(message.ctx_api.token)
+    if bot is None:
+        return None
+    return await conversation_memory.aget(bot.pk, message.chat.id)
+
+
+async def chat_user(message: Message):
+    """Django user id of the message's sender, created on their first message; None without an active Bot row"""
+    bot = await telegram_bots.by_token(message.ctx_api.token)
+    if bot is None:
+        return None
+    sender = message.from_user
+    return await identity_resolver.aresolve(
+        bot.pk,
+        sender.id,
+        provider='telegram',
+        first_name=sender.first_name,
+        last_name=sender.last_name.unwrap_or(''),
+    )
+
+
 @dp.message(Text("/clear"))
 async def clear_chat(message: Message):
     """Clear the conversation history for the user."""
-    user_id = message.from_user.id
-    # chat_manager.clear_conversation(user_id)
+    context = await chat_memory(message)
+    if context is not None:
+        await conversation_memory.aforget(context)
     await message.reply("Conversation history has been cleared!")
 
+
+@dp.message(Text("/forget"))
+async def forget_chat(message: Message):
+    """Clear the conversation history and the pinned facts."""
+    context = await chat_memory(message)
+    if context is not None:
+        await conversation_memory.aforget(context, facts=True)
+    await message.reply("I have forgotten everything you told me.")
+
+
+@dp.message(Command("remember", Argument("fact")))
+async def remember(message: Message, fact: str):
+    """Pin a fact that is sent with every later message of the chat."""
+    context = await chat_memory(message)
+    if context is None:
+        await message.reply("I can't remember things in this chat.")
+        return
+    await conversation_memory.apin(context, fact)
+    await message.reply("Got it, I'll remember that.")
+
+
 @dp.message(final=False)
 async def handle_all_chat_messages(message: Message): # Renamed for clarity
     user_text = message.text.unwrap()
-    user_id = message.from_user.id
     chat_id = message.chat.id
     
-    for response_chunk in bot_agent.get_chat_response(user_id, user_text, chat_id):
-        await message.answer(response_chunk)
+    async def reply():
+        typing_tasks[chat_id] = typing = asyncio.create_task(keep_typing(message.ctx_api, chat_id))
+        try:
+            user_id = await chat_user(message)
+            context = await chat_memory(message)
+            if context is not None and context.user_id is None and chat_id == message.from_user.id:
+                # A private chat's memory belongs to its one user
+                context.user_id = user_id
+            history = conversation_memory.history(context) if context is not None else None
+            answer, separator = [], ''
+            if settings.BOT_STREAM_REPLIES:
+                async with StreamingReply(message.ctx_api, chat_id) as streamed:
+                    async for token in bot_agent.astream_tokens(user_id, user_text, history):
+                        answer.append(token)
+                        await streamed.append(token)
+            else:
+                separator = '\n\n'
+                async for response_chunk in bot_agent.astream_response(user_id, user_text, history):
+                    answer.append(response_chunk)
+                    await message.answer(response_chunk)
+        finally:
+            typing.cancel()
+            if typing_tasks.get(chat_id) is typing:
+                del typing_tasks[chat_id]
+        if context is not None and answer:
+            await conversation_memory.arecord(context, user_text, separator.join(answer))
+    
+    # Answered in the background, after this chat's earlier messages
+    if not chat_scheduler.submit(f"{message.ctx_api.id}:{chat_id}", reply):
+        await message.reply("I'm still working on your earlier messages, please send this again in a moment.")
     
     # for response_chunk in chat_manager.get_chat_response(user_id, user_text, chat_id):
     #     await message.answer(response_chunk)
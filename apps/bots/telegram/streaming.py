@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from django.conf import settings
+from telegrinder import API
+from telegrinder.types.enums import ChatAction
+from telegrinder.types.objects import ReplyParameters
+
+logger = logging.getLogger(__name__)
+
+# Longest text of a single Telegram message
+MESSAGE_LIMIT = 4096
+PLACEHOLDER = '…'
+FAILED = 'Sorry, something went wrong. Please try again.'
+# Telegram shows a chat action for about five seconds
+TYPING_INTERVAL = 4
+
+
+def split_point(text: str, limit: int = MESSAGE_LIMIT) -> int:
+    """
+    Where to cut text so the first part fits in one message.
+
+    Prefers the last paragraph break, then line break, then space within
+    the limit, as long as that keeps at least half of the limit; otherwise
+    cuts at the limit itself.
+    """
+    if len(text) <= limit:
+        return len(text)
+    for separator in ('\n\n', '\n', ' '):
+        cut = text.rfind(separator, 0, limit + 1)
+        if cut >= limit // 2:
+            return cut
+    return limit
+
+
+async def keep_typing(api: API, chat_id: int) -> None:
+    """Show the typing indicator in a chat until cancelled"""
+    while True:
+        try:
+            await api.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+        except Exception as e:
+            logger.debug(f"Typing indicator for chat {chat_id} failed: {e}")
+        await asyncio.sleep(TYPING_INTERVAL)
+
+
+class StreamingReply:
+    """
+    A Telegram answer written in place while the model generates it.
+
+    Entering the context sends a placeholder message; text passed to
+    append() is then shown by editing that message. Edits are coalesced:
+    one is made at most every edit_interval seconds, and only once
+    edit_min_chars new characters arrived, so a fast model costs a handful
+    of API calls rather than one per token. A 429 answer pushes edits back
+    by its retry_after. Text beyond the 4096 character limit is cut at a
+    paragraph, line or word break and continues in a new message. Leaving
+    the context writes the rest of the text, or an apology if the run failed
+    before producing any.
+    """
+
+    def __init__(
+        self,
+        api: API,
+        chat_id: int,
+        reply_to: Optional[int] = None,
+        edit_interval: Optional[float] = None,
+        edit_min_chars: Optional[int] = None,
+    ):
+        self.api = api
+        self.chat_id = chat_id
+        self.reply_to = reply_to
+        self.edit_interval = settings.BOT_STREAM_EDIT_INTERVAL if edit_interval is None else edit_interval
+        self.edit_min_chars = settings.BOT_STREAM_EDIT_MIN_CHARS if edit_min_chars is None else edit_min_chars
+        self.message_ids: List[int] = []
+        # Full text of the last message, and the part of it Telegram shows
+        self._text = ''
+        self._shown = ''
+        self._next_edit = 0.0
+        self._retry_at = 0.0
+
+    async def __aenter__(self) -> 'StreamingReply':
+        await self._send(PLACEHOLDER, reply_to=self.reply_to)
+        self._next_edit = time.monotonic() + self.edit_interval
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None and not self._text.strip():
+            self._text = FAILED
+        if self._text.strip():
+            await self._flush()
+        else:
+            await self.api.delete_message(chat_id=self.chat_id, message_id=self.message_ids.pop())
+
+    async def append(self, text: str) -> None:
+        """Add generated text, editing the message if the thresholds are met"""
+        self._text += text
+        while len(self._text) > MESSAGE_LIMIT:
+            cut = split_point(self._text)
+            rest = self._text[cut:].lstrip()
+            self._text = self._text[:cut].rstrip()
+            await self._flush()
+            await self._send(PLACEHOLDER)
+            self._text = rest
+
+        now = time.monotonic()
+        if len(self._text) - len(self._shown) >= self.edit_min_chars and now >= max(self._next_edit, self._retry_at):
+            await self._edit()
+
+    async def _flush(self) -> None:
+        """Show the complete text of the current message, waiting out rate limits"""
+        for _ in range(3):
+            delay = self._retry_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if await self._edit():
+                return
+
+    async def _send(self, text: str, reply_to: Optional[int] = None) -> None:
+        result = await self.api.send_message(
+            chat_id=self.chat_id,
+            text=text,
+            reply_parameters=ReplyParameters(message_id=reply_to) if reply_to else None,
+        )
+        self.message_ids.append(result.unwrap().message_id)
+        self._shown = ''
+
+    async def _edit(self) -> bool:
+        """Edit the current message to show its text; False if it should be retried"""
+        if self._text == self._shown:
+            return True
+        text = self._text
+        result = await self.api.edit_message_text(chat_id=self.chat_id, message_id=self.message_ids[-1], text=text)
+        now = time.monotonic()
+        if not result:
+            error = result.error
+            retry_after = error.parameters.get('retry_after') if hasattr(error, 'parameters') else None
+            if retry_after:
+                self._retry_at = now + retry_after
+                return False
+            if 'message is not modified' not in str(error):
+                logger.warning(f"Could not update the reply in chat {self.chat_id}: {error}")
+        self._shown = text
+        self._next_edit = now + self.edit_interval
+        return True
@@ -1,85 +1,147 @@
 # bots/bot_controller.py
 from ..base_bot_controller import BaseBotController
-from telegrinder import Telegrinder, API, Token
-import threading
-import logging
-import atexit
+from django.conf import settings
+from telegrinder import API, Dispatch, Token
+from telegrinder.api.error import APIError
+from telegrinder.bot.polling import Polling
 import asyncio
+import logging
+import time
+from ..scheduling import chat_scheduler
 from .handlers import dps
+from .webhook import webhook_secret, webhook_url
 
 logger = logging.getLogger(__name__)
 
+# Seconds before registering a webhook again after a failure
+RETRY_AFTER = 5
+
+
+def build_dispatch() -> Dispatch:
+    """One Dispatch with every Telegram handler; it is shared by all bots, which pass their own API when feeding it"""
+    dispatch = Dispatch()
+    for dp in dps:
+        logger.info(f"Loading handler {dp}")
+        dispatch.load(dp)
+    return dispatch
+
+
+class MonitoredPolling(Polling):
+    """Long polling that reports every completed getUpdates call, empty ones included"""
+
+    def __init__(self, api: API, on_poll, **kwargs):
+        super().__init__(api, **kwargs)
+        self.on_poll = on_poll
+
+    async def get_updates(self):
+        updates = await super().get_updates()
+        self.on_poll()
+        return updates
+
+
 class TgBotController(BaseBotController):
-    def __init__(self, bot_model):
-        self.bot_task = None
-        self.bot_model = bot_model
-        self.client = Telegrinder(API(token=Token(bot_model.api_key)))
-        self.thread = None
-        self.bot_lock = threading.Lock()
-        self.is_running = False
-        atexit.register(self.stop)
+    def __init__(self, bot_model, dispatch: Dispatch):
+        super().__init__(bot_model)
+        self.dispatch = dispatch
+        self.api = None
+        self.polling = None
+        self.delivery = settings.BOT_DELIVERY
+        self.pending_updates = None
+        self.handler_tasks = set()
         logger.info(f"BotController initialized for {bot_model.name}")
 
-    def start(self):
-        """Initialize the bot and start it in a separate thread."""
-        
-        with self.bot_lock:
-            if self.is_running:
-                logger.warning("Bot is already running, skipping initialization")
-                return
-            
-            logger.info("Initializing bot...")
-            
-            # Register all telegram handlers
-            for dp in dps:
-                logger.info(f"Loading handler {dp}")
-                self.client.dispatch.load(dp)
-            
-            # Start bot in a separate thread
-            self.thread = threading.Thread(target=self.run, daemon=True)
-            self.thread.start()
-            self.is_running = True
-            logger.info("Bot started in background thread")
-
-    def stop(self):
-        """Stop the bot gracefully."""
-        
-        with self.bot_lock:
-            if not self.is_running:
-                logger.info("Bot is not running, nothing to stop")
-                return
-            
-            logger.info("Stopping bot...")
-            
-            if self.bot_task:
-                self.bot_task.cancel()
-                self.bot_task = None
-            
-            if self.thread and self.thread.is_alive():
-                self.thread.join(timeout=5)
-                self.thread = None
-            
-            self.is_running =  False
-            logger.info("Bot stopped")
-
-    def run(self):
-        """Run the bot in a separate thread."""
-        logger.info("Starting bot thread")
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
+    async def run(self):
+        """Receive updates by long polling or through the webhook, as BOT_DELIVERY selects."""
+        self.api = API(token=Token(self.bot_model.api_key))
+        if self.delivery == 'webhook':
+            await self.watch_webhook()
+        else:
+            await self.poll()
+
+    async def poll(self):
+        """Long poll Telegram and feed every update to the dispatch as its own task."""
         try:
-            self.bot_task = loop.create_task(self.client.run_forever())
-            logger.info("Bot task created and running")
-            loop.run_forever()
+            # getUpdates is refused while a webhook is set
+            if (await self.api.get_webhook_info()).unwrap().url:
+                (await self.api.delete_webhook()).unwrap()
         except Exception as e:
-            logger.error(f"Error in bot thread: {e}")   
-            self.is_running = False
-        finally:
-            loop.close()
-            self.is_running = False
-            logger.info("Bot thread stopped")
-    
+            logger.warning(f"Could not check the webhook of {self.bot_model.name}: {e}")
+
+        self.polling = MonitoredPolling(self.api, self.record_poll, timeout=settings.BOT_POLLING_TIMEOUT)
+        logger.info(f"Polling updates for {self.bot_model.name}")
+
+        loop = asyncio.get_running_loop()
+        async for updates in self.polling.listen():
+            for update in updates:
+                sent_at = getattr(update.incoming_update, 'date', None)
+                self.record_update(sent_at.timestamp() if sent_at else None)
+                task = loop.create_task(self.dispatch.feed(update, self.api))
+                self.handler_tasks.add(task)
+                task.add_done_callback(self.handler_tasks.discard)
+
+    async def watch_webhook(self):
+        """
+        Register the bot's webhook and keep checking its delivery state.
+
+        Updates themselves arrive at the telegram_webhook view of the ASGI
+        app. Every BOT_POLLING_TIMEOUT seconds Telegram's webhook info is
+        read for the pending update count and the last delivery error, and
+        the webhook is registered again if something replaced it.
+        """
+        url = webhook_url(self.bot_model.pk)
+        registered = False
+        while True:
+            try:
+                if not registered:
+                    (await self.api.set_webhook(
+                        url=url,
+                        secret_token=webhook_secret(self.bot_model.pk, self.bot_model.api_key),
+                        allowed_updates=Polling.get_allowed_updates(),
+                    )).unwrap()
+                    logger.info(f"Webhook of {self.bot_model.name} set to {url}")
+                info = (await self.api.get_webhook_info()).unwrap()
+            except APIError as e:
+                if e.code in (401, 404):
+                    raise
+                logger.warning(f"Webhook of {self.bot_model.name}: {e}")
+                self.error = str(e)
+            except Exception as e:
+                logger.warning(f"Webhook of {self.bot_model.name}: {e}")
+                self.error = str(e)
+            else:
+                self.record_poll()
+                self.pending_updates = info.pending_update_count
+                self.error = info.last_error_message.unwrap_or('')
+                registered = info.url == url
+            await asyncio.sleep(settings.BOT_POLLING_TIMEOUT if registered else RETRY_AFTER)
+
+    async def close(self):
+        if self.polling is not None:
+            self.polling.stop()
+        if self.api is not None:
+            # Replies in flight still need the session; give them
+            # BOT_SHUTDOWN_TIMEOUT seconds before cancelling them.
+            deadline = time.monotonic() + settings.BOT_SHUTDOWN_TIMEOUT
+            if self.handler_tasks:
+                _, pending = await asyncio.wait(list(self.handler_tasks), timeout=settings.BOT_SHUTDOWN_TIMEOUT)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            await chat_scheduler.adrain(f"{self.api.id}:", max(0.0, deadline - time.monotonic()))
+            if self.delivery == 'webhook':
+                # Telegram keeps updates for stopped bots until their webhook is set again.
+                try:
+                    await self.api.delete_webhook()
+                except Exception as e:
+                    logger.warning(f"Could not remove the webhook of {self.bot_model.name}: {e}")
+            await self.api.http.close()
+            self.api = None
+
+    def health(self):
+        health = super().health()
+        health['delivery'] = self.delivery
+        health['pending_updates'] = self.pending_updates
+        return health
+
     def __str__(self):
-        return f"BotController for {self.bot_model.name}"
\ No newline at end of file
+        return f"BotController for {self.bot_model.name}"
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import reverse
+from telegrinder import API, Token
+from telegrinder.msgspec_utils import decoder
+from telegrinder.types.objects import Update
+
+from apps.caching import LRUCache
+
+from .directory import TelegramBot, telegram_bots
+
+logger = logging.getLogger(__name__)
+
+# Header Telegram sends the webhook's secret_token in
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def webhook_secret(bot_id: int, api_key: str) -> str:
+    """
+    Secret token Telegram sends with every webhook request of a bot.
+
+    Derived from SECRET_KEY and the bot's token, so nothing has to be stored
+    and rotating the bot token also rotates the secret.
+    """
+    message = f'telegram-webhook:{bot_id}:{api_key}'.encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def webhook_url(bot_id: int) -> str:
+    """Public URL Telegram delivers a bot's updates to"""
+    if not settings.BOT_WEBHOOK_BASE_URL:
+        raise ImproperlyConfigured('BOT_WEBHOOK_BASE_URL is required for webhook delivery')
+    return settings.BOT_WEBHOOK_BASE_URL.rstrip('/') + reverse('bots:telegram_webhook', args=[bot_id])
+
+
+class WebhookReceiver:
+    """
+    Feeds webhook updates to the Telegram handlers of this process.
+
+    Bots are looked up in the Telegram bot directory, so accepting an
+    update costs no query. Updates are decoded and checked in the request,
+    then dispatched in a background task on the serving event loop, so
+    Telegram gets its answer before any handler runs. Update ids seen
+    recently are remembered to drop Telegram's redeliveries.
+
+    Each bot gets one API client, whose HTTP session is closed when the
+    bot's token changes, when the bot is deactivated or deleted, and on
+    server shutdown.
+    """
+
+    def __init__(self):
+        self._apis: Dict[int, API] = {}
+        self._dispatch = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seen = LRUCache(10000)
+        self._tasks: set = set()
+
+    def clear(self) -> None:
+        """Forget the update ids seen so far"""
+        self._seen.clear()
+
+    def discard(self, bot_id: int) -> None:
+        """Close the API client of a bot that no longer takes updates; safe to call from any thread"""
+        api = self._apis.pop(bot_id, None)
+        loop = self._loop
+        if api is not None and loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(api.http.close(), loop)
+
+    async def close(self) -> None:
+        """
+        Let the updates in flight finish, then close every API client.
+
+        Handlers get BOT_SHUTDOWN_TIMEOUT seconds before they are cancelled.
+        """
+        if self._tasks:
+            _, pending = await asyncio.wait(list(self._tasks), timeout=settings.BOT_SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        apis, self._apis = list(self._apis.values()), {}
+        await asyncio.gather(*(api.http.close() for api in apis), return_exceptions=True)
+
+    async def bot(self, bot_id: int) -> Optional[TelegramBot]:
+        """An active Telegram bot"""
+        bot = await telegram_bots.get(bot_id)
+        if bot is None:
+            # Deactivated or deleted, possibly by another process
+            self.discard(bot_id)
+        return bot
+
+    def verify(self, bot: TelegramBot, secret: str) -> bool:
+        return hmac.compare_digest(webhook_secret(bot.pk, bot.api_key), secret or '')
+
+    def accept(self, bot_id: int, bot: TelegramBot, body: bytes) -> bool:
+        """
+        Decode an update and dispatch it in the background.
+
+        Returns:
+            False if the update was already accepted
+
+        Raises:
+            msgspec.DecodeError: If the body is not a Telegram update
+        """
+        update = decoder.decode(body, type=Update)
+        if (bot_id, update.update_id) in self._seen:
+            return False
+        self._seen.set((bot_id, update.update_id), True)
+
+        self._loop = asyncio.get_running_loop()
+        task = self._loop.create_task(self._feed(update, self._api(bot_id, bot)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _feed(self, update: Update, api: API) -> None:
+        try:
+            await self.dispatch.feed(update, api)
+        except Exception:
+            logger.exception(f"Webhook update {update.update_id} failed")
+
+    @property
+    def dispatch(self):
+        if self._dispatch is None:
+            from .tg_bot_controller import build_dispatch
+
+            self._dispatch = build_dispatch()
+        return self._dispatch
+
+    def _api(self, bot_id: int, bot: TelegramBot) -> API:
+        api = self._apis.get(bot_id)
+        if api is not None and api.token != bot.api_key:
+            self.discard(bot_id)
+            api = None
+        if api is None:
+            api = self._apis[bot_id] = API(token=Token(bot.api_key))
+        return api
+
+
+webhook_receiver = WebhookReceiver()
+
@@ -1,3 +1,776 @@
-from django.test import TestCase
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from fntypes import Some
+from fntypes.co import Error, Ok
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from telegrinder.api.error import APIError
+
+from apps.caching import VersionStamp
+
+from .base_bot_controller import BaseBotController
+from .bot_agent import BotAgent, user_scoped_tool, user_tools
+from .identity import IdentityResolver
+from .lifespan import BotLifespan
+from .memory import ConversationMemory
+from .models import Bot, Identity, UserContext
+from .scheduling import ChatScheduler, chat_scheduler
+from .supervisor import BotSupervisor, bot_supervisor
+from .telegram.streaming import MESSAGE_LIMIT, PLACEHOLDER, StreamingReply, split_point
+from .telegram.directory import telegram_bots
+from .telegram.tg_bot_controller import TgBotController
+from .telegram.webhook import SECRET_HEADER, webhook_receiver, webhook_secret, webhook_url
+
+
+async def committed(test, write):
+    """Run a database write in a sync thread as if its transaction committed, on_commit callbacks included"""
+    def run():
+        with test.captureOnCommitCallbacks(execute=True):
+            return write()
+    return await sync_to_async(run)()
+
+
+class FakeGraph:
+    """Stands in for a compiled graph, replaying a fixed astream() output"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    async def astream(self, inputs, config=None, stream_mode=None):
+        self.inputs, self.config = inputs, config
+        for output in self.outputs:
+            await asyncio.sleep(0)
+            yield output
+
+
+class ChatSchedulerTests(TestCase):
+    def setUp(self):
+        self.scheduler = ChatScheduler(max_concurrent=2, max_pending=3)
+        self.log = []
+
+    def job(self, chat, number, delay=0.01):
+        async def run():
+            self.log.append(('start', chat, number))
+            await asyncio.sleep(delay)
+            self.log.append(('end', chat, number))
+        return run
+
+    async def drain(self):
+        while self.scheduler.stats()['chats']:
+            await asyncio.sleep(0.005)
+
+    async def test_chats_run_in_order(self):
+        for number in range(3):
+            self.assertTrue(self.scheduler.submit('1:a', self.job('a', number, delay=0.03 - number * 0.01)))
+        self.scheduler.submit('1:b', self.job('b', 0))
+
+        self.assertEqual(self.scheduler.depth('1:a'), 3)
+        await self.drain()
+
+        chat_a = [entry for entry in self.log if entry[1] == 'a']
+        self.assertEqual(chat_a, [(event, 'a', n) for n in range(3) for event in ('start', 'end')])
+        # Chat b did not wait for chat a.
+        self.assertLess(self.log.index(('end', 'b', 0)), self.log.index(('end', 'a', 0)))
+
+    async def test_concurrency_is_capped(self):
+        running = []
+
+        def job():
+            async def run():
+                running.append(self.scheduler.stats()['running'])
+                await asyncio.sleep(0.01)
+            return run
+
+        for chat in range(5):
+            self.scheduler.submit(f'1:{chat}', job())
+        await asyncio.sleep(0)
+
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['running'], stats['queued']), (2, 3))
+        await self.drain()
+        self.assertEqual(len(running), 5)
+        self.assertLessEqual(max(running), 2)
+
+    async def test_full_chat_refuses_jobs(self):
+        for number in range(3):
+            self.assertTrue(self.scheduler.submit('1:a', self.job('a', number)))
+        self.assertFalse(self.scheduler.submit('1:a', self.job('a', 3)))
+
+        await self.drain()
+        self.assertEqual(self.scheduler.depth('1:a'), 0)
+
+    async def test_failed_job_does_not_stop_the_chat(self):
+        async def fail():
+            raise RuntimeError('model unavailable')
+
+        with self.assertLogs('bots.scheduling', 'ERROR'):
+            self.scheduler.submit('1:a', fail)
+            self.scheduler.submit('1:a', self.job('a', 1))
+            await self.drain()
+
+        self.assertEqual(self.log, [('start', 'a', 1), ('end', 'a', 1)])
+
+    def test_stats_endpoint(self):
+        response = self.client.get(reverse('bots:chat_queue_stats'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['chats'], {})
+        self.assertEqual(response.json()['max_concurrent'], chat_scheduler.max_concurrent)
+
+
+class BotAgentTests(TestCase):
+    async def test_streams_model_replies(self):
+        agent = BotAgent.__new__(BotAgent)
+        tool_call = {'id': 'call-1', 'name': 'get_user_goals', 'args': {}}
+        agent.graph = FakeGraph([
+            {'agent': {'messages': [AIMessage(content='', tool_calls=[tool_call])]}},
+            {'tools': {'messages': [ToolMessage(content='[]', tool_call_id='call-1', name='get_user_goals')]}},
+            {'agent': {'messages': [AIMessage(content='You have no goals.')]}},
+        ])
+
+        replies = [reply async for reply in agent.astream_response(1, 'goals?')]
+
+        self.assertEqual(replies, ['You have no goals.'])
+
+    async def test_streams_model_tokens(self):
+        agent = BotAgent.__new__(BotAgent)
+        agent.graph = FakeGraph([
+            ('messages', (AIMessageChunk(content='You have '), {})),
+            ('messages', (AIMessageChunk(content='no goals.'), {})),
+        ])
+
+        tokens = [token async for token in agent.astream_tokens(1, 'goals?')]
+
+        self.assertEqual(tokens, ['You have ', 'no goals.'])
+
+    async def test_history_precedes_the_message(self):
+        agent = BotAgent.__new__(BotAgent)
+        agent.graph = FakeGraph([])
+        history = [{'role': 'user', 'content': 'I am vegan'}, {'role': 'assistant', 'content': 'Noted.'}]
+
+        [reply async for reply in agent.astream_response(1, 'dinner?', history)]
+
+        self.assertEqual(agent.graph.inputs['messages'], [*history, {'role': 'user', 'content': 'dinner?'}])
+
+    async def test_runs_carry_the_chat_user(self):
+        agent = BotAgent.__new__(BotAgent)
+        agent.graph = FakeGraph([])
+
+        [token async for token in agent.astream_tokens(7, 'goals?')]
+        self.assertEqual(agent.graph.config, {'configurable': {'user_id': 7}})
+        [reply async for reply in agent.astream_response(8, 'goals?')]
+        self.assertEqual(agent.graph.config, {'configurable': {'user_id': 8}})
+
+    def test_tools_are_scoped_to_the_chat_user(self):
+        def goals_of_type(user_id: int, goal_type: str):
+            """
+            Goals of one type.
+
+            Args:
+                user_id: The ID of the user
+                goal_type: Type of goal
+            """
+            return [user_id, goal_type]
+
+        tool = user_scoped_tool(goals_of_type)
+        config = {'configurable': {'user_id': 7}}
+
+        self.assertEqual(list(tool.args), ['goal_type'])
+        self.assertNotIn('user_id', tool.description)
+        # A user id written by the model is ignored
+        self.assertEqual(tool.invoke({'goal_type': 'weight', 'user_id': 99}, config=config), [7, 'weight'])
+        self.assertIn('error', tool.invoke({'goal_type': 'weight'}))
+
+        tools = {tool.name: tool for tool in user_tools()}
+        self.assertIn('get_user_progress_summary', tools)
+        self.assertIn('search_ingredients', tools)
+        self.assertFalse(any('user_id' in tool.args for tool in tools.values()))
+
+
+class FakeTelegramAPI:
+    """Records the Bot API calls of a streamed reply"""
+
+    def __init__(self, edit_results=()):
+        self.messages = {}
+        self.calls = []
+        self.edit_results = list(edit_results)
+
+    async def send_message(self, chat_id, text, reply_parameters=None):
+        message_id = len(self.messages) + 1
+        self.messages[message_id] = text
+        self.calls.append(('send', message_id, text))
+        return Ok(SimpleNamespace(message_id=message_id))
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.calls.append(('edit', message_id, text))
+        if self.edit_results:
+            return self.edit_results.pop(0)
+        self.messages[message_id] = text
+        return Ok(True)
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(('delete', message_id))
+        del self.messages[message_id]
+        return Ok(True)
+
+
+class StreamingReplyTests(TestCase):
+    def edits(self, api):
+        return [call for call in api.calls if call[0] == 'edit']
+
+    async def test_edits_are_coalesced(self):
+        api = FakeTelegramAPI()
+
+        async with StreamingReply(api, 7, edit_interval=0, edit_min_chars=10) as answer:
+            await answer.append('Hello')
+            self.assertEqual(self.edits(api), [])
+            await answer.append(' there, ')
+            await answer.append('friend')
+            self.assertEqual(self.edits(api), [('edit', 1, 'Hello there, ')])
+
+        self.assertEqual(api.calls[0], ('send', 1, PLACEHOLDER))
+        self.assertEqual(api.messages, {1: 'Hello there, friend'})
+        self.assertEqual(len(self.edits(api)), 2)
+
+    async def test_edits_wait_for_the_interval(self):
+        api = FakeTelegramAPI()
+
+        async with StreamingReply(api, 7, edit_interval=60, edit_min_chars=1) as answer:
+            for token in ('a', 'b', 'c'):
+                await answer.append(token)
+            self.assertEqual(self.edits(api), [])
+
+        self.assertEqual(self.edits(api), [('edit', 1, 'abc')])
+
+    async def test_long_answers_are_split(self):
+        api = FakeTelegramAPI()
+        words = ' '.join(f'word{number}' for number in range(1000))
+
+        async with StreamingReply(api, 7, edit_interval=0, edit_min_chars=500) as answer:
+            for start in range(0, len(words), 100):
+                await answer.append(words[start:start + 100])
+
+        self.assertEqual(len(api.messages), 2)
+        first, second = api.messages.values()
+        self.assertLessEqual(len(first), MESSAGE_LIMIT)
+        self.assertEqual(f'{first} {second}', words)
+
+    async def test_rate_limit_postpones_edits(self):
+        limited = Error(APIError(429, 'Too Many Requests: retry after 30', {'retry_after': 30}))
+        api = FakeTelegramAPI(edit_results=[limited])
+
+        with mock.patch('bots.telegram.streaming.asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            async with StreamingReply(api, 7, edit_interval=0, edit_min_chars=1) as answer:
+                await answer.append('a')
+                await answer.append('b')
+                self.assertEqual(len(self.edits(api)), 1)
+
+        self.assertAlmostEqual(sleep.await_args.args[0], 30, delta=1)
+        self.assertEqual(api.messages, {1: 'ab'})
+
+    async def test_empty_answer_removes_the_placeholder(self):
+        api = FakeTelegramAPI()
+
+        async with StreamingReply(api, 7):
+            pass
+
+        self.assertEqual(api.messages, {})
+
+    async def test_failed_run_apologizes(self):
+        api = FakeTelegramAPI()
+
+        with self.assertRaises(RuntimeError):
+            async with StreamingReply(api, 7):
+                raise RuntimeError('model unavailable')
+
+        self.assertTrue(api.messages[1].startswith('Sorry'))
+
+    def test_split_point(self):
+        self.assertEqual(split_point('short'), 5)
+        text = 'a' * 3000 + '\n\n' + 'b' * 500 + ' ' + 'c' * 1000
+        self.assertEqual(split_point(text), 3000)
+        self.assertEqual(split_point('x' * 5000), MESSAGE_LIMIT)
+
+
+class FakeController(BaseBotController):
+    """Runs until stopped, or fails right away like polling with an invalid token"""
+
+    async def run(self):
+        if self.bot_model.api_key == 'invalid':
+            raise SystemExit(3)
+        self.record_update(sent_at=self.started_at - 2)
+        await asyncio.Event().wait()
+
+
+class BotSupervisorTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(
+            'bots.supervisor.CONTROLLERS', {'telegram': lambda bot, supervisor: FakeController(bot)}, clear=True,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.supervisor = BotSupervisor()
+        # Committed Bot writes reach this supervisor like the process-wide one
+        patcher = mock.patch.object(bot_supervisor, 'invalidate', self.supervisor.invalidate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @asynccontextmanager
+    async def serving(self):
+        task = asyncio.create_task(self.supervisor.serve())
+        try:
+            await self.settle()
+            yield
+        finally:
+            self.supervisor.shutdown()
+            await task
+
+    async def settle(self):
+        """Give the supervisor time to reload and its bots time to start"""
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if not self.supervisor._changed.is_set():
+                break
+        await asyncio.sleep(0.01)
+
+    def statuses(self):
+        return {health['name']: health['status'] for health in self.supervisor.health()}
+
+    async def create_bot(self, name, **kwargs):
+        return await Bot.objects.acreate(name=name, api_key=f'1:{name}', description='', **kwargs)
+
+    async def test_reload_follows_bot_rows(self):
+        first = await self.create_bot('first')
+        second = await self.create_bot('second')
+        await self.create_bot('sleeping', is_active=False)
+        await self.create_bot('other', provider='whatsapp')
+        async with self.serving():
+            self.assertEqual(self.statuses(), {'first': 'running', 'second': 'running'})
+            untouched = self.supervisor.controllers[first.pk]
+
+            second.name = 'renamed'
+            await committed(self, second.save)
+            await committed(self, lambda: Bot.objects.create(name='third', api_key='1:third', description=''))
+            await self.settle()
+
+            self.assertEqual(self.statuses(), {'first': 'running', 'renamed': 'running', 'third': 'running'})
+            self.assertIs(self.supervisor.controllers[first.pk], untouched)
+
+            await committed(self, lambda: Bot.objects.filter(pk=first.pk).update(is_active=False))
+            await self.settle()
+            self.assertEqual(self.statuses(), {'renamed': 'running', 'third': 'running'})
+
+            renamed = self.supervisor.controllers[second.pk]
+            await committed(self, lambda: Bot.objects.bulk_create([Bot(name='fourth', api_key='1:4', description='')]))
+            await committed(self, lambda: Bot.objects.filter(pk=second.pk).update(api_key='1:rotated'))
+            await self.settle()
+            self.assertEqual(self.statuses(), {'renamed': 'running', 'third': 'running', 'fourth': 'running'})
+            # The edited bot was restarted with its new token
+            self.assertIsNot(self.supervisor.controllers[second.pk], renamed)
+
+    async def test_bots_are_controlled_one_at_a_time(self):
+        first = await self.create_bot('first')
+        second = await self.create_bot('second')
+        async with self.serving():
+            await self.supervisor.astop_bot(first.pk)
+            self.supervisor.invalidate()
+            await self.settle()
+            self.assertEqual(self.statuses(), {'first': 'stopped', 'second': 'running'})
+
+            restarted = self.supervisor.controllers[second.pk]
+            self.assertTrue(await self.supervisor.arestart_bot(second.pk))
+            self.assertIsNot(self.supervisor.controllers[second.pk], restarted)
+
+            self.assertTrue(await self.supervisor.astart_bot(first.pk))
+            await self.settle()
+            self.assertEqual(self.statuses(), {'first': 'running', 'second': 'running'})
+            self.assertFalse(await self.supervisor.astart_bot(999))
+
+    async def test_failing_bot_is_isolated(self):
+        await self.create_bot('healthy')
+        await Bot.objects.acreate(name='broken', api_key='invalid', description='')
+        with self.assertLogs('bots.base_bot_controller', 'ERROR'):
+            async with self.serving():
+                health = {bot['name']: bot for bot in self.supervisor.health()}
+
+        self.assertEqual(health['broken']['status'], 'failed')
+        self.assertEqual(health['broken']['error'], 'Exited with code 3')
+        self.assertFalse(health['broken']['healthy'])
+        self.assertTrue(health['healthy']['healthy'])
+        self.assertEqual(health['healthy']['updates'], 1)
+        self.assertAlmostEqual(health['healthy']['update_lag_seconds'], 2, delta=1)
+
+    async def test_serving_twice_is_refused(self):
+        async with self.serving():
+            with self.assertRaisesMessage(RuntimeError, 'already running'):
+                await self.supervisor.serve()
+            # The running supervisor is left alone
+            self.assertTrue(self.supervisor.running)
+            self.supervisor.start()
+            self.assertIsNone(self.supervisor._thread)
+
+    @override_settings(BOTS_AUTOSTART=True)
+    async def test_bots_start_with_the_asgi_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with mock.patch('bots.lifespan.bot_supervisor') as supervisor, \
+                mock.patch('bots.lifespan.webhook_receiver') as receiver:
+            receiver.close = mock.AsyncMock()
+            await BotLifespan(mock.AsyncMock())({'type': 'lifespan'}, receive, send)
+
+        supervisor.start.assert_called_once_with()
+        supervisor.shutdown.assert_called_once_with()
+        receiver.close.assert_awaited_once_with()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+    def test_bot_changes_reload_after_commit(self):
+        with mock.patch.object(bot_supervisor, 'invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                bot = Bot.objects.create(name='bot', api_key='1:a', description='')
+                invalidate.assert_not_called()
+            bot.delete()
+
+        self.assertEqual(invalidate.call_count, 1)
+
+    def test_health_endpoint(self):
+        response = self.client.get(reverse('bots:bot_health'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'running': False, 'published_at': None, 'bots': []})
+
+    async def test_health_is_published_to_other_processes(self):
+        await self.create_bot('first')
+        async with self.serving():
+            # bot_supervisor stands for the web process, which runs no bots
+            response = await self.async_client.get(reverse('bots:bot_health'))
+            queues = await self.async_client.get(reverse('bots:chat_queue_stats'))
+
+        self.assertTrue(response.json()['running'])
+        self.assertEqual([bot['name'] for bot in response.json()['bots']], ['first'])
+        self.assertEqual(queues.json()['max_concurrent'], chat_scheduler.max_concurrent)
+        stopped = await self.async_client.get(reverse('bots:bot_health'))
+        self.assertFalse(stopped.json()['running'])
+
+
+class TgBotControllerTests(TestCase):
+    def setUp(self):
+        self.bot = Bot.objects.create(name='bot', api_key='1:a', description='')
+        self.controller = TgBotController(self.bot, dispatch=None)
+        self.controller.delivery = 'polling'
+        self.http = SimpleNamespace(close=mock.AsyncMock())
+        self.controller.api = SimpleNamespace(id=1, http=self.http)
+        self.log = []
+
+    async def reply(self, delay):
+        await asyncio.sleep(delay)
+        self.http.close.assert_not_awaited()
+        self.log.append(delay)
+
+    async def test_replies_finish_before_the_session_closes(self):
+        handler = asyncio.create_task(self.reply(0.01))
+        self.controller.handler_tasks.add(handler)
+        chat_scheduler.submit('1:5', lambda: self.reply(0.02))
+
+        await self.controller.close()
+
+        self.assertEqual(self.log, [0.01, 0.02])
+        self.http.close.assert_awaited_once()
+
+    @override_settings(BOT_SHUTDOWN_TIMEOUT=0.01)
+    async def test_stuck_replies_are_cancelled(self):
+        handler = asyncio.create_task(self.reply(60))
+        self.controller.handler_tasks.add(handler)
+        chat_scheduler.submit('1:5', lambda: self.reply(60))
+
+        await self.controller.close()
+
+        self.assertTrue(handler.cancelled())
+        self.assertEqual(chat_scheduler.depth('1:5'), 0)
+        self.http.close.assert_awaited_once()
+
+
+class FakeWebhookAPI:
+    """Records webhook calls; Telegram reports the webhook as set once set_webhook() was called"""
+
+    def __init__(self):
+        self.id = 1
+        self.url = ''
+        self.secret = None
+        self.http = SimpleNamespace(close=mock.AsyncMock())
+
+    async def set_webhook(self, url, secret_token, allowed_updates):
+        self.url, self.secret = url, secret_token
+        return Ok(True)
+
+    async def get_webhook_info(self):
+        return Ok(SimpleNamespace(url=self.url, pending_update_count=3, last_error_message=Some('Connection refused')))
+
+    async def delete_webhook(self):
+        self.url = ''
+        return Ok(True)
+
+
+@override_settings(BOT_WEBHOOK_BASE_URL='https://example.com/')
+class TelegramWebhookTests(TestCase):
+    def setUp(self):
+        telegram_bots.clear()
+        webhook_receiver.clear()
+        self.addCleanup(webhook_receiver.clear)
+        self.addCleanup(telegram_bots.clear)
+        self.bot = Bot.objects.create(name='bot', api_key='1:a', description='')
+        self.url = reverse('bots:telegram_webhook', args=[self.bot.pk])
+        self.secret = webhook_secret(self.bot.pk, self.bot.api_key)
+
+    def update(self, update_id=1):
+        return {
+            'update_id': update_id,
+            'message': {'message_id': 1, 'date': 1700000000, 'chat': {'id': 5, 'type': 'private'}, 'text': 'hi'},
+        }
+
+    async def post(self, bot_id, body, secret):
+        return await self.async_client.post(
+            reverse('bots:telegram_webhook', args=[bot_id]), body, content_type='application/json',
+            headers={SECRET_HEADER: secret},
+        )
+
+    def test_webhook_url_and_secret(self):
+        self.assertEqual(webhook_url(self.bot.pk), f'https://example.com/bots/telegram/{self.bot.pk}/webhook/')
+        self.assertNotEqual(self.secret, webhook_secret(self.bot.pk, '1:b'))
+        with override_settings(BOT_WEBHOOK_BASE_URL=''), self.assertRaises(ImproperlyConfigured):
+            webhook_url(self.bot.pk)
+
+    async def test_updates_are_dispatched_once(self):
+        dispatch = SimpleNamespace(feed=mock.AsyncMock())
+        with mock.patch.object(webhook_receiver, '_dispatch', dispatch):
+            for _ in range(2):
+                response = await self.post(self.bot.pk, self.update(), self.secret)
+                self.assertEqual(response.status_code, 200)
+            await asyncio.sleep(0)
+
+        dispatch.feed.assert_awaited_once()
+        update, api = dispatch.feed.await_args.args
+        self.assertEqual((update.update_id, api.token), (1, '1:a'))
+
+    async def test_rejected_requests(self):
+        await committed(self, lambda: Bot.objects.filter(pk=self.bot.pk).update(is_active=False))
+        inactive = await self.post(self.bot.pk, self.update(), self.secret)
+        await committed(self, lambda: Bot.objects.filter(pk=self.bot.pk).update(is_active=True))
+
+        self.assertEqual(inactive.status_code, 404)
+        self.assertEqual((await self.post(self.bot.pk, self.update(), 'wrong')).status_code, 403)
+        self.assertEqual((await self.post(self.bot.pk, {'message': 'hi'}, self.secret)).status_code, 400)
+        self.assertEqual((await self.post(999, self.update(), self.secret)).status_code, 404)
+
+    async def test_api_clients_are_closed(self):
+        def client(bot_id):
+            api = webhook_receiver._apis[bot_id]
+            api.http = SimpleNamespace(close=mock.AsyncMock())
+            return api
+
+        dispatch = SimpleNamespace(feed=mock.AsyncMock())
+        with mock.patch.object(webhook_receiver, '_dispatch', dispatch):
+            await self.post(self.bot.pk, self.update(1), self.secret)
+            first = client(self.bot.pk)
+
+            # A new token gets a new client and the old session is closed
+            await committed(self, lambda: Bot.objects.filter(pk=self.bot.pk).update(api_key='1:b'))
+            await self.post(self.bot.pk, self.update(2), webhook_secret(self.bot.pk, '1:b'))
+            second = client(self.bot.pk)
+            await asyncio.sleep(0)
+            first.http.close.assert_awaited_once()
+
+            # Deactivating the bot closes its client
+            self.bot.api_key, self.bot.is_active = '1:b', False
+            await committed(self, self.bot.save)
+            await asyncio.sleep(0)
+            second.http.close.assert_awaited_once()
+            self.assertNotIn(self.bot.pk, webhook_receiver._apis)
+
+            other = await sync_to_async(Bot.objects.create)(name='other', api_key='2:a', description='')
+            await self.post(other.pk, self.update(3), webhook_secret(other.pk, '2:a'))
+            third = client(other.pk)
+            await webhook_receiver.close()
+
+        third.http.close.assert_awaited_once()
+        self.assertEqual(dispatch.feed.await_count, 3)
+
+    @override_settings(BOT_DELIVERY='webhook')
+    async def test_controller_registers_the_webhook(self):
+        api = FakeWebhookAPI()
+        controller = TgBotController(self.bot, dispatch=None)
+        with mock.patch('bots.telegram.tg_bot_controller.API', return_value=api):
+            controller.start()
+            await asyncio.sleep(0.01)
+            health = controller.health()
+            await controller.stop()
+
+        self.assertEqual(api.secret, self.secret)
+        self.assertEqual(health['delivery'], 'webhook')
+        self.assertEqual(health['pending_updates'], 3)
+        self.assertEqual(health['error'], 'Connection refused')
+        self.assertTrue(health['healthy'])
+        self.assertEqual(api.url, '')
+        api.http.close.assert_awaited_once()
+
+
+@override_settings(BOT_MEMORY_MAX_TOKENS=100, BOT_MEMORY_FACTS_TOKENS=20, BOT_MEMORY_SUMMARY_TOKENS=20)
+class ConversationMemoryTests(TestCase):
+    def setUp(self):
+        self.bot = Bot.objects.create(name='bot', api_key='1:a', description='')
+        self.memory = ConversationMemory(maxsize=8)
+        self.memory._model = SimpleNamespace(ainvoke=mock.AsyncMock(return_value=AIMessage(content='Talked about meals.')))
+
+    def test_reads_cost_one_query_at_most(self):
+        aget, arecord = async_to_sync(self.memory.aget), async_to_sync(self.memory.arecord)
+        with self.assertNumQueries(1):
+            context = aget(self.bot.pk, 42)
+            self.assertIs(aget(self.bot.pk, '42'), context)
+
+        arecord(context, 'hi', 'hello')
+        with self.assertNumQueries(0):
+            self.assertIs(aget(self.bot.pk, 42), context)
+
+        # Written by another process
+        UserContext.objects.filter(pk=context.pk).update(summary='elsewhere')
+        self.memory.version_stamp(self.bot.pk, '42').bump()
+        with self.assertNumQueries(1):
+            self.assertEqual(aget(self.bot.pk, 42).summary, 'elsewhere')
+
+    async def test_coroutines_use_the_async_cache_api(self):
+        blocking = mock.Mock(side_effect=AssertionError('blocking cache call in a coroutine'))
+        with mock.patch.object(VersionStamp, 'current', blocking), mock.patch.object(VersionStamp, 'bump', blocking):
+            context = await self.memory.aget(self.bot.pk, 42)
+            await self.memory.apin(context, 'vegan')
+            await telegram_bots.get(self.bot.pk)
+            await IdentityResolver().afind(self.bot.pk, 42)
+
+        blocking.assert_not_called()
+
+    async def test_old_turns_are_folded_into_the_summary(self):
+        context = await self.memory.aget(self.bot.pk, 42)
+        for n in range(4):
+            await self.memory.arecord(context, f'question {n} '.ljust(40, '.'), f'answer {n} '.ljust(40, '.'))
+
+        # 60 tokens for turns: the fourth exchange overflows them and half are freed
+        self.memory.model.ainvoke.assert_awaited_once()
+        stored = await UserContext.objects.aget(bot=self.bot, external_id='42')
+        self.assertEqual(stored.summary, 'Talked about meals.')
+        self.assertEqual([turn['content'][:10] for turn in stored.turns], ['question 3', 'answer 3 .'])
+
+        history = self.memory.history(stored)
+        self.assertEqual(history[0], {'role': 'system', 'content': 'Summary of the earlier conversation:\nTalked about meals.'})
+        self.assertEqual(len(history), 3)
+
+    async def test_summary_falls_back_to_the_latest_turns(self):
+        self.memory.model.ainvoke.side_effect = RuntimeError('offline')
+        with self.assertLogs('bots.memory', 'WARNING'):
+            summary = await self.memory.summarize('old', [{'role': 'user', 'content': 'x' * 200}])
+
+        self.assertEqual(len(summary), 80)
+        self.assertTrue(summary.endswith('xxx'))
+
+    async def test_long_turns_are_clipped(self):
+        context = await self.memory.aget(self.bot.pk, 42)
+        await self.memory.arecord(context, 'q' * 1000, 'a')
+
+        self.assertEqual(len(context.turns[0]['content']), 120)
+
+    async def test_pinned_facts(self):
+        context = await self.memory.aget(self.bot.pk, 42)
+        for fact in ['I am vegan', 'I live in   Berlin, near the park', 'My goal is to weigh 70 kg by the end of the summer holidays', 'I am vegan']:
+            await self.memory.apin(context, fact)
+
+        # Oldest facts go first once the 20 token share is used up
+        self.assertEqual(context.facts, ['My goal is to weigh 70 kg by the end of the summer holidays', 'I am vegan'])
+        self.assertIn('- I am vegan', self.memory.history(context)[0]['content'])
+
+        await self.memory.arecord(context, 'hi', 'hello')
+        await self.memory.aforget(context)
+        self.assertEqual((context.turns, context.facts[-1]), ([], 'I am vegan'))
+        await self.memory.aforget(context, facts=True)
+        self.assertEqual(self.memory.history(await self.memory.aget(self.bot.pk, 42)), [])
+
+    def test_one_context_per_chat(self):
+        UserContext.objects.create(bot=self.bot, external_id='42')
+        with self.assertRaises(IntegrityError):
+            UserContext.objects.create(bot=self.bot, external_id='42')
+
+
+class IdentityResolverTests(TestCase):
+    def setUp(self):
+        self.bot = Bot.objects.create(name='bot', api_key='1:a', description='')
+        self.resolver = IdentityResolver(maxsize=8)
+        self.resolve = async_to_sync(self.resolver.aresolve)
+        self.find = async_to_sync(self.resolver.afind)
+
+    def test_newcomers_get_a_user_once(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.find(self.bot.pk, 7))
+            self.assertIsNone(self.find(self.bot.pk, 7))
+
+        user_id = self.resolve(self.bot.pk, 7, provider='telegram', first_name='Ada')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.find(self.bot.pk, '7'), user_id)
+            self.assertEqual(self.resolve(self.bot.pk, 7, provider='telegram'), user_id)
+
+        user = User.objects.get(pk=user_id)
+        self.assertEqual((user.username, user.first_name, user.has_usable_password()), ('telegram-7', 'Ada', False))
+
+    def test_other_bots_share_the_user(self):
+        other = Bot.objects.create(name='other', api_key='2:b', description='')
+        User.objects.create(username='telegram-7')
+
+        user_id = self.resolve(self.bot.pk, 7, provider='telegram')
+
+        # The account already named like a newcomer is not taken over
+        self.assertNotEqual(User.objects.get(pk=user_id).username, 'telegram-7')
+        self.assertEqual(self.resolve(other.pk, 7, provider='telegram'), user_id)
+        self.assertEqual(Identity.objects.filter(user_id=user_id).count(), 2)
+
+    def test_racing_first_messages_share_the_user(self):
+        winner = User.objects.create(username='winner')
+        Identity.objects.create(bot=self.bot, external_id='7', user=winner)
+
+        # Both lookups ran before the other process committed its link
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            self.assertEqual(self.resolve(self.bot.pk, 7, provider='telegram'), winner.pk)
+        self.assertEqual(Identity.objects.count(), 1)
+        self.assertFalse(User.objects.filter(username='telegram-7').exists())
+
+    def test_unknown_ids_are_looked_up_again(self):
+        self.assertIsNone(self.find(self.bot.pk, 7))
+        user = User.objects.create(username='ada')
+        Identity.objects.create(bot=self.bot, external_id='7', user=user)
+
+        self.assertIsNone(self.find(self.bot.pk, 7))
+        with mock.patch('bots.identity.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(self.find(self.bot.pk, 7), user.pk)
+
+    def test_deleted_users_are_forgotten(self):
+        user_id = self.resolve(self.bot.pk, 7, provider='telegram')
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=user_id).delete()
+
+        self.assertIsNone(self.find(self.bot.pk, 7))
+        self.assertNotEqual(self.resolve(self.bot.pk, 7, provider='telegram'), user_id)
+
+    def test_identity_is_unique_per_bot(self):
+        user = User.objects.create(username='ada')
+        Identity.objects.create(bot=self.bot, external_id='7', user=user)
+        with self.assertRaises(IntegrityError):
+            Identity.objects.create(bot=self.bot, external_id='7', user=user)
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+app_name = 'bots'
+
+urlpatterns = [
+    path('api/health/', views.bot_health, name='bot_health'),
+    path('api/chats/queues/', views.chat_queue_stats, name='chat_queue_stats'),
+    path('telegram/<int:bot_id>/webhook/', views.telegram_webhook, name='telegram_webhook'),
+]
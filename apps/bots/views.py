@@ -1,3 +1,51 @@
-from django.shortcuts import render
+import msgspec
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 
-# Create your views here.
+from .scheduling import chat_scheduler, merge_stats
+from .supervisor import bot_supervisor
+from .telegram.webhook import SECRET_HEADER, webhook_receiver
+
+
+@require_http_methods(["GET"])
+def chat_queue_stats(request):
+    """
+    Running and queued agent runs, with the queue depth of every busy chat
+
+    Counts the chats of the process serving the bots, as published to the
+    shared cache, and the webhook chats answered by this process.
+    """
+    if bot_supervisor.running:
+        return JsonResponse(chat_scheduler.stats())
+    return JsonResponse(merge_stats(chat_scheduler.stats(), bot_supervisor.status()['queues']))
+
+
+@require_http_methods(["GET"])
+def bot_health(request):
+    """Status, last poll, update count and update lag of every bot, from whichever process serves them"""
+    status = bot_supervisor.status()
+    return JsonResponse({key: status[key] for key in ('running', 'published_at', 'bots')})
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def telegram_webhook(request, bot_id):
+    """
+    Accept an update Telegram delivers to a bot's webhook
+
+    The request must carry the bot's secret token. The update is
+    acknowledged right away and handled in the background on the serving
+    event loop, so serve ``apps.asgi:application`` with an ASGI server.
+    """
+    bot = await webhook_receiver.bot(bot_id)
+    if bot is None:
+        return JsonResponse({'error': 'Bot not found'}, status=404)
+    if not webhook_receiver.verify(bot, request.headers.get(SECRET_HEADER)):
+        return JsonResponse({'error': 'Invalid secret token'}, status=403)
+
+    try:
+        webhook_receiver.accept(bot_id, bot, request.body)
+    except msgspec.DecodeError:
+        return JsonResponse({'error': 'Invalid update'}, status=400)
+    return HttpResponse(status=200)
@@ -0,0 +1,211 @@
+from typing import Any, Dict, Hashable, Iterable, Tuple
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400.0
+MOVING_AVERAGE_POINTS = 7
+
+
+def analyze_rows(rows: Iterable[Tuple[Hashable, str, str, float, Any]]) -> Dict[Hashable, Dict[str, Any]]:
+    """
+    Analyze measurement rows grouped by an arbitrary key.
+
+    Rows are (key, metric, measurement_type, value, timestamp) tuples, where
+    key is usually a goal id and timestamp a datetime. They are converted to
+    NumPy arrays in a single pass and every series is analyzed at once.
+
+    Args:
+        rows: Measurement rows in any order
+
+    Returns:
+        Mapping of key to {metric: analysis}
+    """
+    keys, metrics, types, values, timestamps = [], [], [], [], []
+    for key, metric, measurement_type, value, timestamp in rows:
+        keys.append(key)
+        metrics.append(metric)
+        types.append(measurement_type)
+        values.append(value)
+        timestamps.append(timestamp.timestamp())
+
+    if not keys:
+        return {}
+
+    series_labels = np.array([f'{key}\x00{metric}' for key, metric in zip(keys, metrics)])
+    labels, first_rows, codes = np.unique(series_labels, return_index=True, return_inverse=True)
+    analyses = analyze_series(
+        codes,
+        np.array(types),
+        np.array(values, dtype=float),
+        np.array(timestamps, dtype=float),
+        len(labels),
+    )
+
+    results: Dict[Hashable, Dict[str, Any]] = {}
+    for code, row in enumerate(first_rows):
+        if analyses[code] is not None:
+            results.setdefault(keys[row], {})[metrics[row]] = analyses[code]
+    return results
+
+
+def analyze_series(codes: np.ndarray, types: np.ndarray, values: np.ndarray,
+                   timestamps: np.ndarray, series_count: int) -> list:
+    """
+    Vectorized trend analysis of many measurement series at once.
+
+    Baseline and log points form the progress series of each code; the latest
+    target point, if any, is the value progress is measured against.
+
+    Args:
+        codes: Series code (0..series_count-1) of every point
+        types: Measurement type of every point
+        values: Measured values
+        timestamps: POSIX timestamps in seconds
+        series_count: Number of distinct series codes
+
+    Returns:
+        List indexed by series code of analysis dictionaries, or None for
+        series with no baseline or log points
+    """
+    is_target = types == 'target'
+
+    # Latest target per series.
+    target_order = np.lexsort((timestamps[is_target], codes[is_target]))
+    target_codes = codes[is_target][target_order]
+    target_values = values[is_target][target_order]
+    has_target = np.zeros(series_count, dtype=bool)
+    targets = np.full(series_count, np.nan)
+    if target_codes.size:
+        last_target = np.r_[target_codes[1:] != target_codes[:-1], True]
+        has_target[target_codes[last_target]] = True
+        targets[target_codes[last_target]] = target_values[last_target]
+
+    # Progress points sorted by series, then time.
+    progress = ~is_target
+    order = np.lexsort((timestamps[progress], codes[progress]))
+    g = codes[progress][order]
+    v = values[progress][order]
+    t = timestamps[progress][order] / SECONDS_PER_DAY
+    is_baseline = types[progress][order] == 'baseline'
+
+    results = [None] * series_count
+    if not g.size:
+        return results
+
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    ends = np.r_[starts[1:], g.size]
+    series = g[starts]
+    counts = ends - starts
+
+    # Least-squares slope per series, on days since each series' first point.
+    t = t - np.repeat(t[starts], counts)
+    sum_t = np.add.reduceat(t, starts)
+    sum_v = np.add.reduceat(v, starts)
+    sum_tt = np.add.reduceat(t * t, starts)
+    sum_tv = np.add.reduceat(t * v, starts)
+    denominator = counts * sum_tt - sum_t * sum_t
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = np.where(denominator > 0, (counts * sum_tv - sum_t * sum_v) / denominator, 0.0)
+
+    # Baseline is the first baseline point, falling back to the first point.
+    baseline_rows = np.minimum.reduceat(np.where(is_baseline, np.arange(g.size), g.size), starts)
+    baseline_rows = np.where(baseline_rows < ends, baseline_rows, starts)
+    baselines = v[baseline_rows]
+    currents = v[ends - 1]
+    elapsed_days = t[ends - 1]
+
+    # Moving average over the most recent points of each series.
+    cumulative = np.r_[0.0, np.cumsum(v)]
+    window_starts = np.maximum(ends - MOVING_AVERAGE_POINTS, starts)
+    moving_averages = (cumulative[ends] - cumulative[window_starts]) / (ends - window_starts)
+
+    changes = currents - baselines
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_percents = np.where(baselines != 0, changes / baselines * 100, 0.0)
+        series_targets = targets[series]
+        target_spans = series_targets - baselines
+        progress_percents = np.where(target_spans != 0, changes / target_spans * 100, np.nan)
+        remaining = series_targets - currents
+        days_to_target = np.where(slopes * remaining > 0, remaining / slopes, np.nan)
+
+    for index, code in enumerate(series):
+        if counts[index] < 2:
+            results[code] = {
+                'current': float(currents[index]),
+                'status': 'single_measurement'
+            }
+            continue
+
+        change = float(changes[index])
+        if has_target[code]:
+            # Moving toward the target counts as improving, whatever the sign.
+            direction = np.sign(change) * np.sign(target_spans[index])
+        else:
+            direction = np.sign(change)
+
+        analysis = {
+            'baseline': float(baselines[index]),
+            'current': float(currents[index]),
+            'change': change,
+            'change_percent': float(change_percents[index]),
+            'trend': 'improving' if direction > 0 else 'declining' if direction < 0 else 'stable',
+            'measurement_count': int(counts[index]),
+            'elapsed_days': float(elapsed_days[index]),
+            'slope_per_day': float(slopes[index]),
+            'weekly_rate': float(slopes[index] * 7),
+            'moving_average': float(moving_averages[index]),
+        }
+        if has_target[code]:
+            analysis.update({
+                'target': float(series_targets[index]),
+                'remaining': float(remaining[index]),
+                'progress_percent': _optional(progress_percents[index]),
+                'estimated_days_to_target': _optional(days_to_target[index]),
+            })
+        results[code] = analysis
+
+    return results
+
+
+def _optional(value: float):
+    return None if np.isnan(value) else float(value)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, from each of threshold - 2 equal
+    buckets in between, the point forming the largest triangle with the point
+    kept before it and the mean of the next bucket.
+
+    Args:
+        x: Point x coordinates in ascending order
+        y: Point y coordinates
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted indices of the kept points
+    """
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    edges = np.linspace(1, size - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, size - 1
+
+    previous = 0
+    for index in range(threshold - 2):
+        start, end = edges[index], edges[index + 1]
+        next_end = edges[index + 2] if index + 2 < len(edges) else size
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[index + 1] = previous
+
+    return kept
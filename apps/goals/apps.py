@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GoalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goals'
+
+    def ready(self):
+        """Connect measurement signal receivers"""
+        from . import signals  # noqa: F401
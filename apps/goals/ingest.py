@@ -0,0 +1,235 @@
+import csv
+import json
+import math
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import BodyMeasurement, Goal
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+
+METRICS = frozenset(dict(BodyMeasurement.BODY_METRICS))
+MEASUREMENT_TYPES = frozenset(dict(BodyMeasurement.MEASUREMENT_TYPES))
+
+# (line number, parsed row or None, parse error or None)
+Row = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+def parse_ndjson(lines: Iterable[bytes]) -> Iterator[Row]:
+    """Parse newline-delimited JSON objects, one at a time"""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Expected a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def parse_csv(lines: Iterable[bytes]) -> Iterator[Row]:
+    """
+    Parse CSV rows with a header line, one at a time.
+
+    Every line is decoded on its own, so an invalid UTF-8 line or a
+    malformed row is reported with its line number and parsing goes on.
+    """
+    errors: List[Tuple[int, str]] = []
+    line_number = 0
+
+    def decoded() -> Iterator[str]:
+        nonlocal line_number
+        for line_number, line in enumerate(lines, start=1):
+            try:
+                yield line.decode('utf-8')
+            except UnicodeDecodeError as e:
+                errors.append((line_number, f'Invalid UTF-8: {e}'))
+
+    reader = csv.DictReader(decoded())
+    while True:
+        try:
+            row = next(reader, None)
+        except csv.Error as e:
+            errors.append((line_number, f'Invalid CSV: {e}'))
+            row = False
+        # Lines skipped on the way to a row are reported before it
+        for number, error in errors:
+            yield number, None, error
+        errors.clear()
+        if row is None:
+            return
+        if row:
+            yield line_number, row, None
+
+
+class MeasurementIngestor:
+    """
+    Writes a stream of measurement rows for one user in bulk.
+
+    Rows are validated one by one and written in chunks of batch_size with
+    bulk_create, so memory stays flat whatever the upload size. A row whose
+    (metric, timestamp) already exists for the user, in the database or
+    earlier in the same chunk, is skipped as a duplicate; the unique
+    constraint on those columns keeps concurrent uploads of the same points
+    from storing them twice. Invalid rows are reported with their line
+    number and never abort the upload.
+    """
+
+    def __init__(self, user_id: int, batch_size: Optional[int] = None, max_errors: Optional[int] = None):
+        self.user_id = user_id
+        self.batch_size = batch_size or settings.MEASUREMENT_INGEST_BATCH_SIZE
+        self.max_errors = settings.MEASUREMENT_INGEST_MAX_ERRORS if max_errors is None else max_errors
+        self.tzinfo = timezone.get_current_timezone()
+        self.received = 0
+        self.created = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def ingest(self, rows: Iterable[Row]) -> Dict[str, Any]:
+        """
+        Validate and write every row.
+
+        Args:
+            rows: (line number, row, parse error) tuples from parse_ndjson or
+                parse_csv
+
+        Returns:
+            Report with received, created, duplicate and error counts and the
+            first max_errors per-row errors
+        """
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            self._write_chunk(chunk)
+
+        return {
+            'received': self.received,
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def _write_chunk(self, chunk: List[Row]) -> None:
+        errors = []
+        measurements = []
+        for line_number, row, error in chunk:
+            self.received += 1
+            if error is None:
+                try:
+                    measurements.append((line_number, self._build(row)))
+                    continue
+                except (TypeError, ValueError) as e:
+                    error = str(e)
+            errors.append((line_number, error))
+
+        goal_ids = {measurement.goal_id for _, measurement in measurements if measurement.goal_id}
+        if goal_ids:
+            owned = set(Goal.objects.filter(user_id=self.user_id, id__in=goal_ids).values_list('id', flat=True))
+            errors.extend(
+                (line_number, f'Unknown goal_id: {measurement.goal_id}')
+                for line_number, measurement in measurements
+                if measurement.goal_id and measurement.goal_id not in owned
+            )
+            measurements = [
+                (line_number, measurement) for line_number, measurement in measurements
+                if not measurement.goal_id or measurement.goal_id in owned
+            ]
+
+        for line_number, error in sorted(errors):
+            self._error(line_number, error)
+
+        if not measurements:
+            return
+
+        new = self._deduplicate([measurement for _, measurement in measurements])
+        if not new:
+            return
+        try:
+            with transaction.atomic():
+                BodyMeasurement.objects.bulk_create(new)
+        except IntegrityError:
+            # A concurrent upload stored some of the same points first.
+            new = self._deduplicate(new)
+            BodyMeasurement.objects.bulk_create(new, ignore_conflicts=True)
+        self.created += len(new)
+
+    def _deduplicate(self, measurements: List[BodyMeasurement]) -> List[BodyMeasurement]:
+        """Drop and count the measurements already stored or repeated in the list"""
+        seen = set(
+            BodyMeasurement.objects.filter(
+                user_id=self.user_id,
+                metric__in={measurement.metric for measurement in measurements},
+                timestamp__in={measurement.timestamp for measurement in measurements},
+            ).values_list('metric', 'timestamp')
+        )
+        new = []
+        for measurement in measurements:
+            key = (measurement.metric, measurement.timestamp)
+            if key in seen:
+                self.duplicates += 1
+                continue
+            seen.add(key)
+            new.append(measurement)
+        return new
+
+    def _build(self, row: Dict[str, Any]) -> BodyMeasurement:
+        metric = row.get('metric')
+        if metric not in METRICS:
+            raise ValueError(f'Invalid metric: {metric!r}')
+
+        measurement_type = row.get('measurement_type') or 'log'
+        if measurement_type not in MEASUREMENT_TYPES:
+            raise ValueError(f'Invalid measurement_type: {measurement_type!r}')
+
+        value = row.get('value')
+        if value is None or value == '' or isinstance(value, bool):
+            raise ValueError('value is required')
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value: {value!r}')
+        if not math.isfinite(value):
+            raise ValueError('value must be a finite number')
+
+        raw_timestamp = row.get('timestamp')
+        timestamp = parse_datetime(raw_timestamp) if isinstance(raw_timestamp, str) else None
+        if timestamp is None:
+            raise ValueError(f'Invalid timestamp: {raw_timestamp!r}')
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, self.tzinfo)
+
+        goal_id = row.get('goal_id') or None
+        if goal_id is not None:
+            try:
+                goal_id = Goal._meta.pk.to_python(goal_id)
+            except ValidationError:
+                raise ValueError(f'Invalid goal_id: {goal_id!r}')
+
+        return BodyMeasurement(
+            user_id=self.user_id,
+            goal_id=goal_id,
+            metric=metric,
+            measurement_type=measurement_type,
+            value=value,
+            timestamp=timestamp,
+        )
+
+    def _error(self, line_number: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_number, 'error': message})
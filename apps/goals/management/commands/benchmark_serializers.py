@@ -0,0 +1,95 @@
+import json
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from apps.responses import orjson
+from goals.models import BodyMeasurement, Goal
+from goals.serializers import serialize_goals, serialize_measurements
+
+
+class Command(BaseCommand):
+    help = 'Compare to_dict() with the values_list() serializers on synthetic rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Rows per model')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per timing, the best is kept')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        self.repeat = options['repeat']
+
+        # Everything is written inside a transaction that is rolled back.
+        with transaction.atomic():
+            user = User.objects.create_user(username=f'benchmark-{time.time_ns()}')
+            now = timezone.now()
+            goal_types = [goal_type for goal_type, _ in Goal.GOAL_TYPES]
+            Goal.objects.bulk_create(
+                [
+                    Goal(user=user, goal_type=goal_types[n % len(goal_types)], target_date=now.date())
+                    for n in range(rows)
+                ],
+                batch_size=5000,
+            )
+            goal = Goal.objects.filter(user=user).first()
+            metrics = [metric for metric, _ in BodyMeasurement.BODY_METRICS]
+            BodyMeasurement.objects.bulk_create(
+                [
+                    BodyMeasurement(
+                        user=user,
+                        goal=goal,
+                        metric=metrics[n % len(metrics)],
+                        measurement_type='log',
+                        value=80 - n / rows,
+                        timestamp=now - timedelta(minutes=n),
+                    )
+                    for n in range(rows)
+                ],
+                batch_size=5000,
+            )
+
+            goals = Goal.objects.filter(user=user)
+            measurements = BodyMeasurement.objects.filter(user=user)
+            self.stdout.write(f'{rows} rows per model, best of {self.repeat}')
+            self.compare(
+                'Goal',
+                lambda: [goal.to_dict() for goal in goals],
+                lambda: serialize_goals(goals),
+            )
+            data = self.compare(
+                'BodyMeasurement',
+                lambda: [measurement.to_dict() for measurement in measurements],
+                lambda: serialize_measurements(measurements),
+            )
+
+            encoded = self.best(lambda: json.dumps(data, cls=DjangoJSONEncoder))
+            self.stdout.write(f'  json.dumps        {encoded:8.3f}s')
+            if orjson is not None:
+                fast = self.best(lambda: orjson.dumps(data))
+                self.stdout.write(f'  orjson.dumps      {fast:8.3f}s  {encoded / fast:5.1f}x')
+
+            transaction.set_rollback(True)
+
+    def compare(self, label, baseline, candidate):
+        if baseline() != candidate():
+            self.stderr.write(self.style.ERROR(f'{label}: serializer output differs from to_dict()'))
+
+        slow = self.best(baseline)
+        fast = self.best(candidate)
+        self.stdout.write(f'{label}')
+        self.stdout.write(f'  to_dict()         {slow:8.3f}s')
+        self.stdout.write(self.style.SUCCESS(f'  values_list()     {fast:8.3f}s  {slow / fast:5.1f}x'))
+        return candidate()
+
+    def best(self, function):
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import RowNumber
+
+
+def backfill_latest_measurements(apps, schema_editor):
+    BodyMeasurement = apps.get_model('goals', 'BodyMeasurement')
+    LatestMeasurement = apps.get_model('goals', 'LatestMeasurement')
+
+    latest = (
+        BodyMeasurement.objects.annotate(
+            metric_row_number=models.Window(
+                expression=RowNumber(),
+                partition_by=[models.F('user_id'), models.F('metric')],
+                order_by=[models.F('timestamp').desc(), models.F('id').desc()],
+            )
+        )
+        .filter(metric_row_number=1)
+        .values_list('id', 'user_id', 'metric', 'timestamp')
+    )
+    LatestMeasurement.objects.bulk_create(
+        [
+            LatestMeasurement(measurement_id=pk, user_id=user_id, metric=metric, timestamp=timestamp)
+            for pk, user_id, metric, timestamp in latest
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goals', '0003_alter_bodymeasurement_measurement_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bodymeasurement',
+            name='metric',
+            field=models.CharField(choices=[('age_years', 'Age (years)'), ('gender', 'Gender'), ('height_cm', 'Height (cm)'), ('weight_kg', 'Weight (kg)'), ('waist_cm', 'Waist (cm)'), ('hip_cm', 'Hip (cm)'), ('neck_cm', 'Neck (cm)'), ('arm_circumference_cm', 'Arm Circumference (cm)'), ('thigh_circumference_cm', 'Thigh Circumference (cm)'), ('calf_circumference_cm', 'Calf Circumference (cm)'), ('body_fat_percentage', 'Body Fat (%)'), ('muscle_mass_percentage', 'Muscle Mass (%)'), ('bmi_value', 'BMI Value')], default='weight_kg', max_length=50),
+        ),
+        migrations.CreateModel(
+            name='LatestMeasurement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('age_years', 'Age (years)'), ('gender', 'Gender'), ('height_cm', 'Height (cm)'), ('weight_kg', 'Weight (kg)'), ('waist_cm', 'Waist (cm)'), ('hip_cm', 'Hip (cm)'), ('neck_cm', 'Neck (cm)'), ('arm_circumference_cm', 'Arm Circumference (cm)'), ('thigh_circumference_cm', 'Thigh Circumference (cm)'), ('calf_circumference_cm', 'Calf Circumference (cm)'), ('body_fat_percentage', 'Body Fat (%)'), ('muscle_mass_percentage', 'Muscle Mass (%)'), ('bmi_value', 'BMI Value')], max_length=50)),
+                ('timestamp', models.DateTimeField()),
+                ('measurement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='goals.bodymeasurement')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'metric'), name='goals_latest_measurement_user_metric')],
+            },
+        ),
+        migrations.RunPython(backfill_latest_measurements, migrations.RunPython.noop),
+    ]
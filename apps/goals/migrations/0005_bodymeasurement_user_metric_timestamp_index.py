@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goals', '0004_latestmeasurement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bodymeasurement',
+            index=models.Index(fields=['user', 'metric', 'timestamp'], name='goals_meas_user_metric_ts'),
+        ),
+    ]
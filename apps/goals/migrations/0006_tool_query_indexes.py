@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goals', '0005_bodymeasurement_user_metric_timestamp_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bodymeasurement',
+            index=models.Index(fields=['user', 'goal', '-timestamp', '-id'], name='goals_meas_user_goal_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='bodymeasurement',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='goals_meas_user_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-created_at'], name='goals_goal_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'goal_type', '-created_at'], name='goals_goal_user_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='latestmeasurement',
+            index=models.Index(fields=['user', '-timestamp'], name='goals_latest_user_ts'),
+        ),
+    ]
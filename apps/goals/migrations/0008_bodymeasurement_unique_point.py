@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_duplicate_points(apps, schema_editor):
+    """Keep the latest measurement of every (user, metric, timestamp) before it becomes unique"""
+    BodyMeasurement = apps.get_model('goals', 'BodyMeasurement')
+
+    # The newest id is also the one LatestMeasurement points at on a tie.
+    duplicates = (
+        BodyMeasurement.objects.values('user_id', 'metric', 'timestamp')
+        .annotate(count=models.Count('id'), keep=models.Max('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        BodyMeasurement.objects.filter(
+            user_id=duplicate['user_id'], metric=duplicate['metric'], timestamp=duplicate['timestamp']
+        ).exclude(pk=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goals', '0007_bodymeasurement_drop_user_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_points, migrations.RunPython.noop),
+        # The unique constraint's index replaces the plain one of the same columns
+        migrations.RemoveIndex(
+            model_name='bodymeasurement',
+            name='goals_meas_user_metric_ts',
+        ),
+        migrations.AddConstraint(
+            model_name='bodymeasurement',
+            constraint=models.UniqueConstraint(fields=('user', 'metric', 'timestamp'), name='goals_meas_user_metric_ts'),
+        ),
+    ]
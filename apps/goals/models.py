@@ -1,9 +1,12 @@
 from django.db import models
+from django.db.models.functions import RowNumber, TruncDay, TruncMonth, TruncWeek
 from django.contrib.auth.models import User
 from datetime import date
 from typing import Optional
 import uuid
 
+from .signals import measurements_changed
+
 
 class Goal(models.Model):
     GOAL_TYPES = [
@@ -26,6 +29,19 @@ class Goal(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Tools only read active goals, newest first
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=models.Q(is_active=True),
+                name='goals_goal_user_active_idx',
+            ),
+            models.Index(
+                fields=['user', 'goal_type', '-created_at'],
+                condition=models.Q(is_active=True),
+                name='goals_goal_user_type_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s {self.get_goal_type_display()} goal"  # type: ignore
@@ -50,6 +66,82 @@ class Goal(models.Model):
             return (self.target_date - date.today()).days
         return None
 
+
+# Bucket sizes accepted by BodyMeasurementQuerySet.bucketed()
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+class BodyMeasurementQuerySet(models.QuerySet):
+    """
+    QuerySet that reports bulk writes through the measurements_changed signal.
+    
+    bulk_create() and update() bypass post_save, so they announce the affected
+    (user_id, metric) pairs themselves to keep derived data current.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        measurements_changed.send(
+            sender=self.model,
+            pairs={(obj.user_id, obj.metric) for obj in objs},
+        )
+        return objs
+
+    def update(self, **kwargs):
+        rows = list(self.values_list('pk', 'user_id', 'metric'))
+        updated = super().update(**kwargs)
+        pairs = {(user_id, metric) for _, user_id, metric in rows}
+        if {'user', 'user_id', 'metric'} & kwargs.keys():
+            pairs.update(
+                self.model.objects.filter(pk__in=[pk for pk, _, _ in rows])
+                .values_list('user_id', 'metric')
+                .distinct()
+            )
+        measurements_changed.send(sender=self.model, pairs=pairs)
+        return updated
+
+    def bucketed(self, bucket: str = 'day', tzinfo=None) -> list:
+        """
+        Aggregate the measurements into day, week or month buckets.
+        
+        A single query partitions rows by bucket with window functions and keeps
+        the newest row of each, so min, max, mean, count and last value come
+        back as one row per bucket without loading the raw measurements.
+        
+        Args:
+            bucket: One of BUCKETS
+            tzinfo: Time zone bucket boundaries are computed in, defaults to the
+                current time zone
+            
+        Returns:
+            List of (bucket_start, min, max, mean, last, count) tuples in
+            chronological order
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown bucket '{bucket}', expected one of {', '.join(BUCKETS)}")
+
+        partition = {'partition_by': [models.F('bucket')]}
+        newest_first = [models.F('timestamp').desc(), models.F('id').desc()]
+        return list(
+            self.order_by()
+            .annotate(bucket=BUCKETS[bucket]('timestamp', tzinfo=tzinfo))
+            .annotate(
+                bucket_min=models.Window(models.Min('value'), **partition),
+                bucket_max=models.Window(models.Max('value'), **partition),
+                bucket_mean=models.Window(models.Avg('value'), **partition),
+                bucket_count=models.Window(models.Count('id'), **partition),
+                bucket_row_number=models.Window(RowNumber(), order_by=newest_first, **partition),
+            )
+            .filter(bucket_row_number=1)
+            .order_by('bucket')
+            .values_list('bucket', 'bucket_min', 'bucket_max', 'bucket_mean', 'value', 'bucket_count')
+        )
+
+
 class BodyMeasurement(models.Model):
     BODY_METRICS = [
         ('age_years', 'Age (years)'),
@@ -71,7 +163,8 @@ class BodyMeasurement(models.Model):
         ('baseline', 'Baseline'),
         ('log', 'Log'),
     ]
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Indexed as the first column of every index below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     goal = models.ForeignKey(Goal, on_delete=models.CASCADE, null=True, blank=True)
     metric = models.CharField(max_length=50, choices=BODY_METRICS, default='weight_kg')
     measurement_type = models.CharField(max_length=50, choices=MEASUREMENT_TYPES)
@@ -80,6 +173,19 @@ class BodyMeasurement(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BodyMeasurementQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # One point per metric and instant; also the index of metric series
+            models.UniqueConstraint(fields=['user', 'metric', 'timestamp'], name='goals_meas_user_metric_ts'),
+        ]
+        indexes = [
+            # Descending so per-goal windows over the newest rows need no sort
+            models.Index(fields=['user', 'goal', '-timestamp', '-id'], name='goals_meas_user_goal_ts'),
+            models.Index(fields=['user', 'timestamp', 'id'], name='goals_meas_user_ts'),
+        ]
+
     def __str__(self):
         return f"{self.goal.user.username}'s {self.get_measurement_type_display()} {self.get_metric_display()} measurement"
     
@@ -87,7 +193,7 @@ class BodyMeasurement(models.Model):
         """Convert body measurement to dictionary for API responses"""
         return {
             'id': self.id, # type: ignore
-            'goal_id': str(self.goal.id) if self.goal else None,
+            'goal_id': str(self.goal_id) if self.goal_id else None, # type: ignore
             'metric': self.metric,
             'metric_display': self.get_metric_display(), # type: ignore
             'measurement_type': self.measurement_type,
@@ -96,3 +202,86 @@ class BodyMeasurement(models.Model):
             'timestamp': self.timestamp.isoformat(), # type: ignore
             'created_at': self.created_at.isoformat() # type: ignore
         }
+
+
+class LatestMeasurementManager(models.Manager):
+
+    def for_user(self, user_id: int, metric: Optional[str] = None) -> models.QuerySet:
+        """Latest measurement per metric for a user, newest first"""
+        latest = self.filter(user_id=user_id)
+        if metric:
+            latest = latest.filter(metric=metric)
+        return latest.select_related('measurement').order_by('-timestamp')
+
+    def refresh(self, pairs) -> None:
+        """
+        Recompute the latest measurement for the given (user_id, metric) pairs.
+        
+        Runs one window-function query over the affected pairs, one upsert and
+        one delete for pairs that no longer have any measurements.
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return
+
+        user_ids = {user_id for user_id, _ in pairs}
+        metrics = {metric for _, metric in pairs}
+        candidates = (
+            BodyMeasurement.objects.filter(user_id__in=user_ids, metric__in=metrics)
+            .annotate(
+                metric_row_number=models.Window(
+                    expression=RowNumber(),
+                    partition_by=[models.F('user_id'), models.F('metric')],
+                    order_by=[models.F('timestamp').desc(), models.F('id').desc()],
+                )
+            )
+            .filter(metric_row_number=1)
+            .values_list('id', 'user_id', 'metric', 'timestamp')
+        )
+        latest = [
+            self.model(measurement_id=pk, user_id=user_id, metric=metric, timestamp=timestamp)
+            for pk, user_id, metric, timestamp in candidates
+            if (user_id, metric) in pairs
+        ]
+
+        if latest:
+            self.bulk_create(
+                latest,
+                update_conflicts=True,
+                unique_fields=['user', 'metric'],
+                update_fields=['measurement', 'timestamp'],
+            )
+
+        stale = pairs - {(row.user_id, row.metric) for row in latest}
+        if stale:
+            condition = models.Q()
+            for user_id, metric in stale:
+                condition |= models.Q(user_id=user_id, metric=metric)
+            self.filter(condition).delete()
+
+
+class LatestMeasurement(models.Model):
+    """
+    Projection of the most recent BodyMeasurement per (user, metric).
+    
+    Kept current by goals.signals on every measurement write, so reading a
+    user's latest values is a single indexed lookup instead of a scan of the
+    whole measurement history.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    metric = models.CharField(max_length=50, choices=BodyMeasurement.BODY_METRICS)
+    measurement = models.ForeignKey(BodyMeasurement, on_delete=models.CASCADE, related_name='+')
+    timestamp = models.DateTimeField()
+
+    objects = LatestMeasurementManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'metric'], name='goals_latest_measurement_user_metric'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-timestamp'], name='goals_latest_user_ts'),
+        ]
+
+    def __str__(self):
+        return f"Latest {self.metric} for user {self.user_id}"  # type: ignore
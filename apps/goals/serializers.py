@@ -0,0 +1,87 @@
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from django.db.models import QuerySet
+
+from .models import BodyMeasurement, Goal
+
+# Choice label lookup tables, built once instead of per row
+GOAL_TYPE_LABELS = dict(Goal.GOAL_TYPES)
+METRIC_LABELS = dict(BodyMeasurement.BODY_METRICS)
+MEASUREMENT_TYPE_LABELS = dict(BodyMeasurement.MEASUREMENT_TYPES)
+
+GOAL_FIELDS = ('id', 'goal_type', 'target_date', 'notes', 'created_at', 'updated_at')
+MEASUREMENT_FIELDS = ('id', 'goal_id', 'metric', 'measurement_type', 'value', 'timestamp', 'created_at')
+
+
+def goal_dicts(rows: Iterable[Sequence[Any]], today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Build Goal.to_dict() dictionaries from GOAL_FIELDS tuples.
+
+    Args:
+        rows: values_list(*GOAL_FIELDS) rows
+        today: Date days_remaining is counted from, defaults to today
+
+    Returns:
+        List of goal dictionaries
+    """
+    today = today or date.today()
+    return [
+        {
+            'id': str(pk),
+            'goal_type': goal_type,
+            'goal_type_display': GOAL_TYPE_LABELS.get(goal_type, goal_type),
+            'target_date': target_date.isoformat() if target_date else None,
+            'notes': notes,
+            'created_at': created_at.isoformat(),
+            'updated_at': updated_at.isoformat(),
+            'days_remaining': (target_date - today).days if target_date else None
+        }
+        for pk, goal_type, target_date, notes, created_at, updated_at in rows
+    ]
+
+
+def measurement_dicts(rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    """
+    Build BodyMeasurement.to_dict() dictionaries from MEASUREMENT_FIELDS tuples.
+
+    Args:
+        rows: values_list(*MEASUREMENT_FIELDS) rows
+
+    Returns:
+        List of measurement dictionaries
+    """
+    return [
+        {
+            'id': pk,
+            'goal_id': str(goal_id) if goal_id else None,
+            'metric': metric,
+            'metric_display': METRIC_LABELS.get(metric, metric),
+            'measurement_type': measurement_type,
+            'measurement_type_display': MEASUREMENT_TYPE_LABELS.get(measurement_type, measurement_type),
+            'value': value,
+            'timestamp': timestamp.isoformat(),
+            'created_at': created_at.isoformat()
+        }
+        for pk, goal_id, metric, measurement_type, value, timestamp, created_at in rows
+    ]
+
+
+def serialize_goals(goals: QuerySet) -> List[Dict[str, Any]]:
+    """Serialize a Goal queryset without instantiating models"""
+    return goal_dicts(goals.values_list(*GOAL_FIELDS))
+
+
+def serialize_measurements(measurements: QuerySet, prefix: str = '') -> List[Dict[str, Any]]:
+    """
+    Serialize a BodyMeasurement queryset without instantiating models.
+
+    Args:
+        measurements: BodyMeasurement queryset, or a queryset of a model
+            pointing at BodyMeasurement when prefix is given
+        prefix: Lookup path to the measurement, e.g. 'measurement__'
+
+    Returns:
+        List of measurement dictionaries
+    """
+    return measurement_dicts(measurements.values_list(*(prefix + field for field in MEASUREMENT_FIELDS)))
@@ -0,0 +1,106 @@
+from datetime import date, datetime, time
+from typing import Any, Dict, Optional, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .analytics import lttb
+from .models import BodyMeasurement
+
+DEFAULT_SERIES_TYPES = ('baseline', 'log')
+
+
+def measurement_series(
+    user_id: int,
+    metric: str,
+    bucket: str = 'day',
+    start: Union[str, date, datetime, None] = None,
+    end: Union[str, date, datetime, None] = None,
+    points: Optional[int] = None,
+    time_zone: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Bucketed series of a user's measurements of one metric.
+
+    Aggregation runs in the database, see BodyMeasurementQuerySet.bucketed().
+    Target measurements are left out, as they are not readings. When points is
+    given and there are more buckets than that, the series is reduced with LTTB
+    over the bucket means.
+
+    Args:
+        user_id: The ID of the user
+        metric: Metric to aggregate (e.g., 'weight_kg')
+        bucket: Bucket size, 'day', 'week' or 'month'
+        start: Optional inclusive start, ISO date/datetime or date object
+        end: Optional inclusive end, ISO date/datetime or date object; a bare
+            date covers that whole day
+        points: Optional maximum number of buckets to return
+        time_zone: Optional IANA time zone for dates and bucket boundaries,
+            defaults to the current time zone
+
+    Returns:
+        Dictionary with the query parameters and the list of buckets
+
+    Raises:
+        ValueError: If an argument is invalid
+    """
+    if metric not in dict(BodyMeasurement.BODY_METRICS):
+        raise ValueError(f"Unknown metric '{metric}'")
+    if points is not None and points < 3:
+        raise ValueError('points must be at least 3')
+    try:
+        tzinfo = ZoneInfo(time_zone) if time_zone else timezone.get_current_timezone()
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone '{time_zone}'")
+
+    measurements = BodyMeasurement.objects.filter(
+        user_id=user_id,
+        metric=metric,
+        measurement_type__in=DEFAULT_SERIES_TYPES,
+    )
+    if start is not None:
+        measurements = measurements.filter(timestamp__gte=_as_datetime(start, tzinfo, time.min))
+    if end is not None:
+        measurements = measurements.filter(timestamp__lte=_as_datetime(end, tzinfo, time.max))
+
+    rows = measurements.bucketed(bucket, tzinfo=tzinfo)
+    bucket_count = len(rows)
+    if points is not None and bucket_count > points:
+        x = np.array([row[0].timestamp() for row in rows])
+        y = np.array([row[3] for row in rows])
+        rows = [rows[index] for index in lttb(x, y, points)]
+
+    return {
+        'user_id': user_id,
+        'metric': metric,
+        'bucket': bucket,
+        'time_zone': str(tzinfo),
+        'bucket_count': bucket_count,
+        'downsampled': len(rows) < bucket_count,
+        'series': [
+            {
+                'bucket': bucket_start.isoformat(),
+                'min': minimum,
+                'max': maximum,
+                'mean': mean,
+                'last': last,
+                'count': count,
+            }
+            for bucket_start, minimum, maximum, mean, last, count in rows
+        ],
+    }
+
+
+def _as_datetime(value: Union[str, date, datetime], tzinfo, default_time: time) -> datetime:
+    if isinstance(value, str):
+        parsed = parse_date(value) or parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"Invalid date '{value}'")
+        value = parsed
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, default_time)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, tzinfo)
+    return value
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+# Sent with ``pairs``, a set of (user_id, metric) tuples, whenever body
+# measurements are written through save(), delete(), bulk_create() or update().
+measurements_changed = Signal()
+
+
+@receiver(post_save, sender='goals.BodyMeasurement')
+def body_measurement_saved(sender, instance, created, **kwargs):
+    """Announce the pair of a saved measurement, and its previous pair if it moved"""
+    from .models import LatestMeasurement
+
+    pairs = {(instance.user_id, instance.metric)}
+    if not created:
+        pairs.update(
+            LatestMeasurement.objects.filter(measurement_id=instance.pk).values_list('user_id', 'metric')
+        )
+    measurements_changed.send(sender=sender, pairs=pairs)
+
+
+@receiver(post_delete, sender='goals.BodyMeasurement')
+def body_measurement_deleted(sender, instance, **kwargs):
+    """Announce the pair of a deleted measurement"""
+    measurements_changed.send(sender=sender, pairs={(instance.user_id, instance.metric)})
+
+
+@receiver(measurements_changed)
+def refresh_latest_measurements(sender, pairs, **kwargs):
+    """Keep the LatestMeasurement projection in sync with measurement writes"""
+    from .models import LatestMeasurement
+
+    LatestMeasurement.objects.refresh(pairs)
@@ -1,3 +1,382 @@
-from django.test import TestCase
+import json
+import uuid
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.responses import FastJsonResponse
+
+from .analytics import analyze_rows, lttb
+from .ingest import MeasurementIngestor, parse_ndjson
+from .models import BodyMeasurement, Goal, LatestMeasurement
+from .serializers import serialize_goals, serialize_measurements
+from .series import measurement_series
+
+
+class LatestMeasurementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='latest-user')
+        cls.goal = Goal.objects.create(user=cls.user, goal_type='weight_loss')
+        cls.now = timezone.now()
+
+    def measure(self, value, days_ago=0, metric='weight_kg', **kwargs):
+        return BodyMeasurement.objects.create(
+            user=self.user,
+            goal=self.goal,
+            metric=metric,
+            measurement_type='log',
+            value=value,
+            timestamp=self.now - timedelta(days=days_ago),
+            **kwargs,
+        )
+
+    def latest_values(self):
+        return dict(
+            LatestMeasurement.objects.filter(user=self.user).values_list('metric', 'measurement__value')
+        )
+
+    def test_save_keeps_newest_measurement(self):
+        self.measure(80, days_ago=1)
+        self.measure(82, days_ago=3)
+        self.measure(79, days_ago=0, metric='waist_cm')
+
+        self.assertEqual(self.latest_values(), {'weight_kg': 80, 'waist_cm': 79})
+
+    def test_editing_metric_moves_projection(self):
+        older = self.measure(82, days_ago=3)
+        newer = self.measure(80, days_ago=1)
+
+        newer.metric = 'hip_cm'
+        newer.save()
+
+        self.assertEqual(self.latest_values(), {'weight_kg': 82, 'hip_cm': 80})
+        self.assertEqual(LatestMeasurement.objects.get(metric='weight_kg').measurement_id, older.pk)
+
+    def test_delete_falls_back_to_previous_measurement(self):
+        self.measure(82, days_ago=3)
+        newer = self.measure(80, days_ago=1)
+
+        newer.delete()
+        self.assertEqual(self.latest_values(), {'weight_kg': 82})
+
+        BodyMeasurement.objects.filter(user=self.user).delete()
+        self.assertEqual(self.latest_values(), {})
+
+    def test_bulk_create_and_update(self):
+        BodyMeasurement.objects.bulk_create([
+            BodyMeasurement(
+                user=self.user,
+                metric='weight_kg',
+                measurement_type='log',
+                value=70 + days_ago,
+                timestamp=self.now - timedelta(days=days_ago),
+            )
+            for days_ago in range(10)
+        ])
+        self.assertEqual(self.latest_values(), {'weight_kg': 70})
+
+        BodyMeasurement.objects.filter(user=self.user, value=70).update(value=71.5)
+        self.assertEqual(self.latest_values(), {'weight_kg': 71.5})
+
+        BodyMeasurement.objects.filter(user=self.user, value=71.5).update(metric='neck_cm')
+        self.assertEqual(self.latest_values(), {'weight_kg': 71, 'neck_cm': 71.5})
+
+    def test_latest_lookup_is_a_single_query(self):
+        for days_ago in range(20):
+            self.measure(80 + days_ago, days_ago=days_ago)
+            self.measure(90 + days_ago, days_ago=days_ago, metric='waist_cm')
+
+        with self.assertNumQueries(1):
+            latest = [entry.measurement.to_dict() for entry in LatestMeasurement.objects.for_user(self.user.id)]
+
+        self.assertEqual([entry['value'] for entry in latest], [80, 90])
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now() - timedelta(days=28)
+
+    def rows(self, key, metric, values, measurement_type='log', step_days=7):
+        return [
+            (key, metric, measurement_type, value, self.start + timedelta(days=index * step_days))
+            for index, value in enumerate(values)
+        ]
+
+    def test_trend_statistics(self):
+        rows = self.rows('goal', 'weight_kg', [90, 89, 88, 87, 86])
+        rows.append(('goal', 'weight_kg', 'target', 80, self.start))
+
+        analysis = analyze_rows(rows[::-1])['goal']['weight_kg']
+
+        self.assertEqual(analysis['baseline'], 90)
+        self.assertEqual(analysis['current'], 86)
+        self.assertEqual(analysis['change'], -4)
+        self.assertAlmostEqual(analysis['slope_per_day'], -1 / 7)
+        self.assertAlmostEqual(analysis['weekly_rate'], -1)
+        self.assertAlmostEqual(analysis['moving_average'], 88)
+        self.assertEqual(analysis['trend'], 'improving')
+        self.assertAlmostEqual(analysis['progress_percent'], 40)
+        self.assertAlmostEqual(analysis['estimated_days_to_target'], 42)
+
+    def test_baseline_measurement_takes_precedence(self):
+        rows = self.rows('goal', 'waist_cm', [100, 98, 99])
+        rows.append(('goal', 'waist_cm', 'baseline', 101, self.start + timedelta(days=1)))
+
+        analysis = analyze_rows(rows)['goal']['waist_cm']
+
+        self.assertEqual(analysis['baseline'], 101)
+        self.assertEqual(analysis['trend'], 'declining')
+
+    def test_groups_are_analyzed_independently(self):
+        rows = (
+            self.rows('a', 'weight_kg', [70, 72])
+            + self.rows('b', 'weight_kg', [60])
+            + self.rows('b', 'hip_cm', [95], measurement_type='target')
+        )
+
+        analyses = analyze_rows(rows)
+
+        self.assertEqual(analyses['a']['weight_kg']['trend'], 'improving')
+        self.assertEqual(analyses['b'], {'weight_kg': {'current': 60, 'status': 'single_measurement'}})
+        self.assertEqual(analyze_rows([]), {})
+
+
+class MeasurementSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='series-user')
+        start = datetime(2025, 1, 1, 8, tzinfo=dt_timezone.utc)
+        rows = [
+            BodyMeasurement(user=cls.user, metric='weight_kg', measurement_type='log',
+                            value=90 - day * 0.1 + hour, timestamp=start + timedelta(days=day, hours=hour))
+            for day in range(90)
+            for hour in (0, 2)
+        ]
+        rows.append(BodyMeasurement(user=cls.user, metric='weight_kg', measurement_type='target',
+                                    value=70, timestamp=start + timedelta(hours=1)))
+        BodyMeasurement.objects.bulk_create(rows)
+
+    def test_daily_buckets_are_aggregated_in_one_query(self):
+        with self.assertNumQueries(1):
+            series = measurement_series(self.user.id, 'weight_kg', start='2025-01-01', end='2025-01-10')
+
+        self.assertEqual(series['bucket_count'], 10)
+        first = series['series'][0]
+        self.assertEqual(first['bucket'], '2025-01-01T00:00:00+00:00')
+        self.assertEqual((first['min'], first['max'], first['last'], first['count']), (90, 92, 92, 2))
+        self.assertAlmostEqual(first['mean'], 91)
+
+    def test_week_and_month_buckets(self):
+        monthly = measurement_series(self.user.id, 'weight_kg', bucket='month')
+        self.assertEqual([point['count'] for point in monthly['series']], [62, 56, 62])
+        self.assertEqual(monthly['series'][1]['bucket'], '2025-02-01T00:00:00+00:00')
+
+        weekly = measurement_series(self.user.id, 'weight_kg', bucket='week')
+        self.assertEqual(sum(point['count'] for point in weekly['series']), 180)
+        self.assertEqual(weekly['series'][0]['bucket'], '2024-12-30T00:00:00+00:00')
+
+    def test_time_zone_shifts_bucket_boundaries(self):
+        series = measurement_series(self.user.id, 'weight_kg', start='2025-01-01', end='2025-01-01',
+                                    time_zone='America/Los_Angeles')
+
+        # 08:00 and 10:00 UTC are midnight and 2am in Los Angeles.
+        self.assertEqual([point['count'] for point in series['series']], [2])
+        self.assertEqual(series['series'][0]['bucket'], '2025-01-01T00:00:00-08:00')
+
+    def test_downsampling_keeps_endpoints(self):
+        series = measurement_series(self.user.id, 'weight_kg', points=10)
+
+        self.assertTrue(series['downsampled'])
+        self.assertEqual(series['bucket_count'], 90)
+        self.assertEqual(len(series['series']), 10)
+        self.assertEqual(series['series'][0]['bucket'], '2025-01-01T00:00:00+00:00')
+        self.assertEqual(series['series'][-1]['bucket'], '2025-03-31T00:00:00+00:00')
+
+    def test_invalid_arguments(self):
+        for kwargs in ({'bucket': 'year'}, {'points': 1}, {'start': 'soon'}, {'time_zone': 'Mars/Base'}):
+            with self.assertRaises(ValueError):
+                measurement_series(self.user.id, 'weight_kg', **kwargs)
+
+    def test_endpoint(self):
+        url = reverse('goals:measurement_series', args=[self.user.id])
+
+        response = self.client.get(url, {'metric': 'weight_kg', 'bucket': 'month'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['series']), 3)
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'metric': 'weight_kg', 'bucket': 'year'}).status_code, 400)
+
+    def test_lttb_picks_extremes(self):
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[37] = 10
+        y[71] = -10
+
+        kept = lttb(x, y, 5)
+
+        self.assertEqual(kept[0], 0)
+        self.assertEqual(kept[-1], 99)
+        self.assertIn(37, kept)
+        self.assertIn(71, kept)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+
+
+class IngestMeasurementsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='ingest-user')
+        cls.other = User.objects.create_user(username='ingest-other')
+        cls.goal = Goal.objects.create(user=cls.user, goal_type='weight_loss')
+        cls.foreign_goal = Goal.objects.create(user=cls.other, goal_type='strength')
+
+    def post(self, body, content_type='application/x-ndjson', user=None):
+        url = reverse('goals:ingest_measurements', args=[(user or self.user).id])
+        return self.client.post(url, data=body, content_type=content_type)
+
+    def test_ndjson_rows_are_validated_and_deduplicated(self):
+        BodyMeasurement.objects.create(user=self.user, metric='weight_kg', measurement_type='log',
+                                       value=80, timestamp=datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        lines = [
+            {'metric': 'weight_kg', 'value': 80, 'timestamp': '2025-01-01T00:00:00Z'},
+            {'metric': 'weight_kg', 'value': 79.5, 'timestamp': '2025-01-02T00:00:00Z', 'goal_id': str(self.goal.id)},
+            {'metric': 'weight_kg', 'value': 79.5, 'timestamp': '2025-01-02T02:00:00+02:00'},
+            {'metric': 'waist_cm', 'value': 90, 'timestamp': '2025-01-02T00:00:00Z', 'measurement_type': 'baseline'},
+            {'metric': 'shoe_size', 'value': 44, 'timestamp': '2025-01-02T00:00:00Z'},
+            {'metric': 'weight_kg', 'value': 'heavy', 'timestamp': '2025-01-03T00:00:00Z'},
+            {'metric': 'weight_kg', 'value': 79, 'timestamp': '2025-01-03T00:00:00Z', 'measurement_type': 'guess'},
+            {'metric': 'weight_kg', 'value': 79, 'timestamp': '2025-01-04T00:00:00Z', 'goal_id': str(self.foreign_goal.id)},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n{not json\n\n'
+
+        response = self.post(body)
+
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(
+            (report['received'], report['created'], report['duplicates'], report['error_count']),
+            (9, 2, 2, 5),
+        )
+        self.assertEqual([error['line'] for error in report['errors']], [5, 6, 7, 8, 9])
+        self.assertEqual(BodyMeasurement.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(BodyMeasurement.objects.get(user=self.user, value=79.5).goal, self.goal)
+        self.assertEqual(
+            LatestMeasurement.objects.get(user=self.user, metric='weight_kg').measurement.value, 79.5
+        )
+
+    @override_settings(MEASUREMENT_INGEST_BATCH_SIZE=3)
+    def test_csv_is_written_in_batches(self):
+        rows = ['metric,value,timestamp'] + [
+            f'weight_kg,{80 - day / 10},2025-01-{day:02d}T07:00:00Z' for day in range(1, 11)
+        ]
+        # Duplicates spanning two batches are caught by the database lookup.
+        rows += ['weight_kg,70,2025-01-01T07:00:00Z', 'weight_kg,70,2025-01-10T07:00:00Z']
+
+        # User check, then per batch: duplicate lookup, insert in a savepoint
+        # and the LatestMeasurement refresh (select and upsert).
+        with self.assertNumQueries(1 + 6 * 4):
+            response = self.post('\r\n'.join(rows), content_type='text/csv')
+
+        report = response.json()
+        self.assertEqual((report['received'], report['created'], report['duplicates']), (12, 10, 2))
+        self.assertEqual(BodyMeasurement.objects.filter(user=self.user).count(), 10)
+
+    def test_csv_keeps_going_after_an_invalid_line(self):
+        body = (
+            b'metric,value,timestamp\n'
+            b'weight_kg,80,2025-01-01T07:00:00Z\n'
+            b'weight_kg,\xff79,2025-01-02T07:00:00Z\n'
+            b'weight_kg,78,2025-01-03T07:00:00Z\n'
+            b'weight_kg,77,2025-01-04T07:00:00Z\n'
+        )
+
+        report = self.post(body, content_type='text/csv').json()
+
+        self.assertEqual((report['received'], report['created'], report['error_count']), (4, 3, 1))
+        self.assertEqual(report['errors'][0]['line'], 3)
+        self.assertIn('Invalid UTF-8', report['errors'][0]['error'])
+        self.assertEqual(
+            sorted(BodyMeasurement.objects.filter(user=self.user).values_list('value', flat=True)), [77, 78, 80],
+        )
+
+    def test_points_stored_concurrently_are_not_duplicated(self):
+        BodyMeasurement.objects.create(user=self.user, metric='weight_kg', measurement_type='log',
+                                       value=80, timestamp=datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        lines = [
+            b'{"metric": "weight_kg", "value": 80, "timestamp": "2025-01-01T00:00:00Z"}',
+            b'{"metric": "weight_kg", "value": 79, "timestamp": "2025-01-02T00:00:00Z"}',
+        ]
+        ingestor = MeasurementIngestor(self.user.id)
+        deduplicate = ingestor._deduplicate
+        lookups = []
+
+        def stale_first_lookup(measurements):
+            # The first lookup ran before another upload stored the point.
+            lookups.append(measurements)
+            return list(measurements) if len(lookups) == 1 else deduplicate(measurements)
+
+        with mock.patch.object(ingestor, '_deduplicate', side_effect=stale_first_lookup):
+            report = ingestor.ingest(parse_ndjson(lines))
+
+        self.assertEqual((report['created'], report['duplicates']), (1, 1))
+        self.assertEqual(BodyMeasurement.objects.filter(user=self.user).count(), 2)
+
+    def test_rejects_unknown_content_type_and_user(self):
+        self.assertEqual(self.post('{}', content_type='application/json').status_code, 415)
+        url = reverse('goals:ingest_measurements', args=[999999])
+        self.assertEqual(self.client.post(url, data='metric,value,timestamp', content_type='text/csv').status_code, 404)
+
+
+class SerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='serializer-user')
+        goal = Goal.objects.create(user=cls.user, goal_type='weight_loss', target_date=timezone.now().date() + timedelta(days=30))
+        Goal.objects.create(user=cls.user, goal_type='general_fitness', notes='Move more')
+        now = timezone.now()
+        BodyMeasurement.objects.create(user=cls.user, goal=goal, metric='weight_kg',
+                                       measurement_type='baseline', value=82.5, timestamp=now)
+        BodyMeasurement.objects.create(user=cls.user, metric='body_fat_percentage',
+                                       measurement_type='log', value=21, timestamp=now - timedelta(days=1))
+
+    def test_output_matches_to_dict(self):
+        goals = Goal.objects.filter(user=self.user)
+        measurements = BodyMeasurement.objects.filter(user=self.user).order_by('id')
+
+        self.assertEqual(serialize_goals(goals), [goal.to_dict() for goal in goals])
+        self.assertEqual(serialize_measurements(measurements), [m.to_dict() for m in measurements])
+        self.assertEqual(
+            serialize_measurements(LatestMeasurement.objects.for_user(self.user.id), prefix='measurement__'),
+            [entry.measurement.to_dict() for entry in LatestMeasurement.objects.for_user(self.user.id)],
+        )
+
+    def test_serializers_do_not_hydrate_related_goals(self):
+        with self.assertNumQueries(1):
+            serialize_measurements(BodyMeasurement.objects.filter(user=self.user))
+
+    def test_fast_json_response_matches_json_response(self):
+        data = {
+            'id': uuid.uuid4(),
+            'timestamp': timezone.now(),
+            'date': timezone.now().date(),
+            'amount': Decimal('1.50'),
+            'items': [1, 2.5, None, 'text'],
+            1: 'non-string key',
+        }
+
+        self.assertEqual(
+            json.loads(FastJsonResponse(data).content),
+            json.loads(JsonResponse(data).content),
+        )
+        self.assertEqual(FastJsonResponse(data)['Content-Type'], 'application/json')
+        with self.assertRaises(TypeError):
+            FastJsonResponse([1, 2])
@@ -4,6 +4,6 @@ from . import views
 app_name = 'goals'
 
 urlpatterns = [
-    # Add your meal-related URL patterns here
-    # Example: path('', views.meal_list, name='meal_list'),
+    path('api/measurements/<int:user_id>/series/', views.measurement_series_view, name='measurement_series'),
+    path('api/measurements/<int:user_id>/ingest/', views.ingest_measurements, name='ingest_measurements'),
 ]
@@ -1,3 +1,65 @@
-from django.shortcuts import render
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 
-# Create your views here.
+from apps.responses import FastJsonResponse
+
+from .ingest import CSV_CONTENT_TYPES, NDJSON_CONTENT_TYPES, MeasurementIngestor, parse_csv, parse_ndjson
+from .series import measurement_series
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def measurement_series_view(request, user_id):
+    """
+    Get a user's measurements of one metric aggregated into time buckets
+    
+    Query parameters: ``metric`` (required), ``bucket`` (``day``, ``week`` or
+    ``month``, default ``day``), ``start`` and ``end`` (ISO dates or
+    datetimes), ``points`` (LTTB downsampling target) and ``tz``.
+    """
+    metric = request.GET.get('metric')
+    if not metric:
+        return JsonResponse({'error': 'metric is required'}, status=400)
+    
+    try:
+        points = request.GET.get('points')
+        series = measurement_series(
+            user_id,
+            metric,
+            bucket=request.GET.get('bucket', 'day'),
+            start=request.GET.get('start'),
+            end=request.GET.get('end'),
+            points=int(points) if points else None,
+            time_zone=request.GET.get('tz'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return FastJsonResponse(series)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def ingest_measurements(request, user_id):
+    """
+    Bulk-import a user's measurements from an NDJSON or CSV body
+    
+    Each row has ``metric``, ``value``, ``timestamp`` (ISO datetime) and
+    optionally ``measurement_type`` (default ``log``) and ``goal_id``. The body
+    is read as a stream; rows already stored for the same metric and timestamp
+    are skipped and invalid rows are reported without failing the upload.
+    """
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        parse = parse_ndjson
+    elif request.content_type in CSV_CONTENT_TYPES:
+        parse = parse_csv
+    else:
+        return JsonResponse({'error': 'Expected an application/x-ndjson or text/csv body'}, status=415)
+    
+    if not User.objects.filter(id=user_id).exists():
+        return JsonResponse({'error': f'User with ID {user_id} not found'}, status=404)
+    
+    report = MeasurementIngestor(user_id).ingest(parse(request))
+    return FastJsonResponse(report)
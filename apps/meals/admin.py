@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Meal, Ingredient, MealIngredient, MealRecord, MealPreference
+from .models import Barcode, Meal, MealPhoto, Ingredient, MealIngredient, MealRecord, MealPreference, NutritionProfile, DailyIntake
 
 # Register your models here.
 admin.site.register(Meal)
@@ -7,3 +7,7 @@ admin.site.register(MealIngredient)
 admin.site.register(Ingredient)
 admin.site.register(MealRecord)
 admin.site.register(MealPreference)
+admin.site.register(NutritionProfile)
+admin.site.register(DailyIntake)
+admin.site.register(Barcode)
+admin.site.register(MealPhoto)
@@ -0,0 +1,279 @@
+import math
+import threading
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.caching import LRUCache, VersionStamp
+
+from .nutrition import NUTRIENT_FIELDS
+
+# EAN-8, UPC-A, EAN-13 and GTIN-14
+GTIN_LENGTHS = (8, 12, 13, 14)
+GTIN_LENGTH = 14
+
+# Ingredient field and the product dump columns it is read from, own name
+# first, then the Open Food Facts name
+NUTRIENT_COLUMNS = {
+    'proteins': ('proteins', 'proteins_100g'),
+    'fats': ('fats', 'fat_100g'),
+    'carbs': ('carbs', 'carbohydrates_100g'),
+    'calories': ('calories', 'energy-kcal_100g'),
+    'fibers': ('fibers', 'fiber_100g'),
+    'sugars': ('sugars', 'sugars_100g'),
+}
+CODE_COLUMNS = ('gtin', 'barcode', 'code')
+NAME_COLUMNS = ('name', 'product_name')
+
+_MISSING = object()
+
+
+def gtin_check_digit(digits: str) -> int:
+    """GS1 mod-10 check digit of a GTIN without its check digit"""
+    total = sum(int(digit) * (3 if index % 2 == 0 else 1) for index, digit in enumerate(reversed(digits)))
+    return (10 - total % 10) % 10
+
+
+def normalize_gtin(code: str) -> str:
+    """
+    Normalize an EAN or UPC barcode to its 14-digit GTIN.
+
+    Spaces and dashes are ignored. EAN-8, UPC-A, EAN-13 and GTIN-14 codes
+    are zero-padded on the left, so the UPC-A and EAN-13 spellings of the
+    same product share one key.
+
+    Args:
+        code: Barcode as scanned or typed
+
+    Returns:
+        14-digit GTIN
+
+    Raises:
+        ValueError: If the code has the wrong length or check digit
+    """
+    digits = ''.join(str(code or '').replace('-', '').split())
+    if not digits.isascii() or not digits.isdigit() or len(digits) not in GTIN_LENGTHS:
+        raise ValueError(f'Invalid barcode {code!r}: expected 8, 12, 13 or 14 digits')
+    if gtin_check_digit(digits[:-1]) != int(digits[-1]):
+        raise ValueError(f'Invalid barcode {code!r}: wrong check digit')
+    return digits.zfill(GTIN_LENGTH)
+
+
+class BarcodeResolver:
+    """
+    Bounded, process-wide LRU of barcode lookups.
+
+    Both hits and misses are cached, so repeated scans of an unknown product
+    don't reach the database either. The whole cache is dropped when the
+    shared version stamp changes, which happens on every barcode write.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self.version_stamp = VersionStamp('meals:barcodes:version')
+        self._maxsize = maxsize
+        self._cache: Optional[LRUCache] = None
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self) -> LRUCache:
+        if self._cache is None:
+            self._cache = LRUCache(self._maxsize or settings.BARCODE_CACHE_SIZE)
+        return self._cache
+
+    def invalidate(self) -> None:
+        """Drop every process's cached lookups"""
+        self.version_stamp.bump()
+
+    def clear(self) -> None:
+        """Drop this process's cached lookups and counters"""
+        with self._lock:
+            self.cache.clear()
+            self._version = None
+            self.hits = self.misses = 0
+
+    def resolve(self, code: str) -> Optional[int]:
+        """
+        Return the id of the ingredient a barcode belongs to.
+
+        Args:
+            code: Barcode in any supported format
+
+        Returns:
+            Ingredient id, or None if the barcode is not registered
+
+        Raises:
+            ValueError: If the code is not a valid GTIN
+        """
+        from .models import Barcode
+
+        gtin = normalize_gtin(code)
+        version = self.version_stamp.current()
+        with self._lock:
+            if version != self._version:
+                self.cache.clear()
+                self._version = version
+            ingredient_id = self.cache.get(gtin, _MISSING)
+            if ingredient_id is not _MISSING:
+                self.hits += 1
+                return ingredient_id
+            self.misses += 1
+
+        ingredient_id = Barcode.objects.filter(gtin=gtin).values_list('ingredient_id', flat=True).first()
+        with self._lock:
+            # Another thread may have moved to a newer version during the query.
+            if self._version == version:
+                self.cache.set(gtin, ingredient_id)
+        return ingredient_id
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self.cache), 'maxsize': self.cache.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+barcode_resolver = BarcodeResolver()
+
+
+def _first(row: Dict[str, Any], columns: Iterable[str]) -> Any:
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _nutrient(row: Dict[str, Any], field: str) -> float:
+    value = _first(row, NUTRIENT_COLUMNS[field])
+    if value is None:
+        return 0.0
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {field}: {value!r}')
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f'Invalid {field}: {value!r}')
+    return value
+
+
+class BarcodeImporter:
+    """
+    Loads barcode rows from a product dump in chunks.
+
+    Each row needs a barcode column (gtin, barcode or code) and either an
+    ingredient_id of an existing ingredient, or a product name with
+    nutrients per 100 g (this model's names or the Open Food Facts
+    ``*_100g`` columns) to create one from. Every chunk is validated with a
+    fixed number of queries and written with bulk_create in its own
+    transaction. Barcodes already registered, or repeated earlier in the
+    dump, are skipped.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None, max_errors: int = 100, source: str = ''):
+        self.chunk_size = chunk_size or settings.BARCODE_IMPORT_CHUNK_SIZE
+        self.max_errors = max_errors
+        self.source = source
+        self.received = 0
+        self.created = 0
+        self.ingredients_created = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def import_rows(self, rows: Iterable[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Import (line number, row) pairs.
+
+        Returns:
+            Report with received, created, ingredients_created, duplicate and
+            error counts and the first max_errors per-row errors
+        """
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                self._import_chunk(chunk)
+
+        return {
+            'received': self.received,
+            'created': self.created,
+            'ingredients_created': self.ingredients_created,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def _import_chunk(self, chunk: List[Tuple[int, Dict[str, Any]]]) -> None:
+        from .models import Barcode, Ingredient
+
+        errors = []
+        parsed = {}
+        for line_number, row in chunk:
+            self.received += 1
+            try:
+                gtin = normalize_gtin(_first(row, CODE_COLUMNS))
+                if gtin in parsed:
+                    self.duplicates += 1
+                    continue
+                parsed[gtin] = (line_number, self._target(row))
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+
+        registered = set(Barcode.objects.filter(gtin__in=parsed).values_list('gtin', flat=True))
+        self.duplicates += len(registered)
+        pending = {gtin: target for gtin, target in parsed.items() if gtin not in registered}
+
+        ingredient_ids = {target for _, target in pending.values() if isinstance(target, int)}
+        existing = set(Ingredient.objects.filter(pk__in=ingredient_ids).values_list('pk', flat=True))
+        new_ingredients = []
+        barcodes = []
+        for gtin, (line_number, target) in pending.items():
+            if isinstance(target, int):
+                if target not in existing:
+                    errors.append((line_number, f'Unknown ingredient_id: {target}'))
+                    continue
+                barcodes.append(Barcode(gtin=gtin, ingredient_id=target, source=self.source))
+            else:
+                new_ingredients.append(target)
+                barcodes.append(Barcode(gtin=gtin, ingredient=target, source=self.source))
+
+        for line_number, error in sorted(errors):
+            self._error(line_number, error)
+
+        if new_ingredients:
+            # Primary keys are set on the objects, and so on their barcodes.
+            Ingredient.objects.bulk_create(new_ingredients)
+            self.ingredients_created += len(new_ingredients)
+        if barcodes:
+            Barcode.objects.bulk_create(barcodes)
+            self.created += len(barcodes)
+
+    def _target(self, row: Dict[str, Any]):
+        """Existing ingredient id, or an unsaved Ingredient built from the row"""
+        from .models import Ingredient
+
+        ingredient_id = row.get('ingredient_id')
+        if ingredient_id not in (None, ''):
+            try:
+                return int(ingredient_id)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid ingredient_id: {ingredient_id!r}')
+
+        name = _first(row, NAME_COLUMNS)
+        if not name or not str(name).strip():
+            raise ValueError('ingredient_id or a product name is required')
+        if _first(row, NUTRIENT_COLUMNS['calories']) is None:
+            raise ValueError('calories are required to create an ingredient')
+        return Ingredient(
+            name=str(name).strip()[:255],
+            **{field: _nutrient(row, field) for field in NUTRIENT_FIELDS},
+        )
+
+    def _error(self, line_number: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_number, 'error': message})
@@ -0,0 +1,167 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from apps.caching import VersionStamp
+
+# A category's path lists the ids from its root down to itself, e.g. '/1/5/12/'
+PATH_SEPARATOR = '/'
+
+
+def child_path(parent_path: Optional[str], pk: int) -> str:
+    """Path of a category with the given id under a parent path, or at the root"""
+    return f'{parent_path or PATH_SEPARATOR}{pk}{PATH_SEPARATOR}'
+
+
+def path_depth(path: str) -> int:
+    """Depth of a path, 0 for roots"""
+    return path.count(PATH_SEPARATOR) - 2
+
+
+def path_ids(path: str) -> List[int]:
+    """Category ids along a path, root first"""
+    return [int(pk) for pk in path.strip(PATH_SEPARATOR).split(PATH_SEPARATOR) if pk]
+
+
+def path_range(path: str) -> Tuple[str, str]:
+    """
+    Half-open [low, high) range holding a path and every path below it.
+
+    '0' sorts right after the separator in byte order, which the path column
+    compares in on every backend, so the range is a plain index scan, unlike
+    LIKE 'prefix%', which SQLite only runs through an index for
+    case-insensitive columns.
+    """
+    return path, path[:-1] + chr(ord(PATH_SEPARATOR) + 1)
+
+
+def build_paths(rows: Iterable[Tuple[int, Optional[int]]]) -> Dict[int, str]:
+    """
+    Compute the path of every category from (id, parent_id) rows.
+
+    Args:
+        rows: (id, parent_id) of every category
+
+    Returns:
+        Mapping of category id to path. Categories caught in a parent cycle
+        are left out.
+    """
+    parents = dict(rows)
+    paths: Dict[int, str] = {}
+    for pk in parents:
+        chain = []
+        current: Optional[int] = pk
+        while current is not None and current not in paths and current not in chain:
+            chain.append(current)
+            current = parents.get(current)
+        if current is not None and current not in paths:
+            continue
+        prefix = paths[current] if current is not None else None
+        for node in reversed(chain):
+            prefix = paths[node] = child_path(prefix, node)
+    return paths
+
+
+class CategoryNode(NamedTuple):
+    id: int
+    name: str
+    parent_id: Optional[int]
+    path: str
+    depth: int
+
+
+class CategoryTree:
+    """
+    Process-wide snapshot of the category hierarchy.
+
+    All categories are loaded with one query and kept with their children
+    lists, so descendants, ancestors and the nested tree are answered from
+    memory. The snapshot reloads when the shared version stamp changes,
+    which happens whenever a category is written or deleted.
+    """
+
+    def __init__(self):
+        self.version_stamp = VersionStamp('meals:category_tree:version')
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._nodes: Dict[int, CategoryNode] = {}
+        self._children: Dict[Optional[int], List[int]] = {}
+
+    def invalidate(self) -> None:
+        """Force every process to reload the snapshot on next use"""
+        self.version_stamp.bump()
+
+    def clear(self) -> None:
+        """Drop this process's copy of the snapshot"""
+        with self._lock:
+            self._version = None
+
+    def get(self, category_id: int) -> Optional[CategoryNode]:
+        """Return a category, if it exists"""
+        return self._current()[0].get(category_id)
+
+    def children(self, category_id: Optional[int]) -> List[CategoryNode]:
+        """Direct children of a category, or the roots for None"""
+        nodes, children = self._current()
+        return [nodes[pk] for pk in children.get(category_id, ())]
+
+    def ancestors(self, category_id: int) -> List[CategoryNode]:
+        """Ancestors of a category, root first"""
+        nodes = self._current()[0]
+        node = nodes.get(category_id)
+        if node is None:
+            return []
+        return [nodes[pk] for pk in path_ids(node.path)[:-1] if pk in nodes]
+
+    def descendant_ids(self, category_id: int, include_self: bool = True) -> Set[int]:
+        """Ids of every category below a category; empty if it does not exist"""
+        nodes, children = self._current()
+        if category_id not in nodes:
+            return set()
+        found = {category_id} if include_self else set()
+        stack = list(children.get(category_id, ()))
+        while stack:
+            pk = stack.pop()
+            found.add(pk)
+            stack.extend(children.get(pk, ()))
+        return found
+
+    def as_tree(self, category_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Nested {id, name, children} dictionaries below a category, or of the whole tree"""
+        nodes, children = self._current()
+
+        def build(parent_id):
+            return [
+                {'id': pk, 'name': nodes[pk].name, 'children': build(pk)}
+                for pk in children.get(parent_id, ())
+            ]
+
+        return build(category_id)
+
+    def _current(self) -> Tuple[Dict[int, CategoryNode], Dict[Optional[int], List[int]]]:
+        version = self.version_stamp.current()
+        if version != self._version:
+            self._load(version)
+        return self._nodes, self._children
+
+    def _load(self, version: int) -> None:
+        from .models import Category
+
+        with self._lock:
+            if self._version == version:
+                return
+            nodes = {
+                row[0]: CategoryNode(*row)
+                for row in Category.objects.order_by('name', 'pk').values_list(
+                    'pk', 'name', 'parent_id', 'path', 'depth'
+                )
+            }
+            children: Dict[Optional[int], List[int]] = defaultdict(list)
+            for node in nodes.values():
+                children[node.parent_id].append(node.id)
+            self._nodes = nodes
+            self._children = dict(children)
+            self._version = version
+
+
+category_tree = CategoryTree()
@@ -0,0 +1,129 @@
+import threading
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+from apps.caching import VersionStamp
+
+# Preference types that rule an ingredient out of a user's meals
+EXCLUDING_PREFERENCES = ('allergy', 'restriction', 'hate')
+
+# Seconds the ids of changed meals are kept for processes to catch up with
+CHANGES_TIMEOUT = 24 * 60 * 60
+
+# Versions a snapshot may be behind and still be patched instead of reloaded
+MAX_PATCHED_VERSIONS = 100
+
+# Changed meals read per query when patching
+PATCH_BATCH_SIZE = 500
+
+
+class MealSetIndex:
+    """
+    Process-wide snapshot of the ingredient set of every meal.
+
+    The sets are read from the precomputed Meal.ingredient_ids column,
+    along with an inverted index from each ingredient to the meals using
+    it, so a user's exclusions are resolved with a few set unions. Writers
+    bump the shared version stamp and publish the ids of the meals they
+    changed under the new version; a process a few versions behind re-reads
+    just those meals, and reloads every meal only when a change list is
+    missing or it fell too far behind.
+    """
+
+    def __init__(self):
+        self.version_stamp = VersionStamp('meals:meal_sets:version')
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._sets: Dict[int, FrozenSet[int]] = {}
+        self._meals_by_ingredient: Dict[int, Set[int]] = defaultdict(set)
+
+    @property
+    def cache(self):
+        return self.version_stamp.cache
+
+    def invalidate(self, meal_ids: Optional[Iterable[int]] = None) -> None:
+        """
+        Make every process refresh the snapshot on next use.
+
+        Args:
+            meal_ids: Meals whose ingredient set changed, or that were added
+                or deleted; every meal is reloaded if None
+        """
+        version = self.version_stamp.bump()
+        if meal_ids is not None:
+            self.cache.set(self._changes_key(version), sorted(set(meal_ids)), timeout=CHANGES_TIMEOUT)
+
+    def clear(self) -> None:
+        """Drop this process's copy of the snapshot"""
+        with self._lock:
+            self._version = None
+
+    def incompatible_ids(self, excluded: Iterable[int]) -> Set[int]:
+        """Ids of the meals containing any of the excluded ingredients"""
+        self._ensure_loaded()
+        with self._lock:
+            return set().union(*(self._meals_by_ingredient.get(pk, ()) for pk in set(excluded)))
+
+    def compatible_ids(self, excluded: Iterable[int], meal_ids: Optional[Iterable[int]] = None) -> Set[int]:
+        """
+        Ids of the meals containing none of the excluded ingredients.
+
+        Args:
+            excluded: Ingredient ids to avoid
+            meal_ids: Optional candidate meals, all meals by default
+
+        Returns:
+            Set of meal ids
+        """
+        incompatible = self.incompatible_ids(excluded)
+        with self._lock:
+            candidates = set(self._sets) if meal_ids is None else set(meal_ids)
+        return candidates - incompatible
+
+    def _ensure_loaded(self) -> None:
+        version = self.version_stamp.current()
+        if version == self._version:
+            return
+        with self._lock:
+            if self._version == version:
+                return
+            if self._version is not None and 0 < version - self._version <= MAX_PATCHED_VERSIONS:
+                keys = [self._changes_key(behind) for behind in range(self._version + 1, version + 1)]
+                changes = self.cache.get_many(keys)
+                if len(changes) == len(keys):
+                    self._patch(set().union(*changes.values()))
+                    self._version = version
+                    return
+            self._load()
+            self._version = version
+
+    def _load(self) -> None:
+        from .models import Meal
+
+        self._sets, self._meals_by_ingredient = {}, defaultdict(set)
+        for pk, ingredients in Meal.objects.values_list('pk', 'ingredient_ids').iterator(chunk_size=5000):
+            self._add(pk, ingredients)
+
+    def _patch(self, meal_ids: Set[int]) -> None:
+        from .models import Meal
+
+        meal_ids = sorted(meal_ids)
+        for start in range(0, len(meal_ids), PATCH_BATCH_SIZE):
+            batch = meal_ids[start:start + PATCH_BATCH_SIZE]
+            rows = dict(Meal.objects.filter(pk__in=batch).values_list('pk', 'ingredient_ids'))
+            for pk in batch:
+                for ingredient_id in self._sets.pop(pk, ()):
+                    self._meals_by_ingredient[ingredient_id].discard(pk)
+                if pk in rows:
+                    self._add(pk, rows[pk])
+
+    def _add(self, pk: int, ingredients: Iterable[int]) -> None:
+        self._sets[pk] = frozenset(ingredients)
+        for ingredient_id in self._sets[pk]:
+            self._meals_by_ingredient[ingredient_id].add(pk)
+
+    def _changes_key(self, version: int) -> str:
+        return f'meals:meal_sets:changes:{version}'
+
+
+meal_sets = MealSetIndex()
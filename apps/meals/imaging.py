@@ -0,0 +1,52 @@
+import io
+from typing import Any, Dict
+
+from PIL import ExifTags, Image, ImageOps
+
+# Only Pillow is imported here, never Django, so these functions can run in
+# spawned worker processes without setting up the project.
+
+
+def _encode(image: Image.Image, size: int, format: str, quality: int) -> bytes:
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    # No exif= or icc_profile= is passed, so no metadata is written.
+    variant.save(buffer, format=format, quality=quality, optimize=format == 'JPEG')
+    return buffer.getvalue()
+
+
+def render_variants(data: bytes, thumbnail_size: int, webp_size: int, quality: int) -> Dict[str, Any]:
+    """
+    Decode an uploaded photo and render its downscaled variants.
+
+    The EXIF orientation is applied to the pixels first, then every variant
+    is encoded without EXIF or other metadata. JPEG sources are decoded
+    at a reduced scale when the largest variant allows it.
+
+    Args:
+        data: Original file contents
+        thumbnail_size: Longest side of the JPEG thumbnail, in pixels
+        webp_size: Longest side of the WebP display variant, in pixels
+        quality: Encoder quality of both variants, 1-100
+
+    Returns:
+        Dictionary with the original width and height, as displayed, and the
+        thumbnail and webp variant bytes
+
+    Raises:
+        PIL.UnidentifiedImageError: If the data is not a supported image
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        transposed = image.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8)
+        width, height = (image.height, image.width) if transposed else image.size
+        image.draft('RGB', (webp_size, webp_size))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+        webp = _encode(image, webp_size, 'WEBP', quality)
+        flattened = Image.new('RGB', image.size, 'white')
+        flattened.paste(image, mask=image.getchannel('A') if image.mode == 'RGBA' else None)
+        thumbnail = _encode(flattened, thumbnail_size, 'JPEG', quality)
+
+    return {'width': width, 'height': height, 'thumbnail': thumbnail, 'webp': webp}
@@ -0,0 +1,90 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from meals.models import Ingredient
+from meals.search import ingredient_index, search_ingredients
+
+ADJECTIVES = (
+    'raw', 'boiled', 'smoked', 'grilled', 'roasted', 'dried', 'frozen', 'canned', 'fresh', 'baked',
+    'steamed', 'fried', 'salted', 'unsalted', 'organic', 'wholegrain', 'low fat', 'sweetened', 'plain', 'spicy',
+)
+FOODS = (
+    'chicken', 'turkey', 'beef', 'pork', 'salmon', 'tuna', 'cod', 'shrimp', 'egg', 'tofu',
+    'lentils', 'chickpeas', 'beans', 'rice', 'oats', 'quinoa', 'buckwheat', 'barley', 'pasta', 'bread',
+    'potato', 'sweet potato', 'carrot', 'broccoli', 'spinach', 'kale', 'cabbage', 'tomato', 'cucumber', 'pepper',
+    'apple', 'banana', 'orange', 'strawberry', 'blueberry', 'mango', 'pineapple', 'avocado', 'almond', 'walnut',
+    'yogurt', 'cheese', 'milk', 'butter', 'cream', 'honey', 'chocolate', 'peanut butter', 'olive oil', 'mushroom',
+)
+FORMS = (
+    'breast', 'thigh', 'fillet', 'slices', 'chunks', 'puree', 'flakes', 'flour', 'juice', 'soup',
+    'salad', 'mix', 'paste', 'powder', 'sticks', 'bites', 'spread', 'sauce', 'bar', 'pieces',
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure ingredient autocomplete latency on synthetic names and check it against a p99 target'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Synthetic ingredients')
+        parser.add_argument('--queries', type=int, default=2000, help='Timed searches')
+        parser.add_argument('--limit', type=int, default=10, help='Results per search')
+        parser.add_argument('--p99-ms', type=float, default=25.0, help='Fail above this p99 latency')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        names = [
+            ' '.join((generator.choice(ADJECTIVES), generator.choice(FOODS), generator.choice(FORMS)))
+            + (f' {generator.randrange(1000)}' if generator.random() < 0.5 else '')
+            for _ in range(options['rows'])
+        ]
+        queries = [self.query(generator, generator.choice(names)) for _ in range(options['queries'])]
+
+        # Everything is written inside a transaction that is rolled back.
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, proteins=10, fats=5, carbs=20, calories=165, fibers=2, sugars=1)
+                    for name in names
+                ],
+                batch_size=5000,
+            )
+
+            start = time.perf_counter()
+            search_ingredients(queries[0], options['limit'])
+            warmup = time.perf_counter() - start
+
+            timings = []
+            empty = 0
+            for query in queries:
+                start = time.perf_counter()
+                results = search_ingredients(query, options['limit'])
+                timings.append(time.perf_counter() - start)
+                empty += not results
+
+            transaction.set_rollback(True)
+        ingredient_index.invalidate()
+
+        p50, p95, p99 = np.percentile(np.array(timings) * 1000, [50, 95, 99])
+        self.stdout.write(f'{options["rows"]} ingredients, {len(queries)} queries')
+        self.stdout.write(f'  first search (index build)  {warmup * 1000:9.1f}ms')
+        self.stdout.write(f'  p50 {p50:7.2f}ms  p95 {p95:7.2f}ms  p99 {p99:7.2f}ms')
+        self.stdout.write(f'  queries without results      {empty}')
+        if p99 > options['p99_ms']:
+            raise CommandError(f'p99 latency {p99:.2f}ms is above the {options["p99_ms"]}ms target')
+        self.stdout.write(self.style.SUCCESS(f'p99 within the {options["p99_ms"]}ms target'))
+
+    def query(self, generator, name):
+        """A prefix of one word of the name, or the whole name with a typo"""
+        words = name.split()
+        if generator.random() < 0.6:
+            word = generator.choice(words)
+            return word[:generator.randint(1, len(word))]
+        position = generator.randrange(len(name))
+        if generator.random() < 0.5:
+            return name[:position] + name[position + 1:]
+        return name[:position] + generator.choice('aeiost') + name[position + 1:]
@@ -0,0 +1,53 @@
+import csv
+import gzip
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from meals.barcodes import BarcodeImporter
+
+
+class Command(BaseCommand):
+    help = 'Import barcodes, and the ingredients they name, from a CSV or TSV product dump in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or TSV file, optionally gzipped; - reads stdin')
+        parser.add_argument('--chunk-size', type=int, help='Rows per transaction, defaults to BARCODE_IMPORT_CHUNK_SIZE')
+        parser.add_argument('--delimiter', help='Field delimiter, guessed from the header line by default')
+        parser.add_argument('--source', default='', help='Recorded on every imported barcode')
+        parser.add_argument('--max-errors', type=int, default=20, help='Row errors to print')
+
+    def handle(self, *args, **options):
+        # Product dumps carry very long ingredient lists and descriptions.
+        csv.field_size_limit(sys.maxsize)
+        try:
+            stream = self.open(options['path'])
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        with stream:
+            header = stream.readline()
+            delimiter = options['delimiter'] or ('\t' if header.count('\t') > header.count(',') else ',')
+            reader = csv.DictReader(stream, fieldnames=next(csv.reader([header], delimiter=delimiter)), delimiter=delimiter)
+            importer = BarcodeImporter(
+                chunk_size=options['chunk_size'],
+                max_errors=options['max_errors'],
+                source=options['source'],
+            )
+            report = importer.import_rows((reader.line_num + 1, row) for row in reader)
+
+        for error in report['errors']:
+            self.stderr.write(f'  line {error["line"]}: {error["error"]}')
+        self.stdout.write(
+            f'{report["received"]} rows, {report["created"]} barcodes and '
+            f'{report["ingredients_created"]} ingredients created, {report["duplicates"]} duplicates, '
+            f'{report["error_count"]} errors'
+        )
+
+    def open(self, path):
+        if path == '-':
+            return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8', newline='')
+        return open(path, encoding='utf-8', newline='')
@@ -0,0 +1,32 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from meals.models import MealPhoto
+from meals.photos import photo_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Render the variants of meal photos left pending, e.g. by a restart, through the photo pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry failed photos that kept their upload')
+        parser.add_argument(
+            '--retry-processing',
+            action='store_true',
+            help='Also retry photos left processing by a crashed worker; only use while no worker is running',
+        )
+
+    def handle(self, *args, **options):
+        statuses = [status for status, option in (('failed', 'retry_failed'), ('processing', 'retry_processing')) if options[option]]
+        if statuses:
+            retried = MealPhoto.objects.filter(status__in=statuses).exclude(original='').update(status='pending', error='')
+            self.stdout.write(f'{retried} {" and ".join(statuses)} photos queued again')
+
+        photo_ids = list(MealPhoto.objects.filter(status='pending').order_by('pk').values_list('pk', flat=True))
+        futures = [photo_pipeline.submit(photo_id) for photo_id in photo_ids]
+        wait([future for future in futures if future is not None])
+        photo_pipeline.shutdown()
+
+        ready = MealPhoto.objects.filter(pk__in=photo_ids, status='ready').count()
+        self.stdout.write(self.style.SUCCESS(f'{ready} of {len(photo_ids)} pending photos processed'))
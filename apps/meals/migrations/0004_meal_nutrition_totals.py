@@ -0,0 +1,116 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:56
+
+from django.db import migrations, models
+
+# Frozen copies of meals.nutrition as of this migration, so later changes to
+# the app code do not change what the backfill computes.
+NUTRIENTS = (
+    ('proteins', 'proteins_g'),
+    ('fats', 'fats_g'),
+    ('carbs', 'carbs_g'),
+    ('calories', 'calories_kcal'),
+    ('fibers', 'fibers_g'),
+    ('sugars', 'sugars_g'),
+)
+MEAL_TOTAL_FIELDS = ('weight_g',) + tuple(total for _, total in NUTRIENTS) + ('nutrition_complete',)
+NUTRIENT_BASIS_G = 100.0
+UNIT_GRAMS = {
+    'g': 1.0, 'gr': 1.0, 'gram': 1.0, 'grams': 1.0,
+    'kg': 1000.0, 'kilogram': 1000.0, 'kilograms': 1000.0,
+    'mg': 0.001, 'milligram': 0.001, 'milligrams': 0.001,
+    'mcg': 0.000001, 'µg': 0.000001,
+    'oz': 28.349523125, 'ounce': 28.349523125, 'ounces': 28.349523125,
+    'lb': 453.59237, 'lbs': 453.59237, 'pound': 453.59237, 'pounds': 453.59237,
+    'ml': 1.0, 'milliliter': 1.0, 'milliliters': 1.0, 'millilitre': 1.0, 'millilitres': 1.0,
+    'cl': 10.0, 'dl': 100.0,
+    'l': 1000.0, 'liter': 1000.0, 'liters': 1000.0, 'litre': 1000.0, 'litres': 1000.0,
+    'tsp': 5.0, 'teaspoon': 5.0, 'teaspoons': 5.0,
+    'tbsp': 15.0, 'tablespoon': 15.0, 'tablespoons': 15.0,
+    'cup': 240.0, 'cups': 240.0,
+    'fl oz': 29.5735295625,
+}
+
+
+def unit_to_grams(unit):
+    if not unit:
+        return None
+    return UNIT_GRAMS.get(' '.join(unit.lower().replace('.', ' ').split()))
+
+
+def backfill_meal_nutrition(apps, schema_editor):
+    Meal = apps.get_model('meals', 'Meal')
+    MealIngredient = apps.get_model('meals', 'MealIngredient')
+
+    totals = {}
+    rows = MealIngredient.objects.values_list(
+        'meal_id', 'quantity', 'unit', *(f'ingredient__{field}' for field, _ in NUTRIENTS)
+    )
+    for meal_id, quantity, unit, *values in rows.iterator():
+        meal = totals.setdefault(meal_id, {field: 0.0 for field in MEAL_TOTAL_FIELDS[:-1]})
+        meal.setdefault('nutrition_complete', True)
+        factor = unit_to_grams(unit)
+        if factor is None:
+            # Ingredients in a unit that cannot be converted are left out.
+            meal['nutrition_complete'] = False
+            continue
+        grams = quantity * factor
+        meal['weight_g'] += grams
+        for (_, total), value in zip(NUTRIENTS, values):
+            meal[total] += grams / NUTRIENT_BASIS_G * value
+
+    Meal.objects.bulk_update(
+        [Meal(pk=pk, **meal) for pk, meal in totals.items()],
+        MEAL_TOTAL_FIELDS,
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0003_category_ingredient_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='calories_kcal',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='carbs_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='fats_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='fibers_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='nutrition_complete',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='proteins_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='sugars_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='weight_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_meal_nutrition, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:57
+
+import django.db.models.deletion
+import meals.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+INTAKE_FIELDS = ('weight_g', 'proteins_g', 'fats_g', 'carbs_g', 'calories_kcal', 'fibers_g', 'sugars_g')
+
+
+def backfill_daily_intake(apps, schema_editor):
+    MealRecord = apps.get_model('meals', 'MealRecord')
+    DailyIntake = apps.get_model('meals', 'DailyIntake')
+
+    # No user has a time zone yet, so days follow the default one.
+    grouped = (
+        MealRecord.objects.annotate(day=TruncDate('timestamp', tzinfo=timezone.get_default_timezone()))
+        .values('user_id', 'day')
+        .annotate(
+            meal_count=models.Count('id'),
+            **{field: models.Sum(f'meal__{field}') for field in INTAKE_FIELDS},
+        )
+        .order_by()
+    )
+    DailyIntake.objects.bulk_create(
+        [
+            DailyIntake(
+                user_id=row['user_id'],
+                date=row['day'],
+                meal_count=row['meal_count'],
+                **{field: row[field] or 0.0 for field in INTAKE_FIELDS},
+            )
+            for row in grouped
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0004_meal_nutrition_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyIntake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meal_count', models.PositiveIntegerField(default=0)),
+                ('weight_g', models.FloatField(default=0)),
+                ('proteins_g', models.FloatField(default=0)),
+                ('fats_g', models.FloatField(default=0)),
+                ('carbs_g', models.FloatField(default=0)),
+                ('calories_kcal', models.FloatField(default=0)),
+                ('fibers_g', models.FloatField(default=0)),
+                ('sugars_g', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NutritionProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_zone', models.CharField(default='UTC', max_length=64, validators=[meals.models.validate_time_zone])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='mealrecord',
+            index=models.Index(fields=['user', 'timestamp'], name='meals_record_user_ts'),
+        ),
+        migrations.AddField(
+            model_name='dailyintake',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='nutritionprofile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='nutrition_profile', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyintake',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='meals_daily_intake_user_date'),
+        ),
+        migrations.RunPython(backfill_daily_intake, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 09:12
+
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    # Other databases search through the in-memory index in meals.search.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS meals_ingr_name_trgm '
+        'ON meals_ingredient USING gin (UPPER(name) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS meals_ingr_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0005_daily_intake'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
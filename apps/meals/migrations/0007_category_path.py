@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:04
+
+from django.db import migrations, models
+
+
+def backfill_category_paths(apps, schema_editor):
+    Category = apps.get_model('meals', 'Category')
+
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path_of(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = f'{path_of(parent_id) if parent_id else "/"}{pk}/'
+        return paths[pk]
+
+    categories = [Category(pk=pk, path=path_of(pk)) for pk in parents]
+    for category in categories:
+        category.depth = category.path.count('/') - 2
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0006_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_category_paths, migrations.RunPython.noop),
+    ]
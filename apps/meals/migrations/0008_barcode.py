@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:06
+
+import django.db.models.deletion
+import meals.models
+from django.db import migrations, models
+
+# Frozen copy of meals.barcodes.normalize_gtin as of this migration
+GTIN_LENGTHS = (8, 12, 13, 14)
+GTIN_LENGTH = 14
+
+
+def normalize_gtin(code):
+    digits = ''.join(str(code or '').replace('-', '').split())
+    if not digits.isascii() or not digits.isdigit() or len(digits) not in GTIN_LENGTHS:
+        raise ValueError(f'Invalid barcode {code!r}')
+    total = sum(int(digit) * (3 if index % 2 == 0 else 1) for index, digit in enumerate(reversed(digits[:-1])))
+    if (10 - total % 10) % 10 != int(digits[-1]):
+        raise ValueError(f'Invalid barcode {code!r}')
+    return digits.zfill(GTIN_LENGTH)
+
+
+def register_logged_barcodes(apps, schema_editor):
+    MealIngredient = apps.get_model('meals', 'MealIngredient')
+    Barcode = apps.get_model('meals', 'Barcode')
+
+    # Valid codes already logged with meal ingredients; the first one wins.
+    barcodes = {}
+    rows = MealIngredient.objects.exclude(barcode__isnull=True).exclude(barcode='').order_by('pk')
+    for code, ingredient_id in rows.values_list('barcode', 'ingredient_id').iterator():
+        try:
+            barcodes.setdefault(normalize_gtin(code), ingredient_id)
+        except ValueError:
+            continue
+    Barcode.objects.bulk_create(
+        [Barcode(gtin=gtin, ingredient_id=ingredient_id, source='meal ingredients') for gtin, ingredient_id in barcodes.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0007_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Barcode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gtin', models.CharField(max_length=14, unique=True, validators=[meals.models.validate_gtin])),
+                ('source', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='barcodes', to='meals.ingredient')),
+            ],
+        ),
+        migrations.RunPython(register_logged_barcodes, migrations.RunPython.noop),
+    ]
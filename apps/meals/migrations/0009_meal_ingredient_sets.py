@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:09
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+EXCLUDING_PREFERENCES = ('allergy', 'restriction', 'hate')
+
+
+def backfill_ingredient_sets(apps, schema_editor):
+    Meal = apps.get_model('meals', 'Meal')
+    MealIngredient = apps.get_model('meals', 'MealIngredient')
+    MealPreference = apps.get_model('meals', 'MealPreference')
+    NutritionProfile = apps.get_model('meals', 'NutritionProfile')
+
+    sets = defaultdict(set)
+    for meal_id, ingredient_id in MealIngredient.objects.values_list('meal_id', 'ingredient_id').iterator():
+        sets[meal_id].add(ingredient_id)
+    Meal.objects.bulk_update(
+        [Meal(pk=pk, ingredient_ids=sorted(ingredient_ids)) for pk, ingredient_ids in sets.items()],
+        ['ingredient_ids'],
+        batch_size=500,
+    )
+
+    excluded = defaultdict(set)
+    for user_id, ingredient_id in MealPreference.objects.filter(
+        preference_type__in=EXCLUDING_PREFERENCES
+    ).values_list('user_id', 'ingredient_id'):
+        excluded[user_id].add(ingredient_id)
+    for user_id, ingredient_ids in excluded.items():
+        NutritionProfile.objects.update_or_create(
+            user_id=user_id, defaults={'excluded_ingredient_ids': sorted(ingredient_ids)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0008_barcode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='ingredient_ids',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='nutritionprofile',
+            name='excluded_ingredient_ids',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(backfill_ingredient_sets, migrations.RunPython.noop),
+    ]
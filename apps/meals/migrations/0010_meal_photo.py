@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0009_meal_ingredient_sets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealPhoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('original', models.FileField(blank=True, upload_to='meal_photos/originals/')),
+                ('thumbnail', models.ImageField(blank=True, upload_to='meal_photos/thumbnails/')),
+                ('webp', models.ImageField(blank=True, upload_to='meal_photos/webp/')),
+                ('content_type', models.CharField(max_length=100)),
+                ('size', models.PositiveBigIntegerField()),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='mealrecord',
+            name='meal_photo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='records', to='meals.mealphoto'),
+        ),
+    ]
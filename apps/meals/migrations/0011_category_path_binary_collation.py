@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:53
+
+import meals.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0010_meal_photo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='path',
+            field=meals.models.PathField(db_index=True, default='', editable=False, max_length=255),
+        ),
+    ]
@@ -1,7 +1,35 @@
-from django.db import models
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from itertools import islice
+from typing import Any, Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db import models, transaction
+from django.db.models.functions import Concat, Substr, TruncDate
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from goals.models import Goal
 
+from .barcodes import barcode_resolver, normalize_gtin
+from .exclusions import EXCLUDING_PREFERENCES, meal_sets
+from .categories import build_paths, category_tree, child_path, path_depth, path_ids, path_range
+from .nutrition import MEAL_TOTAL_FIELDS, NUTRIENTS, NUTRIENT_FIELDS, empty_totals, meal_totals
+from .search import ingredient_index
+from .signals import meal_ingredients_changed
+
+class DietManager(models.Manager):
+
+    def active_for(self, user_id: int) -> Optional['Diet']:
+        """The user's most recent diet whose goal is still active"""
+        return (
+            self.filter(user_id=user_id, goal__is_active=True)
+            .order_by('-created_at', '-pk')
+            .first()
+        )
+
+
 class Diet(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -12,29 +40,287 @@ class Diet(models.Model):
     day_calories_kcal = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DietManager()
     
     def __str__(self):
         return self.name
 
+class MealManager(models.Manager):
+
+    def refresh_nutrition(self, meal_ids) -> None:
+        """
+        Recompute the stored nutrition totals of the given meals.
+        
+        Reads every ingredient row of the meals in one query, computes the
+        totals with meals.nutrition.meal_totals and writes them back with one
+        bulk update per batch.
+        """
+        meal_ids = set(meal_ids)
+        if not meal_ids:
+            return
+
+        rows = MealIngredient.objects.filter(meal_id__in=meal_ids).values_list(
+            'meal_id', 'quantity', 'unit', *(f'ingredient__{field}' for field in NUTRIENT_FIELDS)
+        )
+        totals = meal_totals(rows)
+        self.bulk_update(
+            [self.model(pk=pk, **totals.get(pk, empty_totals())) for pk in meal_ids],
+            MEAL_TOTAL_FIELDS,
+            batch_size=500,
+        )
+
+    def refresh_ingredient_sets(self, meal_ids) -> None:
+        """
+        Recompute the stored ingredient id sets of the given meals.
+        
+        Only meals whose set actually changed are written, and only then is
+        the in-process meal set snapshot invalidated, so nutrient edits that
+        leave compositions alone cost two reads.
+        """
+        meal_ids = set(meal_ids)
+        if not meal_ids:
+            return
+
+        sets = defaultdict(set)
+        for meal_id, ingredient_id in MealIngredient.objects.filter(meal_id__in=meal_ids).values_list(
+            'meal_id', 'ingredient_id'
+        ):
+            sets[meal_id].add(ingredient_id)
+        changed = [
+            self.model(pk=pk, ingredient_ids=sorted(sets[pk]))
+            for pk, stored in self.filter(pk__in=meal_ids).values_list('pk', 'ingredient_ids')
+            if stored != sorted(sets[pk])
+        ]
+        if changed:
+            self.bulk_update(changed, ['ingredient_ids'], batch_size=500)
+            transaction.on_commit(partial(meal_sets.invalidate, [meal.pk for meal in changed]))
+
+    def compatible_with(self, user_id: int, limit: int, diet_id: Optional[int] = None, offset: int = 0):
+        """
+        One page, by name, of the meals without any ingredient the user is
+        allergic to, restricted from or hates.
+
+        Meal ids are streamed in name order and checked against the meal set
+        snapshot until the page is full, so no query carries the excluded
+        meals, however many there are.
+
+        Args:
+            user_id: The ID of the user
+            limit: Maximum number of meals
+            diet_id: Optional diet the meals must belong to
+            offset: Number of compatible meals to skip
+
+        Returns:
+            QuerySet of at most limit meals, ordered by name
+        """
+        incompatible = meal_sets.incompatible_ids(NutritionProfile.objects.exclusions(user_id))
+        meals = self.get_queryset() if diet_id is None else self.filter(diet_id=diet_id)
+        ordered = meals.order_by('name', 'pk').values_list('pk', flat=True)
+        if incompatible:
+            compatible = (pk for pk in ordered.iterator(chunk_size=2000) if pk not in incompatible)
+            page = list(islice(compatible, offset, offset + limit))
+        else:
+            page = list(ordered[offset:offset + limit])
+        return self.filter(pk__in=page).order_by('name', 'pk')
+
+
 class Meal(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     diet = models.ForeignKey(Diet, on_delete=models.CASCADE)
+    # Nutrition totals, kept current by meals.signals
+    weight_g = models.FloatField(default=0)
+    proteins_g = models.FloatField(default=0)
+    fats_g = models.FloatField(default=0)
+    carbs_g = models.FloatField(default=0)
+    calories_kcal = models.FloatField(default=0)
+    fibers_g = models.FloatField(default=0)
+    sugars_g = models.FloatField(default=0)
+    nutrition_complete = models.BooleanField(default=True)  # type: ignore
+    # Sorted distinct ids of the meal's ingredients
+    ingredient_ids = models.JSONField(default=list, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MealManager()
+
     def __str__(self):
         return self.name
 
+    @property
+    def nutrition(self) -> dict:
+        """Stored nutrition totals of the meal"""
+        return {field: getattr(self, field) for field in MEAL_TOTAL_FIELDS}
+
+def _category_path(category) -> str:
+    """Path of a Category instance, or of a category id through the tree snapshot"""
+    if isinstance(category, Category):
+        return category.path
+    node = category_tree.get(category)
+    if node is None:
+        raise Category.DoesNotExist(f'Category {category} does not exist')
+    return node.path
+
+
+class PathField(models.CharField):
+    """
+    CharField that compares byte by byte on every backend.
+
+    Subtree lookups are path ranges, which only hold when '/' sorts right
+    before '0'. Locale collations, e.g. en_US on PostgreSQL, ignore or
+    reorder punctuation, so the column gets the backend's binary collation
+    where the default one may be a locale; SQLite compares bytes already.
+    """
+
+    BINARY_COLLATIONS = {'postgresql': 'C', 'mysql': 'utf8mb4_bin'}
+
+    def db_parameters(self, connection):
+        parameters = super().db_parameters(connection)
+        parameters['collation'] = self.BINARY_COLLATIONS.get(connection.vendor, self.db_collation)
+        return parameters
+
+
+class CategoryQuerySet(models.QuerySet):
+    """
+    QuerySet over the materialized category paths.
+
+    Subtree and ancestor lookups are single queries on the indexed path
+    column. Bulk writes that may change the hierarchy rebuild every path.
+    """
+
+    def descendants(self, category, include_self: bool = False):
+        """Categories below a category (instance or id), in one range query"""
+        low, high = path_range(_category_path(category))
+        descendants = self.filter(path__gte=low, path__lt=high)
+        if not include_self:
+            descendants = descendants.exclude(path=low)
+        return descendants
+
+    def ancestors(self, category, include_self: bool = False):
+        """Categories above a category (instance or id), root first"""
+        ids = path_ids(_category_path(category))
+        if not include_self:
+            ids = ids[:-1]
+        return self.filter(pk__in=ids).order_by('depth')
+
+    def rebuild_paths(self) -> int:
+        """
+        Recompute every category path from the parent links.
+
+        Returns:
+            Number of categories whose path changed
+        """
+        rows = list(self.model.objects.values_list('pk', 'parent_id', 'path'))
+        paths = build_paths((pk, parent_id) for pk, parent_id, _ in rows)
+        changed = [
+            self.model(pk=pk, path=paths[pk], depth=path_depth(paths[pk]))
+            for pk, _, path in rows
+            if pk in paths and paths[pk] != path
+        ]
+        self.model.objects.bulk_update(changed, ['path', 'depth'], batch_size=1000)
+        transaction.on_commit(category_tree.invalidate)
+        return len(changed)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        self.rebuild_paths()
+        return created
+
+    def update(self, **kwargs):
+        updated = super().update(**kwargs)
+        if {'parent', 'parent_id'} & kwargs.keys():
+            self.model.objects.rebuild_paths()
+        elif updated:
+            transaction.on_commit(category_tree.invalidate)
+        return updated
+
+
 class Category(models.Model):
     name = models.CharField(max_length=255)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
+    # Materialized ids from the root down to this category, e.g. '/1/5/12/'
+    path = PathField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.pk is not None and self.parent_id is not None and self.pk in self._parent_path_ids():
+            raise ValidationError({'parent': 'A category cannot be moved under itself or its descendants.'})
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'parent', 'parent_id'} & set(update_fields):
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            parent_path = None
+            if self.parent_id is not None:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+            old_path = ''
+            if self.pk is not None and not self._state.adding:
+                old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+            if old_path and parent_path and parent_path.startswith(old_path):
+                raise ValueError('A category cannot be moved under itself or its descendants')
+
+            super().save(*args, **kwargs)
+
+            path = child_path(parent_path, self.pk)
+            if not old_path:
+                Category.objects.filter(pk=self.pk).update(path=path, depth=path_depth(path))
+            elif path != old_path:
+                # Rewrite the prefix of the whole subtree in one statement.
+                low, high = path_range(old_path)
+                Category.objects.filter(path__gte=low, path__lt=high).update(
+                    path=Concat(models.Value(path), Substr('path', len(old_path) + 1), output_field=models.CharField()),
+                    depth=models.F('depth') + path_depth(path) - path_depth(old_path),
+                )
+            self.path, self.depth = path, path_depth(path)
+
+    def _parent_path_ids(self) -> list:
+        parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+        return path_ids(parent_path or '')
+
+# Ingredient fields held by the in-memory search index
+INGREDIENT_INDEX_FIELDS = ('name', 'category', 'category_id')
+
+
+class IngredientQuerySet(models.QuerySet):
+    """
+    QuerySet that reports nutrient updates through meal_ingredients_changed
+    and name or category writes to the ingredient search index
+    """
+
+    def in_category(self, category):
+        """Ingredients of a category (instance or id) and all its subcategories, in one query"""
+        low, high = path_range(_category_path(category))
+        return self.filter(category__path__gte=low, category__path__lt=high)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        transaction.on_commit(ingredient_index.invalidate)
+        return created
+
+    def update(self, **kwargs):
+        if set(INGREDIENT_INDEX_FIELDS) & kwargs.keys():
+            transaction.on_commit(ingredient_index.invalidate)
+        if not set(NUTRIENT_FIELDS) & kwargs.keys():
+            return super().update(**kwargs)
+        meal_ids = set(
+            MealIngredient.objects.filter(ingredient__in=self.values('pk')).values_list('meal_id', flat=True)
+        )
+        updated = super().update(**kwargs)
+        meal_ingredients_changed.send(sender=self.model, meal_ids=meal_ids)
+        return updated
+
+
 class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
@@ -48,9 +334,83 @@ class Ingredient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = IngredientQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+def validate_gtin(value: str) -> None:
+    try:
+        normalize_gtin(value)
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+
+class BarcodeQuerySet(models.QuerySet):
+    """QuerySet that drops cached barcode lookups once bulk writes are committed"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        transaction.on_commit(barcode_resolver.invalidate)
+        return created
+
+    def update(self, **kwargs):
+        updated = super().update(**kwargs)
+        transaction.on_commit(barcode_resolver.invalidate)
+        return updated
+
+    def delete(self):
+        deleted = super().delete()
+        transaction.on_commit(barcode_resolver.invalidate)
+        return deleted
+
+    def for_code(self, code: str):
+        """Barcodes matching a code in any supported format"""
+        return self.filter(gtin=normalize_gtin(code))
+
+
+class Barcode(models.Model):
+    """EAN or UPC code of a packaged food, stored as its 14-digit GTIN"""
+
+    gtin = models.CharField(max_length=14, unique=True, validators=[validate_gtin])
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='barcodes')
+    source = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BarcodeQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.gtin = normalize_gtin(self.gtin)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.gtin} - {self.ingredient_id}"
+
+
+class MealIngredientQuerySet(models.QuerySet):
+    """
+    QuerySet that reports bulk writes through meal_ingredients_changed.
+    
+    bulk_create() and update() bypass post_save, so they announce the affected
+    meals themselves to keep the stored totals current.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        meal_ingredients_changed.send(sender=self.model, meal_ids={obj.meal_id for obj in objs})
+        return objs
+
+    def update(self, **kwargs):
+        meal_ids = set(self.values_list('meal_id', flat=True))
+        updated = super().update(**kwargs)
+        if 'meal' in kwargs or 'meal_id' in kwargs:
+            meal = kwargs.get('meal', kwargs.get('meal_id'))
+            meal_ids.add(getattr(meal, 'pk', meal))
+        meal_ingredients_changed.send(sender=self.model, meal_ids=meal_ids)
+        return updated
+
+
 class MealIngredient(models.Model):
     meal = models.ForeignKey(Meal, on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
@@ -60,21 +420,130 @@ class MealIngredient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MealIngredientQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.meal.name} - {self.ingredient.name}"
     
+class MealPhoto(models.Model):
+    """
+    Uploaded meal photo, stored once per content hash.
+
+    The upload is kept as ``original`` until the photo pipeline has rendered
+    the metadata-free thumbnail and WebP variants, then removed.
+    """
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    original = models.FileField(upload_to='meal_photos/originals/', blank=True)
+    thumbnail = models.ImageField(upload_to='meal_photos/thumbnails/', blank=True)
+    webp = models.ImageField(upload_to='meal_photos/webp/', blank=True)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.status})"
+
+    def to_dict(self) -> dict:
+        """Convert photo to dictionary for API responses"""
+        return {
+            'id': self.id,  # type: ignore
+            'sha256': self.sha256,
+            'status': self.status,
+            'width': self.width,
+            'height': self.height,
+            'thumbnail_url': self.thumbnail.url if self.thumbnail else None,
+            'webp_url': self.webp.url if self.webp else None,
+            'error': self.error or None,
+        }
+
+
+# MealRecord fields the daily intake rollups depend on
+INTAKE_RECORD_FIELDS = {'meal', 'meal_id', 'user', 'user_id', 'timestamp'}
+
+
+class MealRecordQuerySet(models.QuerySet):
+    """
+    QuerySet that keeps DailyIntake current through bulk writes.
+
+    bulk_create() and update(), which bulk_update() goes through, bypass
+    post_save, so they refresh the (user, local date) rollups of the records
+    they write themselves, the days records moved away from included.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        DailyIntake.objects.refresh_records((obj.user_id, obj.timestamp) for obj in objs)
+        return objs
+
+    def update(self, **kwargs):
+        if not INTAKE_RECORD_FIELDS & kwargs.keys():
+            return super().update(**kwargs)
+
+        rows = list(self.values_list('pk', 'user_id', 'timestamp'))
+        updated = super().update(**kwargs)
+        records = {(user_id, timestamp) for _, user_id, timestamp in rows}
+        if {'user', 'user_id', 'timestamp'} & kwargs.keys():
+            records.update(
+                self.model.objects.filter(pk__in=[pk for pk, _, _ in rows]).values_list('user_id', 'timestamp')
+            )
+        DailyIntake.objects.refresh_records(records)
+        return updated
+
+
 class MealRecord(models.Model):
     meal = models.ForeignKey(Meal, on_delete=models.CASCADE)
     timestamp = models.DateTimeField()
     photo = models.ImageField(upload_to='meal_photos/', null=True, blank=True)
+    meal_photo = models.ForeignKey(
+        MealPhoto, on_delete=models.SET_NULL, null=True, blank=True, related_name='records'
+    )
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     feedback = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MealRecordQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='meals_record_user_ts'),
+        ]
+
     def __str__(self):
         return f"{self.meal.name} - {self.date}"
 
+class MealPreferenceQuerySet(models.QuerySet):
+    """QuerySet that refreshes the exclusions of users whose preferences it bulk writes"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        NutritionProfile.objects.refresh_exclusions({preference.user_id for preference in objs})
+        return created
+
+    def update(self, **kwargs):
+        if not {'user', 'user_id', 'ingredient', 'ingredient_id', 'preference_type'} & kwargs.keys():
+            return super().update(**kwargs)
+        rows = dict(self.values_list('pk', 'user_id'))
+        updated = super().update(**kwargs)
+        user_ids = set(rows.values())
+        if {'user', 'user_id'} & kwargs.keys():
+            user_ids.update(self.model.objects.filter(pk__in=rows).values_list('user_id', flat=True))
+        NutritionProfile.objects.refresh_exclusions(user_ids)
+        return updated
+
+
 class MealPreference(models.Model):
     PREFERENCE_TYPES = [
         ('love', 'Love'),
@@ -93,5 +562,254 @@ class MealPreference(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MealPreferenceQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user.username} {self.preference_type} {self.ingredient.name}"
+
+
+def validate_time_zone(value: str) -> None:
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"Unknown time zone '{value}'")
+
+
+class NutritionProfileManager(models.Manager):
+
+    def time_zones(self, user_ids: Iterable[int]) -> Dict[int, Any]:
+        """Time zone of each user, the default time zone when not set"""
+        user_ids = set(user_ids)
+        names = dict(self.filter(user_id__in=user_ids).values_list('user_id', 'time_zone'))
+        default = timezone.get_default_timezone()
+        zones = {}
+        for user_id in user_ids:
+            try:
+                zones[user_id] = ZoneInfo(names[user_id]) if names.get(user_id) else default
+            except (ZoneInfoNotFoundError, ValueError):
+                zones[user_id] = default
+        return zones
+
+    def exclusions(self, user_id: int) -> frozenset:
+        """Ids of the ingredients ruled out of a user's meals by their preferences"""
+        stored = self.filter(user_id=user_id).values_list('excluded_ingredient_ids', flat=True).first()
+        return frozenset(stored or ())
+
+    def refresh_exclusions(self, user_ids: Iterable[int]) -> None:
+        """
+        Recompute the stored exclusion sets of the given users.
+        
+        Reads their excluding preferences in one query. Users with
+        exclusions get their profile upserted; the others only have an
+        existing profile cleared, so deleting a user never recreates one.
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+
+        excluded = defaultdict(set)
+        for user_id, ingredient_id in MealPreference.objects.filter(
+            user_id__in=user_ids, preference_type__in=EXCLUDING_PREFERENCES
+        ).values_list('user_id', 'ingredient_id'):
+            excluded[user_id].add(ingredient_id)
+        now = timezone.now()
+        if excluded:
+            self.bulk_create(
+                [
+                    self.model(user_id=user_id, excluded_ingredient_ids=sorted(ingredient_ids), updated_at=now)
+                    for user_id, ingredient_ids in excluded.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['excluded_ingredient_ids', 'updated_at'],
+            )
+        cleared = user_ids - excluded.keys()
+        if cleared:
+            self.filter(user_id__in=cleared).update(excluded_ingredient_ids=[], updated_at=now)
+
+
+class NutritionProfile(models.Model):
+    """Per-user nutrition settings; the time zone decides which day a meal counts towards"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='nutrition_profile')
+    time_zone = models.CharField(max_length=64, default='UTC', validators=[validate_time_zone])
+    # Sorted ids of the ingredients the user is allergic to, restricted from or hates
+    excluded_ingredient_ids = models.JSONField(default=list, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = NutritionProfileManager()
+
+    def __str__(self):
+        return f"{self.user.username}'s nutrition profile"  # type: ignore
+
+
+# Meal totals compared with Diet targets
+INTAKE_TARGETS = (
+    ('proteins_g', 'day_proteins_g'),
+    ('fats_g', 'day_fats_g'),
+    ('carbs_g', 'day_carbohydrates_g'),
+    ('calories_kcal', 'day_calories_kcal'),
+)
+
+# Meal totals summed into DailyIntake
+INTAKE_FIELDS = ('weight_g',) + tuple(total for _, total in NUTRIENTS)
+
+
+class DailyIntakeManager(models.Manager):
+
+    def refresh(self, keys: Iterable[Tuple[int, date]]) -> None:
+        """
+        Recompute the rollups of the given (user_id, local date) pairs.
+        
+        Runs one grouped query per user over the records of the affected days,
+        then one upsert and one delete for days left without records.
+        """
+        keys = set(keys)
+        if not keys:
+            return
+
+        dates_by_user = defaultdict(set)
+        for user_id, day in keys:
+            dates_by_user[user_id].add(day)
+        zones = NutritionProfile.objects.time_zones(dates_by_user)
+
+        rollups = []
+        for user_id, dates in dates_by_user.items():
+            tzinfo = zones[user_id]
+            start = timezone.make_aware(datetime.combine(min(dates), time.min), tzinfo)
+            end = timezone.make_aware(datetime.combine(max(dates) + timedelta(days=1), time.min), tzinfo)
+            records = MealRecord.objects.filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+            rollups.extend(
+                rollup for rollup in self._rollups(user_id, records, tzinfo) if rollup.date in dates
+            )
+
+        if rollups:
+            self.bulk_create(
+                rollups,
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=['meal_count', *INTAKE_FIELDS, 'updated_at'],
+            )
+
+        stale = keys - {(rollup.user_id, rollup.date) for rollup in rollups}
+        if stale:
+            condition = models.Q()
+            for user_id, day in stale:
+                condition |= models.Q(user_id=user_id, date=day)
+            self.filter(condition).delete()
+
+    def refresh_records(self, records: Iterable[Tuple[int, datetime]]) -> None:
+        """Recompute the rollups of the local days of (user_id, timestamp) records"""
+        records = list(records)
+        zones = NutritionProfile.objects.time_zones({user_id for user_id, _ in records})
+        self.refresh((user_id, timestamp.astimezone(zones[user_id]).date()) for user_id, timestamp in records)
+
+    def rebuild(self, user_id: int) -> None:
+        """Recompute every rollup of a user, e.g. after a time zone change"""
+        tzinfo = NutritionProfile.objects.time_zones([user_id])[user_id]
+        self.filter(user_id=user_id).delete()
+        self.bulk_create(
+            self._rollups(user_id, MealRecord.objects.filter(user_id=user_id), tzinfo),
+            batch_size=500,
+        )
+
+    def compare_to_diet(self, user_id: int, start: date, end: date) -> Dict[str, Any]:
+        """
+        Compare daily intake with the targets of the user's active diet.
+        
+        The rollups of the whole range come from one read of the (user, date)
+        index, plus one query for the active diet.
+        
+        Args:
+            user_id: The ID of the user
+            start: First local day of the range
+            end: Last local day of the range, inclusive
+            
+        Returns:
+            Dictionary with the diet targets, each tracked day's intake and
+            its difference to the targets, and totals over the range
+        """
+        if end < start:
+            raise ValueError('end must not be before start')
+
+        diet = Diet.objects.active_for(user_id)
+        targets = {field: getattr(diet, target) for field, target in INTAKE_TARGETS} if diet else None
+        days = []
+        totals = dict.fromkeys(INTAKE_FIELDS, 0.0)
+        for rollup in self.filter(user_id=user_id, date__range=(start, end)).order_by('date'):
+            intake = {field: getattr(rollup, field) for field in INTAKE_FIELDS}
+            for field, value in intake.items():
+                totals[field] += value
+            day = {'date': rollup.date.isoformat(), 'meal_count': rollup.meal_count, **intake}
+            if targets:
+                day['difference'] = {field: intake[field] - target for field, target in targets.items()}
+            days.append(day)
+
+        summary = {
+            'days_tracked': len(days),
+            'totals': totals,
+            'daily_average': {field: value / len(days) if days else 0.0 for field, value in totals.items()},
+        }
+        if targets:
+            summary['average_difference'] = {
+                field: summary['daily_average'][field] - target for field, target in targets.items()
+            }
+
+        return {
+            'user_id': user_id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'diet': {'id': diet.pk, 'name': diet.name, 'targets': targets} if diet else None,
+            'days': days,
+            'summary': summary,
+        }
+
+    def _rollups(self, user_id: int, records: models.QuerySet, tzinfo) -> list:
+        grouped = (
+            records.annotate(day=TruncDate('timestamp', tzinfo=tzinfo))
+            .values('day')
+            .annotate(
+                meal_count=models.Count('id'),
+                **{field: models.Sum(f'meal__{field}') for field in INTAKE_FIELDS},
+            )
+            .order_by()
+        )
+        return [
+            self.model(
+                user_id=user_id,
+                date=row['day'],
+                meal_count=row['meal_count'],
+                **{field: row[field] or 0.0 for field in INTAKE_FIELDS},
+            )
+            for row in grouped
+        ]
+
+
+class DailyIntake(models.Model):
+    """
+    Per-user, per-local-day sum of the nutrition of logged meals.
+    
+    Kept current by meals.signals whenever a MealRecord or the totals of a
+    logged meal change; days follow the user's NutritionProfile time zone.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    meal_count = models.PositiveIntegerField(default=0)
+    weight_g = models.FloatField(default=0)
+    proteins_g = models.FloatField(default=0)
+    fats_g = models.FloatField(default=0)
+    carbs_g = models.FloatField(default=0)
+    calories_kcal = models.FloatField(default=0)
+    fibers_g = models.FloatField(default=0)
+    sugars_g = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DailyIntakeManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='meals_daily_intake_user_date'),
+        ]
+
     def __str__(self):
-        return f"{self.user.username} {self.preference_type} {self.ingredient.name}"
\ No newline at end of file
+        return f"Intake of user {self.user_id} on {self.date}"  # type: ignore
@@ -0,0 +1,128 @@
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Ingredient nutrient column and the Meal field holding its total
+NUTRIENTS = (
+    ('proteins', 'proteins_g'),
+    ('fats', 'fats_g'),
+    ('carbs', 'carbs_g'),
+    ('calories', 'calories_kcal'),
+    ('fibers', 'fibers_g'),
+    ('sugars', 'sugars_g'),
+)
+NUTRIENT_FIELDS = tuple(field for field, _ in NUTRIENTS)
+MEAL_TOTAL_FIELDS = ('weight_g',) + tuple(total for _, total in NUTRIENTS) + ('nutrition_complete',)
+
+# Ingredient nutrients are given per this many grams
+NUTRIENT_BASIS_G = 100.0
+
+# Grams per unit. Volumes assume the density of water.
+UNIT_GRAMS = {
+    'g': 1.0,
+    'gr': 1.0,
+    'gram': 1.0,
+    'grams': 1.0,
+    'kg': 1000.0,
+    'kilogram': 1000.0,
+    'kilograms': 1000.0,
+    'mg': 0.001,
+    'milligram': 0.001,
+    'milligrams': 0.001,
+    'mcg': 0.000001,
+    'µg': 0.000001,
+    'oz': 28.349523125,
+    'ounce': 28.349523125,
+    'ounces': 28.349523125,
+    'lb': 453.59237,
+    'lbs': 453.59237,
+    'pound': 453.59237,
+    'pounds': 453.59237,
+    'ml': 1.0,
+    'milliliter': 1.0,
+    'milliliters': 1.0,
+    'millilitre': 1.0,
+    'millilitres': 1.0,
+    'cl': 10.0,
+    'dl': 100.0,
+    'l': 1000.0,
+    'liter': 1000.0,
+    'liters': 1000.0,
+    'litre': 1000.0,
+    'litres': 1000.0,
+    'tsp': 5.0,
+    'teaspoon': 5.0,
+    'teaspoons': 5.0,
+    'tbsp': 15.0,
+    'tablespoon': 15.0,
+    'tablespoons': 15.0,
+    'cup': 240.0,
+    'cups': 240.0,
+    'fl oz': 29.5735295625,
+}
+
+# (meal_id, quantity, unit, proteins, fats, carbs, calories, fibers, sugars)
+IngredientRow = Tuple[Any, ...]
+
+
+def unit_to_grams(unit: Optional[str]) -> Optional[float]:
+    """Grams per one of the given unit, or None when it cannot be converted"""
+    if not unit:
+        return None
+    return UNIT_GRAMS.get(' '.join(unit.lower().replace('.', ' ').split()))
+
+
+def empty_totals() -> Dict[str, Any]:
+    """Totals of a meal without ingredients"""
+    totals: Dict[str, Any] = {field: 0.0 for field in MEAL_TOTAL_FIELDS}
+    totals['nutrition_complete'] = True
+    return totals
+
+
+def meal_totals(rows: Iterable[IngredientRow]) -> Dict[Hashable, Dict[str, Any]]:
+    """
+    Compute nutrition totals of many meals at once.
+
+    Quantities are normalized to grams through UNIT_GRAMS. Each meal's totals
+    are then the dot product of its gram weights with its ingredients' nutrient
+    matrix, computed for all meals together in one vectorized pass. Ingredients
+    in a unit that cannot be converted are left out and mark the meal as
+    incomplete.
+
+    Args:
+        rows: One row per meal ingredient, see IngredientRow
+
+    Returns:
+        Mapping of meal id to {Meal total field: value}
+    """
+    meal_ids, quantities, factors, nutrients = [], [], [], []
+    for meal_id, quantity, unit, *values in rows:
+        meal_ids.append(meal_id)
+        quantities.append(quantity)
+        factor = unit_to_grams(unit)
+        factors.append(np.nan if factor is None else factor)
+        nutrients.append(values)
+
+    if not meal_ids:
+        return {}
+
+    keys, codes = np.unique(np.array(meal_ids, dtype=object), return_inverse=True)
+    grams = np.array(quantities, dtype=float) * np.array(factors, dtype=float)
+    convertible = ~np.isnan(grams)
+    grams = np.where(convertible, grams, 0.0)
+    matrix = np.array(nutrients, dtype=float).reshape(len(meal_ids), len(NUTRIENTS))
+
+    # Sum gram-weighted nutrient rows per meal: weights . matrix, meal by meal.
+    order = np.argsort(codes, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    totals = np.add.reduceat((grams / NUTRIENT_BASIS_G)[order, None] * matrix[order], starts)
+    weight_totals = np.add.reduceat(grams[order], starts)
+    complete = np.add.reduceat((~convertible[order]).astype(int), starts) == 0
+
+    results = {}
+    for index, key in enumerate(keys):
+        meal = {'weight_g': float(weight_totals[index])}
+        meal.update((total, float(value)) for (_, total), value in zip(NUTRIENTS, totals[index]))
+        meal['nutrition_complete'] = bool(complete[index])
+        results[key] = meal
+    return results
@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from .imaging import render_variants
+
+logger = logging.getLogger(__name__)
+
+# Accepted upload content types and the extension the original is stored with
+PHOTO_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+    'image/bmp': 'bmp',
+    'image/tiff': 'tiff',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PhotoTooLarge(ValueError):
+    pass
+
+
+def spool_upload(chunks: Iterable[bytes], max_bytes: int) -> Tuple[tempfile.SpooledTemporaryFile, str, int]:
+    """
+    Copy an upload to a temporary file while hashing it.
+
+    Args:
+        chunks: Upload contents, chunk by chunk
+        max_bytes: Largest accepted upload
+
+    Returns:
+        (temporary file positioned at its start, sha256 hex digest, size)
+
+    Raises:
+        PhotoTooLarge: As soon as more than max_bytes have been read
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16)
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            spooled.close()
+            raise PhotoTooLarge(f'Photo is larger than {max_bytes} bytes')
+        digest.update(chunk)
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled, digest.hexdigest(), size
+
+
+def store_upload(chunks: Iterable[bytes], content_type: str):
+    """
+    Store an uploaded photo once per content hash and queue its processing.
+
+    Args:
+        chunks: Upload contents, chunk by chunk
+        content_type: One of PHOTO_CONTENT_TYPES
+
+    Returns:
+        (MealPhoto, created) where created is False for a duplicate upload
+
+    Raises:
+        PhotoTooLarge: If the upload exceeds MEAL_PHOTO_MAX_BYTES
+    """
+    from .models import MealPhoto
+
+    spooled, sha256, size = spool_upload(chunks, settings.MEAL_PHOTO_MAX_BYTES)
+    with spooled:
+        existing = MealPhoto.objects.filter(sha256=sha256).first()
+        if existing is not None:
+            return existing, False
+
+        name = default_storage.save(
+            f'meal_photos/originals/{sha256[:2]}/{sha256}.{PHOTO_CONTENT_TYPES[content_type]}', File(spooled)
+        )
+    try:
+        with transaction.atomic():
+            photo = MealPhoto.objects.create(sha256=sha256, original=name, content_type=content_type, size=size)
+    except IntegrityError:
+        # The same photo was stored concurrently; keep that one.
+        default_storage.delete(name)
+        return MealPhoto.objects.get(sha256=sha256), False
+    photo_pipeline.enqueue(photo.pk)
+    return photo, True
+
+
+def process_photo(photo_id: int, executor: Optional[ProcessPoolExecutor] = None) -> None:
+    """
+    Render the variants of a pending photo and store them.
+
+    Args:
+        photo_id: MealPhoto to process
+        executor: Process pool to render in, this process by default
+    """
+    from .models import MealPhoto
+
+    # Claim the photo, so one submitted twice is only rendered once.
+    if not MealPhoto.objects.filter(pk=photo_id, status='pending').exclude(original='').update(status='processing'):
+        return
+
+    # Any error from here on fails the photo, rather than leaving it processing.
+    photo = None
+    try:
+        photo = MealPhoto.objects.get(pk=photo_id)
+        _render_photo(photo, executor)
+    except Exception as e:
+        logger.warning('Meal photo %s could not be processed: %s', photo_id, e)
+        if photo is not None:
+            _delete_variants(photo)
+        MealPhoto.objects.filter(pk=photo_id).update(
+            status='failed', error=str(e) or type(e).__name__, processed_at=timezone.now()
+        )
+
+
+def _render_photo(photo, executor: Optional[ProcessPoolExecutor]) -> None:
+    with photo.original.open('rb') as original:
+        arguments = (
+            original.read(),
+            settings.MEAL_PHOTO_THUMBNAIL_SIZE,
+            settings.MEAL_PHOTO_WEBP_SIZE,
+            settings.MEAL_PHOTO_QUALITY,
+        )
+    if executor is None:
+        result = render_variants(*arguments)
+    else:
+        result = executor.submit(render_variants, *arguments).result()
+
+    stem = f'{photo.sha256[:2]}/{photo.sha256}'
+    photo.thumbnail.save(f'{stem}.jpg', ContentFile(result['thumbnail']), save=False)
+    photo.webp.save(f'{stem}.webp', ContentFile(result['webp']), save=False)
+    original = photo.original.name
+    photo.original = ''
+    photo.width, photo.height = result['width'], result['height']
+    photo.status, photo.error, photo.processed_at = 'ready', '', timezone.now()
+    photo.save(update_fields=['thumbnail', 'webp', 'original', 'width', 'height', 'status', 'error', 'processed_at'])
+    # The original still carries EXIF, location included; only variants are
+    # kept. It is deleted last, so a failed photo can still be retried.
+    default_storage.delete(original)
+
+
+def _delete_variants(photo) -> None:
+    for variant in (photo.thumbnail, photo.webp):
+        if variant:
+            try:
+                variant.delete(save=False)
+            except Exception as e:
+                logger.warning('Could not delete %s: %s', variant.name, e)
+
+
+class PhotoPipeline:
+    """
+    Processes meal photos off the request path.
+
+    enqueue() only schedules work once the current transaction commits. A
+    small thread pool then loads each original from storage and hands the
+    CPU-bound decode and encode to a pool of spawned processes, so request
+    workers never wait on Pillow. With MEAL_PHOTO_WORKERS set to 0 photos
+    are processed in the committing thread instead, for development and
+    tests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def enqueue(self, photo_id: int) -> None:
+        """Process a photo after the current transaction commits"""
+        transaction.on_commit(lambda: self.submit(photo_id))
+
+    def submit(self, photo_id: int) -> Optional[Future]:
+        """Process a photo now, in the background unless MEAL_PHOTO_WORKERS is 0"""
+        if settings.MEAL_PHOTO_WORKERS <= 0:
+            process_photo(photo_id)
+            return None
+        return self._executors()[0].submit(self._run, photo_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            for executor in (self._threads, self._processes):
+                if executor is not None:
+                    executor.shutdown(wait=wait)
+            self._threads = self._processes = None
+
+    def _run(self, photo_id: int) -> None:
+        try:
+            process_photo(photo_id, self._executors()[1])
+        except Exception:
+            logger.exception('Meal photo %s processing crashed', photo_id)
+        finally:
+            # Pool threads outlive requests, so nothing else closes their connections.
+            connections.close_all()
+
+    def _executors(self) -> Tuple[ThreadPoolExecutor, ProcessPoolExecutor]:
+        with self._lock:
+            if self._processes is None:
+                workers = settings.MEAL_PHOTO_WORKERS
+                self._processes = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='meal-photos')
+            return self._threads, self._processes
+
+
+photo_pipeline = PhotoPipeline()
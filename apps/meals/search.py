@@ -0,0 +1,285 @@
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Lookup, Q, Value, When
+from django.db.models.functions import Length, Upper
+
+from apps.caching import VersionStamp
+
+# Match kinds, best first
+PREFIX, WORD_PREFIX, FUZZY = 'prefix', 'word_prefix', 'fuzzy'
+MATCH_RANKS = {PREFIX: 2, WORD_PREFIX: 1, FUZZY: 0}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and turn punctuation into single spaces"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    cleaned = ''.join(
+        char if char.isalnum() else ' '
+        for char in decomposed.lower()
+        if not unicodedata.combining(char)
+    )
+    return ' '.join(cleaned.split())
+
+
+def trigrams(text: str, prefix: bool = False) -> Set[str]:
+    """
+    Trigrams of normalized text, padded per word the way pg_trgm does.
+
+    Args:
+        text: Normalized text
+        prefix: Treat the last word as unfinished, leaving out its trailing
+            padded trigram so it matches longer words it is a prefix of
+
+    Returns:
+        Set of trigrams
+    """
+    words = text.split()
+    grams = set()
+    for index, word in enumerate(words):
+        padded = '  ' + word if prefix and index == len(words) - 1 else '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def match_kind(name: str, query: str) -> str:
+    """How a normalized name matches a normalized query"""
+    if name.startswith(query):
+        return PREFIX
+    if ' ' + query in name:
+        return WORD_PREFIX
+    return FUZZY
+
+
+class IngredientIndex:
+    """
+    Process-wide, in-memory trigram index of Ingredient names.
+
+    Each trigram maps to the positions of the names containing it, so a query
+    only touches the posting lists of its own trigrams. Names sharing enough
+    trigrams with the query are fuzzy matches, scored with the same
+    similarity as pg_trgm; names containing every trigram of the query's
+    unfinished last word are prefix candidates. The index is rebuilt when
+    the shared version stamp changes, which happens whenever an ingredient
+    name or category is written.
+    """
+
+    def __init__(self):
+        self.version_stamp = VersionStamp('meals:ingredient_index:version')
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._names: List[str] = []
+        self._normalized: List[str] = []
+        self._categories = np.empty(0, dtype=np.int64)
+        self._sizes = np.empty(0, dtype=np.int32)
+        self._postings: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._names)
+
+    def invalidate(self) -> None:
+        """Force every process to rebuild the index on next use"""
+        self.version_stamp.bump()
+
+    def clear(self) -> None:
+        """Drop this process's copy of the index"""
+        with self._lock:
+            self._version = None
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        category_ids: Optional[Set[int]] = None,
+        threshold: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Find ingredients whose name starts with, or resembles, the query.
+
+        Args:
+            query: Text typed so far
+            limit: Maximum number of results
+            category_ids: Optional categories the ingredient must belong to
+            threshold: Minimum trigram similarity of a fuzzy match, defaults
+                to INGREDIENT_SEARCH_THRESHOLD
+
+        Returns:
+            Results ranked by match kind, similarity and name length, each
+            with id, name, category_id, score and match
+        """
+        self._ensure_loaded()
+        normalized = normalize(query)
+        if not normalized or not self._names or limit <= 0:
+            return []
+        if threshold is None:
+            threshold = settings.INGREDIENT_SEARCH_THRESHOLD
+
+        query_grams = trigrams(normalized)
+        prefix_grams = trigrams(normalized, prefix=True)
+        shared = self._count(query_grams)
+        similarity = shared / (len(query_grams) + self._sizes - shared)
+        prefix_candidate = self._count(prefix_grams) == len(prefix_grams)
+
+        candidates = prefix_candidate | (similarity >= threshold)
+        if category_ids is not None:
+            candidates &= np.isin(self._categories, list(category_ids))
+        positions = np.flatnonzero(candidates)
+        if not len(positions):
+            return []
+
+        # Cheap vectorized pre-ranking, then exact match kinds on the top few.
+        rough = prefix_candidate[positions] * 2.0 + similarity[positions]
+        keep = max(limit * 5, 50)
+        if len(positions) > keep:
+            positions = positions[np.argpartition(-rough, keep - 1)[:keep]]
+
+        results = []
+        for position in positions.tolist():
+            kind = match_kind(self._normalized[position], normalized)
+            score = float(similarity[position])
+            if kind == FUZZY and score < threshold:
+                continue
+            category_id = int(self._categories[position])
+            results.append({
+                'id': int(self._ids[position]),
+                'name': self._names[position],
+                'category_id': category_id if category_id >= 0 else None,
+                'score': round(score, 4),
+                'match': kind,
+            })
+        results.sort(key=lambda result: (
+            -MATCH_RANKS[result['match']], -result['score'], len(result['name']), result['name'],
+        ))
+        return results[:limit]
+
+    def _count(self, grams: Set[str]) -> np.ndarray:
+        """Number of the given trigrams each indexed name contains"""
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return np.zeros(len(self._names), dtype=np.int64)
+        return np.bincount(np.concatenate(lists), minlength=len(self._names))
+
+    def _ensure_loaded(self) -> None:
+        version = self.version_stamp.current()
+        if version != self._version:
+            self._load(version)
+
+    def _load(self, version: int) -> None:
+        from .models import Ingredient
+
+        with self._lock:
+            if self._version == version:
+                return
+            ids, names, normalized, categories, sizes = [], [], [], [], []
+            postings: Dict[str, List[int]] = {}
+            rows = Ingredient.objects.order_by('pk').values_list('pk', 'name', 'category_id')
+            for position, (pk, name, category_id) in enumerate(rows.iterator(chunk_size=5000)):
+                text = normalize(name)
+                grams = trigrams(text)
+                ids.append(pk)
+                names.append(name)
+                normalized.append(text)
+                categories.append(-1 if category_id is None else category_id)
+                sizes.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(position)
+
+            self._ids = np.array(ids, dtype=np.int64)
+            self._names = names
+            self._normalized = normalized
+            self._categories = np.array(categories, dtype=np.int64)
+            self._sizes = np.array(sizes, dtype=np.int32)
+            self._postings = {gram: np.array(found, dtype=np.int32) for gram, found in postings.items()}
+            self._version = version
+
+
+ingredient_index = IngredientIndex()
+
+
+class TrigramMatch(Lookup):
+    """pg_trgm's ``%`` operator, which can use a gin_trgm_ops index"""
+
+    lookup_name = 'trigram_match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} %% {rhs}', (*lhs_params, *rhs_params)
+
+
+def _search_postgresql(
+    query: str, limit: int, category_ids: Optional[Set[int]], threshold: float
+) -> List[Dict[str, Any]]:
+    """Rank ingredients with pg_trgm and the meals_ingr_name_trgm index"""
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    from .models import Ingredient
+
+    text = query.strip()
+    upper_name = Upper('name')
+    ingredients = Ingredient.objects.annotate(
+        score=TrigramSimilarity(upper_name, Value(text.upper())),
+        rank=Case(
+            When(name__istartswith=text, then=Value(MATCH_RANKS[PREFIX])),
+            When(name__icontains=' ' + text, then=Value(MATCH_RANKS[WORD_PREFIX])),
+            default=Value(MATCH_RANKS[FUZZY]),
+            output_field=IntegerField(),
+        ),
+    ).filter(
+        Q(name__istartswith=text)
+        | Q(name__icontains=' ' + text)
+        | (TrigramMatch(upper_name, Value(text.upper())) & Q(score__gte=Value(threshold, output_field=FloatField())))
+    )
+    if category_ids is not None:
+        ingredients = ingredients.filter(category_id__in=category_ids)
+
+    kinds = {rank: kind for kind, rank in MATCH_RANKS.items()}
+    rows = ingredients.order_by('-rank', '-score', Length('name'), 'name').values_list(
+        'pk', 'name', 'category_id', 'score', 'rank'
+    )[:limit]
+    return [
+        {
+            'id': pk,
+            'name': name,
+            'category_id': category_id,
+            'score': round(score, 4),
+            'match': kinds[rank],
+        }
+        for pk, name, category_id, score, rank in rows
+    ]
+
+
+def search_ingredients(
+    query: str,
+    limit: int = 10,
+    category_ids: Optional[Set[int]] = None,
+    threshold: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Autocomplete ingredient names with prefix and typo-tolerant matching.
+
+    PostgreSQL ranks in the database with pg_trgm; other databases use the
+    in-memory trigram index. Both return the same result shape.
+
+    Args:
+        query: Text typed so far
+        limit: Maximum number of results
+        category_ids: Optional categories the ingredient must belong to
+        threshold: Minimum trigram similarity of a fuzzy match
+
+    Returns:
+        Ranked list of {id, name, category_id, score, match}
+    """
+    if threshold is None:
+        threshold = settings.INGREDIENT_SEARCH_THRESHOLD
+    if connection.vendor == 'postgresql':
+        if not normalize(query) or limit <= 0:
+            return []
+        return _search_postgresql(query, limit, category_ids, threshold)
+    return ingredient_index.search(query, limit, category_ids, threshold)
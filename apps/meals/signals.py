@@ -0,0 +1,188 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .nutrition import NUTRIENT_FIELDS
+
+# Sent with ``meal_ids`` whenever the ingredients of meals, or the nutrients
+# of ingredients they use, are written through save(), delete(),
+# bulk_create() or update().
+meal_ingredients_changed = Signal()
+
+
+@receiver(pre_save, sender='meals.MealIngredient')
+def meal_ingredient_saving(sender, instance, **kwargs):
+    """Remember the meal an existing row belonged to before it is saved"""
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_meal_id = (
+            sender.objects.filter(pk=instance.pk).values_list('meal_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender='meals.MealIngredient')
+def meal_ingredient_saved(sender, instance, **kwargs):
+    """Announce the meal of a saved ingredient row, and its previous meal if it moved"""
+    meal_ids = {instance.meal_id}
+    previous = getattr(instance, '_previous_meal_id', None)
+    if previous is not None:
+        meal_ids.add(previous)
+    meal_ingredients_changed.send(sender=sender, meal_ids=meal_ids)
+
+
+@receiver(post_delete, sender='meals.MealIngredient')
+def meal_ingredient_deleted(sender, instance, **kwargs):
+    """Announce the meal of a deleted ingredient row"""
+    meal_ingredients_changed.send(sender=sender, meal_ids={instance.meal_id})
+
+
+@receiver(post_save, sender='meals.Ingredient')
+def ingredient_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Announce the meals using an ingredient whose nutrients may have changed"""
+    from .models import MealIngredient
+
+    if created or (update_fields is not None and not set(NUTRIENT_FIELDS) & set(update_fields)):
+        return
+    meal_ids = set(MealIngredient.objects.filter(ingredient=instance).values_list('meal_id', flat=True))
+    if meal_ids:
+        meal_ingredients_changed.send(sender=sender, meal_ids=meal_ids)
+
+
+@receiver(post_save, sender='meals.Ingredient')
+def ingredient_name_saved(sender, instance, update_fields=None, **kwargs):
+    """Rebuild the ingredient search index, once committed, when a name or category may have changed"""
+    from .models import INGREDIENT_INDEX_FIELDS
+    from .search import ingredient_index
+
+    if update_fields is None or set(INGREDIENT_INDEX_FIELDS) & set(update_fields):
+        transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_delete, sender='meals.Ingredient')
+def ingredient_deleted(sender, instance, **kwargs):
+    """Drop a deleted ingredient from the search index once the delete is committed"""
+    from .search import ingredient_index
+
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender='meals.Category')
+@receiver(post_delete, sender='meals.Category')
+def category_changed(sender, **kwargs):
+    """Reload the category tree snapshot once a category write or delete is committed"""
+    from .categories import category_tree
+
+    transaction.on_commit(category_tree.invalidate)
+
+
+@receiver(post_save, sender='meals.Barcode')
+@receiver(post_delete, sender='meals.Barcode')
+def barcode_changed(sender, **kwargs):
+    """Drop cached barcode lookups once a barcode write or delete is committed"""
+    from .barcodes import barcode_resolver
+
+    transaction.on_commit(barcode_resolver.invalidate)
+
+
+@receiver(meal_ingredients_changed)
+def refresh_meal_nutrition(sender, meal_ids, **kwargs):
+    """Keep the stored meal nutrition totals in sync with ingredient writes"""
+    from .models import Meal
+
+    Meal.objects.refresh_nutrition(meal_ids)
+
+
+@receiver(meal_ingredients_changed)
+def refresh_meal_ingredient_sets(sender, meal_ids, **kwargs):
+    """Keep the stored meal ingredient sets in sync with ingredient rows"""
+    from .models import Meal
+
+    Meal.objects.refresh_ingredient_sets(meal_ids)
+
+
+@receiver(post_save, sender='meals.Meal')
+@receiver(post_delete, sender='meals.Meal')
+def meal_changed(sender, instance, created=False, **kwargs):
+    """Add new meals to, and drop deleted ones from, the meal set snapshot once committed"""
+    from .exclusions import meal_sets
+
+    if created or kwargs['signal'] is post_delete:
+        transaction.on_commit(partial(meal_sets.invalidate, [instance.pk]))
+
+
+@receiver(pre_save, sender='meals.MealPreference')
+def meal_preference_saving(sender, instance, **kwargs):
+    """Remember the user an existing preference belonged to before it is saved"""
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_user_id = (
+            sender.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender='meals.MealPreference')
+def meal_preference_saved(sender, instance, **kwargs):
+    """Refresh the exclusions of the preference's user, and of its previous user if it moved"""
+    from .models import NutritionProfile
+
+    user_ids = {instance.user_id}
+    previous = getattr(instance, '_previous_user_id', None)
+    if previous is not None:
+        user_ids.add(previous)
+    NutritionProfile.objects.refresh_exclusions(user_ids)
+
+
+@receiver(post_delete, sender='meals.MealPreference')
+def meal_preference_deleted(sender, instance, **kwargs):
+    """Refresh the exclusions of a deleted preference's user"""
+    from .models import NutritionProfile
+
+    NutritionProfile.objects.refresh_exclusions({instance.user_id})
+
+
+@receiver(pre_save, sender='meals.MealRecord')
+def meal_record_saving(sender, instance, **kwargs):
+    """Remember the user and time an existing record counted towards"""
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_day = (
+            sender.objects.filter(pk=instance.pk).values_list('user_id', 'timestamp').first()
+        )
+
+
+@receiver(post_save, sender='meals.MealRecord')
+def meal_record_saved(sender, instance, **kwargs):
+    """Refresh the daily intake of the record's day, and of its previous day if it moved"""
+    from .models import DailyIntake
+
+    records = [(instance.user_id, instance.timestamp)]
+    previous = getattr(instance, '_previous_day', None)
+    if previous is not None:
+        records.append(previous)
+    DailyIntake.objects.refresh_records(records)
+
+
+@receiver(post_delete, sender='meals.MealRecord')
+def meal_record_deleted(sender, instance, **kwargs):
+    """Refresh the daily intake of a deleted record's day"""
+    from .models import DailyIntake
+
+    DailyIntake.objects.refresh_records([(instance.user_id, instance.timestamp)])
+
+
+@receiver(meal_ingredients_changed)
+def refresh_daily_intake(sender, meal_ids, **kwargs):
+    """Refresh the days on which meals whose totals changed were eaten"""
+    from .models import DailyIntake, MealRecord
+
+    records = MealRecord.objects.filter(meal_id__in=meal_ids).values_list('user_id', 'timestamp')
+    DailyIntake.objects.refresh_records(records)
+
+
+@receiver(post_save, sender='meals.NutritionProfile')
+def nutrition_profile_saved(sender, instance, update_fields=None, **kwargs):
+    """Regroup a user's meals into days after their time zone is set"""
+    from .models import DailyIntake
+
+    if update_fields is not None and 'time_zone' not in update_fields:
+        return
+    DailyIntake.objects.rebuild(instance.user_id)
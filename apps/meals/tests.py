@@ -1,3 +1,778 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import date, datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import ExifTags, Image
+
+from goals.models import Goal
+from .models import (
+    Barcode, Category, DailyIntake, Diet, Ingredient, Meal, MealIngredient, MealPhoto, MealPreference, MealRecord,
+    NutritionProfile,
+)
+from .barcodes import barcode_resolver, normalize_gtin
+from .categories import build_paths, category_tree
+from .exclusions import meal_sets
+from .imaging import render_variants
+from .nutrition import meal_totals, unit_to_grams
+from .photos import photo_pipeline, process_photo
+from .search import ingredient_index, normalize, search_ingredients, trigrams
+
+
+class NutritionEngineTests(TestCase):
+    def test_unit_to_grams(self):
+        self.assertEqual(unit_to_grams('g'), 1)
+        self.assertEqual(unit_to_grams(' KG '), 1000)
+        self.assertEqual(unit_to_grams('Tbsp.'), 15)
+        self.assertEqual(unit_to_grams('fl  oz'), 29.5735295625)
+        self.assertIsNone(unit_to_grams('piece'))
+        self.assertIsNone(unit_to_grams(''))
+
+    def test_meal_totals(self):
+        # meal, quantity, unit, proteins, fats, carbs, calories, fibers, sugars per 100 g
+        rows = [
+            (1, 200, 'g', 10, 5, 20, 165, 2, 1),
+            (1, 0.1, 'kg', 20, 0, 0, 80, 0, 0),
+            (2, 2, 'tbsp', 0, 100, 0, 900, 0, 0),
+            (2, 1, 'piece', 1, 1, 1, 1, 1, 1),
+        ]
+
+        totals = meal_totals(rows)
+
+        self.assertEqual(totals[1], {
+            'weight_g': 300,
+            'proteins_g': 40,
+            'fats_g': 10,
+            'carbs_g': 40,
+            'calories_kcal': 410,
+            'fibers_g': 4,
+            'sugars_g': 2,
+            'nutrition_complete': True,
+        })
+        self.assertEqual(totals[2]['weight_g'], 30)
+        self.assertEqual(totals[2]['calories_kcal'], 270)
+        self.assertFalse(totals[2]['nutrition_complete'])
+        self.assertEqual(meal_totals([]), {})
+
+
+class MealNutritionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='nutrition-user')
+        goal = Goal.objects.create(user=user, goal_type='weight_loss')
+        cls.diet = Diet.objects.create(
+            name='Cut', user=user, goal=goal, day_proteins_g=150, day_fats_g=60,
+            day_carbohydrates_g=200, day_calories_kcal=1900,
+        )
+        cls.rice = Ingredient.objects.create(
+            name='Rice', proteins=7, fats=1, carbs=80, calories=360, fibers=1, sugars=0,
+        )
+        cls.chicken = Ingredient.objects.create(
+            name='Chicken breast', proteins=31, fats=4, carbs=0, calories=165, fibers=0, sugars=0,
+        )
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Lunch', description='', diet=self.diet)
+
+    def refreshed(self, meal=None):
+        return Meal.objects.get(pk=(meal or self.meal).pk)
+
+    def test_totals_follow_ingredient_rows(self):
+        rice = MealIngredient.objects.create(meal=self.meal, ingredient=self.rice, quantity=100, unit='g')
+        MealIngredient.objects.create(meal=self.meal, ingredient=self.chicken, quantity=0.2, unit='kg')
+
+        meal = self.refreshed()
+        self.assertEqual(meal.weight_g, 300)
+        self.assertAlmostEqual(meal.proteins_g, 7 + 62)
+        self.assertAlmostEqual(meal.calories_kcal, 360 + 330)
+
+        rice.quantity = 50
+        rice.save()
+        self.assertAlmostEqual(self.refreshed().calories_kcal, 180 + 330)
+
+        rice.delete()
+        self.assertAlmostEqual(self.refreshed().calories_kcal, 330)
+
+    def test_moving_a_row_refreshes_both_meals(self):
+        dinner = Meal.objects.create(name='Dinner', description='', diet=self.diet)
+        row = MealIngredient.objects.create(meal=self.meal, ingredient=self.chicken, quantity=100, unit='g')
+
+        row.meal = dinner
+        row.save()
+
+        self.assertEqual(self.refreshed().calories_kcal, 0)
+        self.assertEqual(self.refreshed(dinner).calories_kcal, 165)
+
+    def test_ingredient_changes_refresh_meals_using_it(self):
+        MealIngredient.objects.create(meal=self.meal, ingredient=self.rice, quantity=100, unit='g')
+
+        self.rice.calories = 350
+        self.rice.save()
+        self.assertEqual(self.refreshed().calories_kcal, 350)
+
+        Ingredient.objects.filter(pk=self.rice.pk).update(calories=340)
+        self.assertEqual(self.refreshed().calories_kcal, 340)
+
+    def test_bulk_writes_refresh_totals(self):
+        MealIngredient.objects.bulk_create([
+            MealIngredient(meal=self.meal, ingredient=self.rice, quantity=100, unit='g'),
+            MealIngredient(meal=self.meal, ingredient=self.chicken, quantity=1, unit='piece'),
+        ])
+
+        meal = self.refreshed()
+        self.assertEqual(meal.calories_kcal, 360)
+        self.assertFalse(meal.nutrition_complete)
+
+        MealIngredient.objects.filter(meal=self.meal, unit='piece').update(unit='oz', quantity=4)
+        meal = self.refreshed()
+        self.assertTrue(meal.nutrition_complete)
+        self.assertAlmostEqual(meal.weight_g, 100 + 4 * 28.349523125)
+
+    def test_refresh_runs_a_fixed_number_of_queries(self):
+        meals = [Meal.objects.create(name=f'Meal {n}', description='', diet=self.diet) for n in range(5)]
+        for meal in meals:
+            MealIngredient.objects.create(meal=meal, ingredient=self.rice, quantity=100, unit='g')
+
+        with self.assertNumQueries(2):
+            Meal.objects.refresh_nutrition([meal.pk for meal in meals])
+
+
+class DailyIntakeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='intake-user')
+        goal = Goal.objects.create(user=cls.user, goal_type='weight_loss')
+        cls.diet = Diet.objects.create(
+            name='Cut', user=cls.user, goal=goal, day_proteins_g=150, day_fats_g=60,
+            day_carbohydrates_g=200, day_calories_kcal=2000,
+        )
+        oats = Ingredient.objects.create(name='Oats', proteins=13, fats=7, carbs=68, calories=380, fibers=10, sugars=1)
+        cls.breakfast = Meal.objects.create(name='Porridge', description='', diet=cls.diet)
+        MealIngredient.objects.create(meal=cls.breakfast, ingredient=oats, quantity=100, unit='g')
+        cls.oats = oats
+
+    def eat(self, hour, day=10, meal=None):
+        return MealRecord.objects.create(
+            meal=meal or self.breakfast,
+            user=self.user,
+            timestamp=datetime(2025, 3, day, hour, tzinfo=dt_timezone.utc),
+        )
+
+    def intake(self):
+        return {
+            row.date: (row.meal_count, row.calories_kcal)
+            for row in DailyIntake.objects.filter(user=self.user)
+        }
+
+    def test_records_roll_up_per_day(self):
+        self.eat(8)
+        record = self.eat(20)
+        self.eat(8, day=11)
+        self.assertEqual(self.intake(), {date(2025, 3, 10): (2, 760), date(2025, 3, 11): (1, 380)})
+
+        record.timestamp = datetime(2025, 3, 11, 20, tzinfo=dt_timezone.utc)
+        record.save()
+        self.assertEqual(self.intake(), {date(2025, 3, 10): (1, 380), date(2025, 3, 11): (2, 760)})
+
+        MealRecord.objects.filter(timestamp__day=10).delete()
+        self.assertEqual(self.intake(), {date(2025, 3, 11): (2, 760)})
+
+    def test_bulk_writes_roll_up(self):
+        def at(day, hour):
+            return datetime(2025, 3, day, hour, tzinfo=dt_timezone.utc)
+
+        records = MealRecord.objects.bulk_create(
+            [MealRecord(meal=self.breakfast, user=self.user, timestamp=at(10, hour)) for hour in (8, 20)]
+        )
+        self.assertEqual(self.intake(), {date(2025, 3, 10): (2, 760)})
+
+        MealRecord.objects.filter(pk=records[0].pk).update(timestamp=at(11, 8))
+        self.assertEqual(self.intake(), {date(2025, 3, 10): (1, 380), date(2025, 3, 11): (1, 380)})
+
+        records[1].timestamp = at(11, 20)
+        MealRecord.objects.bulk_update([records[1]], ['timestamp'])
+        self.assertEqual(self.intake(), {date(2025, 3, 11): (2, 760)})
+
+        other = User.objects.create_user(username='other-intake-user')
+        MealRecord.objects.filter(pk=records[1].pk).update(user=other)
+        self.assertEqual(self.intake(), {date(2025, 3, 11): (1, 380)})
+        self.assertEqual(DailyIntake.objects.get(user=other).meal_count, 1)
+
+        # Fields the rollups do not use cost no refresh
+        with self.assertNumQueries(1):
+            MealRecord.objects.filter(user=self.user).update(feedback='Tasty')
+
+    def test_days_follow_the_user_time_zone(self):
+        self.eat(2)
+        self.eat(20)
+        self.assertEqual(self.intake(), {date(2025, 3, 10): (2, 760)})
+
+        # 02:00 UTC is still the previous evening in New York.
+        NutritionProfile.objects.create(user=self.user, time_zone='America/New_York')
+        self.assertEqual(self.intake(), {date(2025, 3, 9): (1, 380), date(2025, 3, 10): (1, 380)})
+
+        self.eat(3, day=12)
+        self.assertEqual(self.intake()[date(2025, 3, 11)], (1, 380))
+
+    def test_meal_total_changes_reach_logged_days(self):
+        self.eat(8)
+
+        self.oats.calories = 400
+        self.oats.save()
+
+        self.assertEqual(self.intake(), {date(2025, 3, 10): (1, 400)})
+
+    def test_compare_to_diet_reads_rollups(self):
+        self.eat(8)
+        self.eat(12)
+        self.eat(8, day=12)
+
+        with self.assertNumQueries(2):
+            comparison = DailyIntake.objects.compare_to_diet(self.user.id, date(2025, 3, 10), date(2025, 3, 16))
+
+        self.assertEqual(comparison['diet']['targets']['calories_kcal'], 2000)
+        self.assertEqual([day['date'] for day in comparison['days']], ['2025-03-10', '2025-03-12'])
+        self.assertEqual(comparison['days'][0]['difference']['calories_kcal'], 760 - 2000)
+        self.assertEqual(comparison['summary']['days_tracked'], 2)
+        self.assertEqual(comparison['summary']['totals']['calories_kcal'], 1140)
+        self.assertEqual(comparison['summary']['average_difference']['calories_kcal'], 570 - 2000)
+
+    def test_endpoint(self):
+        self.eat(8)
+        url = reverse('meals:daily_intake', args=[self.user.id])
+
+        response = self.client.get(url, {'start': '2025-03-01', 'end': '2025-03-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['days'][0]['calories_kcal'], 380)
+
+        self.assertEqual(self.client.get(url, {'start': '2025-03-31', 'end': '2025-03-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': 'March'}).status_code, 400)
+
+
+class IngredientSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.meat = Category.objects.create(name='Meat')
+        cls.legumes = Category.objects.create(name='Legumes')
+        names = [
+            ('Chicken breast', cls.meat),
+            ('Chickpeas', cls.legumes),
+            ('Smoked chicken thigh', cls.meat),
+            ('Broccoli', None),
+            ('Brown rice', None),
+            ('Crème fraîche', None),
+        ]
+        for name, category in names:
+            Ingredient.objects.create(
+                name=name, category=category, proteins=10, fats=5, carbs=20, calories=165, fibers=2, sugars=1,
+            )
+
+    def setUp(self):
+        ingredient_index.clear()
+
+    def names(self, query, **kwargs):
+        return [result['name'] for result in search_ingredients(query, **kwargs)]
+
+    def test_trigrams(self):
+        self.assertEqual(normalize('  Crème-Fraîche!'), 'creme fraiche')
+        self.assertEqual(trigrams('ab'), {'  a', ' ab', 'ab '})
+        self.assertEqual(trigrams('ab', prefix=True), {'  a', ' ab'})
+
+    def test_prefix_matches_rank_first(self):
+        results = search_ingredients('chi')
+
+        self.assertEqual(
+            [(result['name'], result['match']) for result in results],
+            [('Chickpeas', 'prefix'), ('Chicken breast', 'prefix'), ('Smoked chicken thigh', 'word_prefix')],
+        )
+        self.assertEqual(search_ingredients('CHICKEN b')[0]['match'], 'prefix')
+
+    def test_typos_and_accents(self):
+        self.assertEqual(self.names('brocoli'), ['Broccoli'])
+        self.assertEqual(self.names('chiken breast')[0], 'Chicken breast')
+        self.assertEqual(self.names('creme'), ['Crème fraîche'])
+        self.assertEqual(self.names('xyz'), [])
+        self.assertEqual(self.names('  '), [])
+
+    def test_category_filter_and_limit(self):
+        self.assertEqual(self.names('chi', category_ids={self.meat.id}), ['Chicken breast', 'Smoked chicken thigh'])
+        self.assertEqual(len(self.names('chi', limit=1)), 1)
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.names('bro'), ['Broccoli', 'Brown rice'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(name='Brown rice').update(name='Wild rice')
+            Ingredient.objects.get(name='Broccoli').delete()
+            Ingredient.objects.bulk_create([
+                Ingredient(name='Broad beans', proteins=8, fats=1, carbs=12, calories=88, fibers=5, sugars=1),
+            ])
+            # Until the writes commit, the index is not rebuilt
+            self.assertEqual(self.names('bro'), ['Broccoli', 'Brown rice'])
+
+        self.assertEqual(self.names('bro'), ['Broad beans'])
+
+    def test_nutrient_updates_keep_the_index(self):
+        len(ingredient_index)
+        version = ingredient_index._version
+
+        Ingredient.objects.filter(name='Broccoli').update(calories=34)
+        ingredient = Ingredient.objects.get(name='Broccoli')
+        ingredient.calories = 35
+        ingredient.save(update_fields=['calories'])
+
+        len(ingredient_index)
+        self.assertEqual(ingredient_index._version, version)
+
+    def test_endpoint(self):
+        url = reverse('meals:ingredient_search')
+
+        response = self.client.get(url, {'q': 'chick', 'category': self.legumes.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['name'], 'Chickpeas')
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'chick', 'limit': 'ten'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'chick', 'limit': 500}).status_code, 400)
+
+
+class CategoryTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dairy = Category.objects.create(name='Dairy')
+        cls.cheese = Category.objects.create(name='Cheese', parent=cls.dairy)
+        cls.hard = Category.objects.create(name='Hard cheese', parent=cls.cheese)
+        cls.produce = Category.objects.create(name='Produce')
+        for name, category in [('Milk', cls.dairy), ('Brie', cls.cheese), ('Parmesan', cls.hard), ('Kale', cls.produce)]:
+            Ingredient.objects.create(
+                name=name, category=category, proteins=10, fats=5, carbs=20, calories=165, fibers=2, sugars=1,
+            )
+
+    def setUp(self):
+        category_tree.clear()
+        ingredient_index.clear()
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat=True))
+
+    def test_paths_compare_bytewise(self):
+        field = Category._meta.get_field('path')
+        for vendor, collation in [('postgresql', 'C'), ('mysql', 'utf8mb4_bin'), ('sqlite', None)]:
+            with mock.patch.object(connection, 'vendor', vendor):
+                self.assertEqual(field.db_parameters(connection)['collation'], collation)
+
+    def test_paths_follow_parents(self):
+        self.assertEqual(self.hard.path, f'/{self.dairy.pk}/{self.cheese.pk}/{self.hard.pk}/')
+        self.assertEqual(self.hard.depth, 2)
+        self.assertEqual(build_paths([(1, None), (2, 1), (3, 4), (4, 3)]), {1: '/1/', 2: '/1/2/'})
+
+    def test_single_query_lookups(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names(Category.objects.descendants(self.dairy)), ['Cheese', 'Hard cheese'])
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(Category.objects.ancestors(self.hard).values_list('name', flat=True)), ['Dairy', 'Cheese'],
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names(Ingredient.objects.in_category(self.cheese)), ['Brie', 'Parmesan'])
+
+    def test_subtree_lookup_uses_the_path_index(self):
+        queryset = Ingredient.objects.in_category(self.dairy)
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+        # SQLite before 3.36 writes 'SCAN TABLE meals_category'
+        self.assertNotRegex(plan, r'\bSCAN (TABLE )?meals_category\b')
+
+    def test_reparenting_moves_the_subtree(self):
+        self.cheese.parent = self.produce
+        self.cheese.save()
+
+        self.hard.refresh_from_db()
+        self.assertEqual(self.hard.path, f'/{self.produce.pk}/{self.cheese.pk}/{self.hard.pk}/')
+        self.assertEqual(self.names(Ingredient.objects.in_category(self.dairy)), ['Milk'])
+        self.assertEqual(self.names(Ingredient.objects.in_category(self.produce.pk)), ['Brie', 'Kale', 'Parmesan'])
+
+        self.cheese.parent = None
+        self.cheese.save()
+        self.hard.refresh_from_db()
+        self.assertEqual(self.hard.depth, 1)
+
+    def test_cycles_are_rejected(self):
+        self.dairy.parent = self.hard
+        with self.assertRaises(ValueError):
+            self.dairy.save()
+
+    def test_bulk_writes_rebuild_paths(self):
+        Category.objects.filter(pk=self.hard.pk).update(parent=self.produce)
+        Category.objects.bulk_create([Category(name='Yogurt', parent=self.dairy)])
+
+        self.assertEqual(self.names(Category.objects.descendants(self.produce)), ['Hard cheese'])
+        self.assertEqual(self.names(Category.objects.descendants(self.dairy)), ['Cheese', 'Yogurt'])
+
+    def test_snapshot(self):
+        category_tree.get(self.dairy.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(category_tree.descendant_ids(self.dairy.pk), {self.dairy.pk, self.cheese.pk, self.hard.pk})
+            self.assertEqual([node.name for node in category_tree.ancestors(self.hard.pk)], ['Dairy', 'Cheese'])
+            self.assertEqual([node['name'] for node in category_tree.as_tree()], ['Dairy', 'Produce'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hard.delete()
+        self.assertEqual(category_tree.descendant_ids(self.dairy.pk), {self.dairy.pk, self.cheese.pk})
+
+    def test_endpoints(self):
+        response = self.client.get(reverse('meals:category_tree'))
+        self.assertEqual(response.json()['categories'][0]['children'][0]['name'], 'Cheese')
+
+        response = self.client.get(reverse('meals:category_ingredients', args=[self.cheese.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.json()['ingredients']], ['Brie', 'Parmesan'])
+        self.assertEqual(response.json()['ancestors'], [{'id': self.dairy.pk, 'name': 'Dairy'}])
+
+        response = self.client.get(reverse('meals:ingredient_search'), {'q': 'parm', 'category': self.dairy.pk})
+        self.assertEqual(response.json()['results'][0]['name'], 'Parmesan')
+
+        self.assertEqual(self.client.get(reverse('meals:category_ingredients', args=[0])).status_code, 404)
+
+
+class BarcodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cola = Ingredient.objects.create(name='Cola', proteins=0, fats=0, carbs=10.6, calories=42, fibers=0, sugars=10.6)
+        Barcode.objects.create(gtin='5449000000996', ingredient=cls.cola)
+
+    def setUp(self):
+        barcode_resolver.clear()
+
+    def test_normalize_gtin(self):
+        self.assertEqual(normalize_gtin('0 36000-29145 2'), '00036000291452')
+        self.assertEqual(normalize_gtin('0036000291452'), normalize_gtin('036000291452'))
+        self.assertEqual(normalize_gtin('96385074'), '00000096385074')
+        for code in ('036000291453', '12345', 'abcdefghijkl', '', None):
+            with self.assertRaises(ValueError):
+                normalize_gtin(code)
+
+    def test_saved_codes_are_normalized_and_unique(self):
+        self.assertEqual(Barcode.objects.get().gtin, '05449000000996')
+        with self.assertRaises(ValueError):
+            Barcode.objects.create(gtin='5449000000997', ingredient=self.cola)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Barcode.objects.create(gtin='05449000000996', ingredient=self.cola)
+
+    def test_resolver_caches_hits_and_misses(self):
+        self.assertEqual(barcode_resolver.resolve('5449000000996'), self.cola.pk)
+        self.assertIsNone(barcode_resolver.resolve('96385074'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(barcode_resolver.resolve('05449000000996'), self.cola.pk)
+            self.assertIsNone(barcode_resolver.resolve('96385074'))
+        self.assertEqual(barcode_resolver.stats()['hits'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Barcode.objects.create(gtin='96385074', ingredient=self.cola)
+            # Lookups before the commit may still cache the miss...
+            self.assertIsNone(barcode_resolver.resolve('96385074'))
+        # ...which the committed write drops
+        self.assertEqual(barcode_resolver.resolve('96385074'), self.cola.pk)
+
+    def test_lookups_outrun_by_a_newer_version_are_not_cached(self):
+        barcode_resolver.resolve('5449000000996')
+
+        def bump_during_lookup(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            # Another thread sees a write and moves to the new version.
+            barcode_resolver.invalidate()
+            barcode_resolver._version = barcode_resolver.version_stamp.current()
+            return result
+
+        with connection.execute_wrapper(bump_during_lookup):
+            self.assertIsNone(barcode_resolver.resolve('96385074'))
+        self.assertNotIn(normalize_gtin('96385074'), barcode_resolver.cache)
+        self.assertEqual(barcode_resolver.stats()['misses'], 2)
+
+    def test_import_command(self):
+        rows = [
+            'code\tproduct_name\tingredient_id\tproteins_100g\tfat_100g\tcarbohydrates_100g\tenergy-kcal_100g',
+            '3017620422003\tHazelnut spread\t\t6.3\t30.9\t57.5\t539',
+            f'036000291452\t\t{self.cola.pk}\t\t\t\t',
+            '0036000291452\tDuplicate\t\t1\t1\t1\t1',
+            '5449000000996\tAlready registered\t\t1\t1\t1\t1',
+            '036000291453\tBad check digit\t\t1\t1\t1\t1',
+            '96385074\tNo calories\t\t1\t1\t1\t',
+            '40170725\t\t999999\t\t\t\t',
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv') as dump:
+            dump.write('\n'.join(rows) + '\n')
+            dump.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_barcodes', dump.name, chunk_size=2, source='test dump', stdout=out, stderr=err)
+
+        self.assertIn('7 rows, 2 barcodes and 1 ingredients created, 2 duplicates, 3 errors', out.getvalue())
+        self.assertIn('line 6: Invalid barcode', err.getvalue())
+        self.assertIn('line 8: Unknown ingredient_id: 999999', err.getvalue())
+        spread = Ingredient.objects.get(name='Hazelnut spread')
+        self.assertEqual((spread.fats, spread.calories, spread.fibers), (30.9, 539, 0))
+        self.assertEqual(barcode_resolver.resolve('3017620422003'), spread.pk)
+        self.assertEqual(barcode_resolver.resolve('036000291452'), self.cola.pk)
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('meals:barcode_lookup', args=['5449000000996']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['ingredient']['per_100g']['calories'], 42)
+
+        self.assertEqual(self.client.get(reverse('meals:barcode_lookup', args=['96385074'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('meals:barcode_lookup', args=['123'])).status_code, 400)
+
+
+class MealExclusionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='exclusion-user')
+        goal = Goal.objects.create(user=cls.user, goal_type='weight_loss')
+        diet = Diet.objects.create(
+            name='Cut', user=cls.user, goal=goal, day_proteins_g=150, day_fats_g=60,
+            day_carbohydrates_g=200, day_calories_kcal=2000,
+        )
+        nutrients = dict(proteins=10, fats=5, carbs=20, calories=165, fibers=2, sugars=1)
+        cls.peanuts = Ingredient.objects.create(name='Peanuts', **nutrients)
+        cls.rice = Ingredient.objects.create(name='Rice', **nutrients)
+        cls.olives = Ingredient.objects.create(name='Olives', **nutrients)
+        cls.satay = Meal.objects.create(name='Satay', description='', diet=diet)
+        cls.risotto = Meal.objects.create(name='Risotto', description='', diet=diet)
+        cls.salad = Meal.objects.create(name='Salad', description='', diet=diet)
+        MealIngredient.objects.bulk_create([
+            MealIngredient(meal=cls.satay, ingredient=cls.peanuts, quantity=50, unit='g'),
+            MealIngredient(meal=cls.satay, ingredient=cls.rice, quantity=100, unit='g'),
+            MealIngredient(meal=cls.risotto, ingredient=cls.rice, quantity=100, unit='g'),
+            MealIngredient(meal=cls.salad, ingredient=cls.olives, quantity=30, unit='g'),
+        ])
+
+    def setUp(self):
+        meal_sets.clear()
+
+    def compatible(self):
+        return list(Meal.objects.compatible_with(self.user.id, 100).values_list('name', flat=True))
+
+    def prefer(self, ingredient, preference_type):
+        return MealPreference.objects.create(user=self.user, ingredient=ingredient, preference_type=preference_type)
+
+    def test_meal_ingredient_sets_follow_rows(self):
+        self.satay.refresh_from_db()
+        self.assertEqual(self.satay.ingredient_ids, sorted([self.peanuts.pk, self.rice.pk]))
+
+        MealIngredient.objects.filter(meal=self.satay, ingredient=self.peanuts).delete()
+        self.satay.refresh_from_db()
+        self.assertEqual(self.satay.ingredient_ids, [self.rice.pk])
+
+    def test_exclusions_follow_preferences(self):
+        self.assertEqual(self.compatible(), ['Risotto', 'Salad', 'Satay'])
+
+        allergy = self.prefer(self.peanuts, 'allergy')
+        self.prefer(self.olives, 'like')
+        self.assertEqual(NutritionProfile.objects.exclusions(self.user.id), {self.peanuts.pk})
+        self.assertEqual(self.compatible(), ['Risotto', 'Salad'])
+
+        MealPreference.objects.filter(pk=allergy.pk).update(preference_type='dislike')
+        self.assertEqual(self.compatible(), ['Risotto', 'Salad', 'Satay'])
+
+        MealPreference.objects.bulk_create([
+            MealPreference(user=self.user, ingredient=self.rice, preference_type='restriction'),
+        ])
+        self.assertEqual(self.compatible(), ['Salad'])
+
+        MealPreference.objects.filter(preference_type='restriction').delete()
+        self.assertEqual(NutritionProfile.objects.exclusions(self.user.id), frozenset())
+
+    def test_composition_changes_reach_the_snapshot(self):
+        self.prefer(self.olives, 'hate')
+        self.assertEqual(self.compatible(), ['Risotto', 'Satay'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MealIngredient.objects.create(meal=self.risotto, ingredient=self.olives, quantity=10, unit='g')
+        # Only the changed meal is read again
+        with self.assertNumQueries(1):
+            self.assertEqual(meal_sets.incompatible_ids({self.olives.pk}), {self.risotto.pk, self.salad.pk})
+        self.assertEqual(self.compatible(), ['Satay'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dessert = Meal.objects.create(name='Dessert', description='', diet=self.satay.diet)
+            self.salad.delete()
+        self.assertEqual(meal_sets.compatible_ids({self.olives.pk}), {dessert.pk, self.satay.pk})
+
+    def test_missing_changes_reload_every_meal(self):
+        self.prefer(self.olives, 'hate')
+        self.assertEqual(self.compatible(), ['Risotto', 'Satay'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MealIngredient.objects.create(meal=self.risotto, ingredient=self.olives, quantity=10, unit='g')
+        meal_sets.cache.delete(meal_sets._changes_key(meal_sets.version_stamp.current()))
+
+        self.assertEqual(meal_sets.incompatible_ids({self.olives.pk}), {self.risotto.pk, self.salad.pk})
+
+    def test_compatible_meals_are_paged(self):
+        self.prefer(self.peanuts, 'allergy')
+
+        page = Meal.objects.compatible_with(self.user.id, 1, offset=1)
+        self.assertEqual(list(page.values_list('name', flat=True)), ['Salad'])
+        other_diet = Meal.objects.compatible_with(self.user.id, 10, diet_id=self.satay.diet_id + 1)
+        self.assertEqual(list(other_diet), [])
+
+    def test_filtering_is_a_set_operation(self):
+        self.prefer(self.peanuts, 'allergy')
+        meal_sets.incompatible_ids([])
+
+        # The user's exclusions, the meal ids in name order and one page of meals
+        with self.assertNumQueries(3):
+            self.compatible()
+
+    def test_deleting_a_user_does_not_recreate_the_profile(self):
+        self.prefer(self.peanuts, 'allergy')
+
+        self.user.delete()
+
+        self.assertFalse(NutritionProfile.objects.exists())
+
+    def test_endpoint(self):
+        self.prefer(self.peanuts, 'allergy')
+
+        response = self.client.get(reverse('meals:compatible_meals', args=[self.user.id]), {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([meal['name'] for meal in response.json()['meals']], ['Risotto'])
+        self.assertEqual(
+            self.client.get(reverse('meals:compatible_meals', args=[self.user.id]), {'diet': 'x'}).status_code, 400,
+        )
+
+    def test_endpoint_pages(self):
+        self.prefer(self.olives, 'hate')
+        url = reverse('meals:compatible_meals', args=[self.user.id])
+
+        pages = [self.client.get(url, {'limit': 1, 'offset': offset}).json()['meals'] for offset in (0, 1, 2)]
+        self.assertEqual([[meal['name'] for meal in page] for page in pages], [['Risotto'], ['Satay'], []])
+        self.assertEqual(self.client.get(url, {'offset': -1}).status_code, 400)
+
+
+
+def jpeg_bytes(width=800, height=600, orientation=None):
+    image = Image.new('RGB', (width, height), 'orange')
+    exif = image.getexif()
+    exif[ExifTags.Base.Make] = 'Camera'
+    if orientation:
+        exif[ExifTags.Base.Orientation] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+class MealPhotoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='photo-user')
+        goal = Goal.objects.create(user=user, goal_type='weight_loss')
+        diet = Diet.objects.create(
+            name='Cut', user=user, goal=goal, day_proteins_g=150, day_fats_g=60,
+            day_carbohydrates_g=200, day_calories_kcal=2000,
+        )
+        meal = Meal.objects.create(name='Salad', description='', diet=diet)
+        cls.record = MealRecord.objects.create(meal=meal, user=user, timestamp=datetime(2025, 3, 10, 12, tzinfo=dt_timezone.utc))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root, MEAL_PHOTO_WORKERS=0, MEAL_PHOTO_MAX_BYTES=1024 * 1024)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self, data, content_type='image/jpeg', record_id=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('meals:upload_meal_photo', args=[record_id or self.record.pk]), data, content_type=content_type,
+            )
+
+    def test_variants_are_oriented_and_stripped(self):
+        result = render_variants(jpeg_bytes(orientation=6), 320, 640, 80)
+
+        self.assertEqual((result['width'], result['height']), (600, 800))
+        for key, size in (('thumbnail', (240, 320)), ('webp', (480, 640))):
+            with Image.open(io.BytesIO(result[key])) as variant:
+                self.assertEqual(variant.size, size)
+                self.assertEqual(dict(variant.getexif()), {})
+
+    def test_upload_is_processed_after_commit(self):
+        response = self.upload(jpeg_bytes())
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.json()['created'])
+
+        photo = MealPhoto.objects.get()
+        self.assertEqual(photo.status, 'ready')
+        self.assertEqual((photo.width, photo.height), (800, 600))
+        self.assertFalse(photo.original)
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.meal_photo, photo)
+
+        body = self.client.get(reverse('meals:meal_photo', args=[photo.pk])).json()
+        self.assertTrue(body['thumbnail_url'].endswith(f'{photo.sha256}.jpg'))
+        self.assertTrue(body['webp_url'].endswith(f'{photo.sha256}.webp'))
+
+    def test_duplicate_uploads_share_a_photo(self):
+        data = jpeg_bytes()
+        self.upload(data)
+
+        response = self.client.post(
+            reverse('meals:upload_meal_photo', args=[self.record.pk]),
+            {'photo': SimpleUploadedFile('lunch.jpg', data, content_type='image/jpeg')},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['created'])
+        self.assertEqual(MealPhoto.objects.count(), 1)
+
+    def test_rejected_uploads(self):
+        self.assertEqual(self.upload(jpeg_bytes(), record_id=self.record.pk + 1).status_code, 404)
+        self.assertEqual(self.upload(b'%PDF-1.7', content_type='application/pdf').status_code, 415)
+        self.assertEqual(self.upload(b'0' * (1024 * 1024 + 1)).status_code, 413)
+        self.assertFalse(MealPhoto.objects.exists())
+
+    def test_undecodable_photo_fails(self):
+        response = self.upload(b'not a jpeg')
+        photo = MealPhoto.objects.get()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(photo.status, 'failed')
+        self.assertTrue(photo.error)
+        self.assertTrue(photo.original)
+
+        # Only pending photos are picked up, so a second run is a no-op.
+        process_photo(photo.pk)
+        self.assertEqual(MealPhoto.objects.get().status, 'failed')
+
+    def test_storage_errors_fail_the_photo(self):
+        with mock.patch.object(photo_pipeline, 'submit'):
+            self.upload(jpeg_bytes())
+        photo = MealPhoto.objects.get()
+        storage, save = photo.original.storage, photo.original.storage.save
+
+        def save_thumbnail_only(name, content, **kwargs):
+            if name.endswith('.webp'):
+                raise OSError('Disk full')
+            return save(name, content, **kwargs)
+
+        with mock.patch.object(storage, 'save', side_effect=save_thumbnail_only):
+            process_photo(photo.pk)
+
+        photo.refresh_from_db()
+        self.assertEqual((photo.status, photo.error), ('failed', 'Disk full'))
+        self.assertTrue(storage.exists(photo.original.name))
+        # The thumbnail stored before the error is removed again
+        self.assertFalse(photo.thumbnail)
+        self.assertFalse(storage.exists(f'meal_photos/thumbnails/{photo.sha256[:2]}/{photo.sha256}.jpg'))
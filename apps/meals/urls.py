@@ -4,6 +4,12 @@ from . import views
 app_name = 'meals'
 
 urlpatterns = [
-    # Add your meal-related URL patterns here
-    # Example: path('', views.meal_list, name='meal_list'),
+    path('api/categories/', views.category_tree_view, name='category_tree'),
+    path('api/categories/<int:category_id>/ingredients/', views.category_ingredients, name='category_ingredients'),
+    path('api/barcodes/<str:code>/', views.barcode_lookup, name='barcode_lookup'),
+    path('api/ingredients/search/', views.ingredient_search, name='ingredient_search'),
+    path('api/meals/compatible/<int:user_id>/', views.compatible_meals, name='compatible_meals'),
+    path('api/records/<int:record_id>/photo/', views.upload_meal_photo, name='upload_meal_photo'),
+    path('api/photos/<int:photo_id>/', views.meal_photo, name='meal_photo'),
+    path('api/intake/<int:user_id>/', views.daily_intake, name='daily_intake'),
 ]
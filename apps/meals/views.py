@@ -1,3 +1,220 @@
-from django.shortcuts import render
+from datetime import timedelta
 
-# Create your views here.
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from apps.responses import FastJsonResponse
+
+from .barcodes import barcode_resolver
+from .categories import category_tree
+from .models import DailyIntake, Ingredient, Meal, MealPhoto, MealRecord, NutritionProfile
+from .nutrition import NUTRIENT_FIELDS
+from .photos import CHUNK_SIZE, PHOTO_CONTENT_TYPES, PhotoTooLarge, store_upload
+from .search import search_ingredients
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def daily_intake(request, user_id):
+    """
+    Compare a user's daily intake with their active diet
+    
+    Query parameters: ``start`` and ``end``, ISO dates in the user's time
+    zone; defaults to the last 7 days up to today.
+    """
+    try:
+        end = parse_date(request.GET['end']) if 'end' in request.GET else None
+        start = parse_date(request.GET['start']) if 'start' in request.GET else None
+    except ValueError:
+        end = start = None
+    if ('end' in request.GET and end is None) or ('start' in request.GET and start is None):
+        return JsonResponse({'error': 'Invalid date, expected YYYY-MM-DD'}, status=400)
+    
+    if end is None:
+        tzinfo = NutritionProfile.objects.time_zones([user_id])[user_id]
+        end = timezone.now().astimezone(tzinfo).date()
+    start = start or end - timedelta(days=6)
+    
+    try:
+        comparison = DailyIntake.objects.compare_to_diet(user_id, start, end)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return FastJsonResponse(comparison)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def ingredient_search(request):
+    """
+    Autocomplete ingredient names
+    
+    Query parameters: ``q``, the text typed so far; optional ``category``,
+    a category id whose subcategories are searched too, and ``limit``, the
+    number of results (default 10).
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q is required'}, status=400)
+    
+    try:
+        limit = int(request.GET.get('limit', 10))
+        category = request.GET.get('category')
+        category_ids = category_tree.descendant_ids(int(category)) if category else None
+    except ValueError:
+        return JsonResponse({'error': 'limit and category must be integers'}, status=400)
+    if not 1 <= limit <= settings.INGREDIENT_SEARCH_MAX_LIMIT:
+        return JsonResponse(
+            {'error': f'limit must be between 1 and {settings.INGREDIENT_SEARCH_MAX_LIMIT}'}, status=400
+        )
+    
+    return FastJsonResponse({'query': query, 'results': search_ingredients(query, limit, category_ids)})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def category_tree_view(request):
+    """Return the whole category hierarchy as nested dictionaries"""
+    return FastJsonResponse({'categories': category_tree.as_tree()})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def category_ingredients(request, category_id):
+    """
+    List the ingredients of a category and all of its subcategories
+    
+    Query parameters: ``limit`` (default 100) and ``offset``.
+    """
+    node = category_tree.get(category_id)
+    if node is None:
+        return JsonResponse({'error': 'Category not found'}, status=404)
+    
+    try:
+        limit = int(request.GET.get('limit', 100))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return JsonResponse({'error': 'limit and offset must be integers'}, status=400)
+    if not 1 <= limit <= settings.CATEGORY_INGREDIENTS_MAX_LIMIT or offset < 0:
+        return JsonResponse(
+            {'error': f'limit must be between 1 and {settings.CATEGORY_INGREDIENTS_MAX_LIMIT}'}, status=400
+        )
+    
+    rows = (
+        Ingredient.objects.in_category(category_id)
+        .order_by('name', 'pk')
+        .values_list('pk', 'name', 'category_id')[offset:offset + limit]
+    )
+    return FastJsonResponse({
+        'category': {'id': node.id, 'name': node.name, 'depth': node.depth},
+        'ancestors': [{'id': ancestor.id, 'name': ancestor.name} for ancestor in category_tree.ancestors(node.id)],
+        'subcategories': category_tree.as_tree(node.id),
+        'ingredients': [
+            {'id': pk, 'name': name, 'category_id': ingredient_category_id}
+            for pk, name, ingredient_category_id in rows
+        ],
+    })
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def barcode_lookup(request, code):
+    """Resolve an EAN or UPC barcode to its ingredient"""
+    try:
+        ingredient_id = barcode_resolver.resolve(code)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if ingredient_id is None:
+        return JsonResponse({'error': 'Unknown barcode'}, status=404)
+    
+    row = Ingredient.objects.filter(pk=ingredient_id).values_list('name', 'category_id', *NUTRIENT_FIELDS).first()
+    if row is None:
+        return JsonResponse({'error': 'Unknown barcode'}, status=404)
+    name, category_id, *nutrients = row
+    return FastJsonResponse({
+        'code': code,
+        'ingredient': {
+            'id': ingredient_id,
+            'name': name,
+            'category_id': category_id,
+            'per_100g': dict(zip(NUTRIENT_FIELDS, nutrients)),
+        },
+    })
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def compatible_meals(request, user_id):
+    """
+    List the meals a user can eat given their allergies, restrictions and hates
+    
+    Query parameters: optional ``diet``, a diet id, ``limit`` (default 100)
+    and ``offset``.
+    """
+    try:
+        limit = int(request.GET.get('limit', 100))
+        offset = int(request.GET.get('offset', 0))
+        diet = request.GET.get('diet')
+        diet_id = int(diet) if diet else None
+    except ValueError:
+        return JsonResponse({'error': 'limit, offset and diet must be integers'}, status=400)
+    if not 1 <= limit <= settings.COMPATIBLE_MEALS_MAX_LIMIT:
+        return JsonResponse({'error': f'limit must be between 1 and {settings.COMPATIBLE_MEALS_MAX_LIMIT}'}, status=400)
+    if offset < 0:
+        return JsonResponse({'error': 'offset must not be negative'}, status=400)
+    
+    meals = Meal.objects.compatible_with(user_id, limit, diet_id=diet_id, offset=offset)
+    fields = ('id', 'name', 'diet_id', 'calories_kcal', 'proteins_g', 'fats_g', 'carbs_g')
+    return FastJsonResponse({
+        'user_id': user_id,
+        'meals': [dict(zip(fields, row)) for row in meals.values_list(*fields)],
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def upload_meal_photo(request, record_id):
+    """
+    Attach a photo to a meal record and queue its processing
+    
+    The body is either the raw image, sent with its image content type, or
+    a multipart form with a ``photo`` file. It is streamed to storage while
+    being hashed; a photo uploaded before is reused. Variants are rendered
+    in the background, poll ``meal_photo`` for their URLs.
+    """
+    if not MealRecord.objects.filter(pk=record_id).exists():
+        return JsonResponse({'error': 'Meal record not found'}, status=404)
+    
+    if request.content_type == 'multipart/form-data':
+        upload = request.FILES.get('photo')
+        if upload is None:
+            return JsonResponse({'error': 'photo file is required'}, status=400)
+        content_type, chunks = upload.content_type, upload.chunks(CHUNK_SIZE)
+    else:
+        content_type, chunks = request.content_type, iter(lambda: request.read(CHUNK_SIZE), b'')
+    if content_type not in PHOTO_CONTENT_TYPES:
+        return JsonResponse(
+            {'error': f'Unsupported content type, expected one of {", ".join(PHOTO_CONTENT_TYPES)}'}, status=415
+        )
+    
+    try:
+        photo, created = store_upload(chunks, content_type)
+    except PhotoTooLarge as e:
+        return JsonResponse({'error': str(e)}, status=413)
+    MealRecord.objects.filter(pk=record_id).update(meal_photo=photo)
+    
+    return JsonResponse({'created': created, 'photo': photo.to_dict()}, status=202 if photo.status == 'pending' else 200)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def meal_photo(request, photo_id):
+    """Return a meal photo's processing status, dimensions and variant URLs"""
+    photo = MealPhoto.objects.filter(pk=photo_id).first()
+    if photo is None:
+        return JsonResponse({'error': 'Photo not found'}, status=404)
+    return JsonResponse(photo.to_dict())